@@ -0,0 +1,30 @@
+from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def create_registry_sequence(sender: AppConfig, using: str, **kwargs) -> None:
+    from app.models.register import RegistryState
+
+    RegistryState.create_sequence(connections[using])
+
+
+def prefetch_secrets(sender, **kwargs) -> None:
+    """
+    Warms the service secrets on the first request of the process, not at
+    import time: management commands never start it, and the server runs
+    it against a migrated database.
+    """
+    from app.services.secrets import start_secrets_prefetch
+
+    request_started.disconnect(prefetch_secrets)
+    start_secrets_prefetch()
+
+
+class FlumeConfig(AppConfig):
+    name = "app"
+
+    def ready(self) -> None:
+        post_migrate.connect(create_registry_sequence, sender=self)
+        request_started.connect(prefetch_secrets)
@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Iterator
+
+from django.db import connection
+from django.db.transaction import atomic, set_rollback
+
+
+def best_of(fn: Callable[[], object], rounds: int = 3) -> float:
+    """
+    Runs fn `rounds` times and returns the best wall time in seconds.
+    """
+    best = float("inf")
+    for _ in range(rounds):
+        start = perf_counter()
+        fn()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+@contextmanager
+def scratch() -> Iterator[None]:
+    """
+    Runs the block in a transaction that is always rolled back, so benchmarks
+    never leave rows behind.
+    """
+    with atomic():
+        yield
+        set_rollback(True)
+
+
+@contextmanager
+def throwaway_database() -> Iterator[None]:
+    """
+    Runs the block on a freshly migrated test database, dropped afterwards,
+    for benchmarks that must commit (e.g. from several threads). SQLite
+    gets a file database, so the threads share it.
+    """
+    with TemporaryDirectory() as directory:
+        if connection.vendor == "sqlite":
+            test = connection.settings_dict.setdefault("TEST", {})
+            test["NAME"] = path.join(directory, "bench.sqlite3")
+        name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(name, verbosity=0)
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from time import perf_counter
+from typing import Dict
+from uuid import uuid4
+
+from django.utils import timezone
+
+from app.benchmarks import scratch
+from app.models.events import EventDefinition, EventRecord
+from app.models.services import Service
+from app.services.eventstore import EventStore
+
+BATCH = 1000
+
+
+def run(size: int = 100_000) -> Dict[str, float]:
+    """
+    Deletes `size` expired EventRecord rows (plus as many live ones kept)
+    with one DELETE, then with EventStore.expire batches of 1000. The
+    longest statement is how long a writer may wait behind compaction.
+    Everything runs in a rolled back transaction.
+    """
+    results: Dict[str, float] = {}
+    with scratch():
+        publisher = Service.objects.create(
+            name=f"bench-{uuid4().hex[:8]}", bootstrap_secret_ref="bench"
+        )
+        definition = EventDefinition.objects.create(
+            publisher=publisher,
+            event_key="bench.compaction",
+            major=1,
+            payload_schema={},
+            retention={"policy": "days", "value": 7},
+            version_hash="bench",
+        )
+        payload = {"order_id": "ord_00000000", "country": "IT", "amount": 12.5}
+        EventRecord.objects.bulk_create(
+            (EventRecord(event=definition, payload=payload) for _ in range(2 * size)),
+            batch_size=5000,
+        )
+        ids = EventRecord.objects.filter(event=definition).order_by("id")
+        old = ids.values_list("id", flat=True)[size - 1]
+        now = timezone.now()
+        ids.filter(id__lte=old).update(created_at=now - timedelta(days=30))
+        before = now - definition.retention_period
+
+        with scratch():
+            start = perf_counter()
+            EventRecord.objects.filter(event=definition, created_at__lt=before).delete()
+            results["one DELETE ms"] = (perf_counter() - start) * 1e3
+
+        store = EventStore()
+        deleted = reclaimed = 0
+        longest = 0.0
+        start = perf_counter()
+        while True:
+            batch_start = perf_counter()
+            events, size_bytes = store.expire(definition, before, BATCH)
+            longest = max(longest, perf_counter() - batch_start)
+            deleted += events
+            reclaimed += size_bytes
+            if events < BATCH:
+                break
+        elapsed = perf_counter() - start
+        assert deleted == size, "compaction deleted the wrong rows"
+        assert EventRecord.objects.filter(event=definition).count() == size
+        results["batched rows/sec"] = deleted / elapsed
+        results["longest batch ms"] = longest * 1e3
+        results["payload KB reclaimed"] = reclaimed / 1024
+    return results
@@ -0,0 +1,132 @@
+from asyncio import IncompleteReadError, StreamReader, StreamWriter, run as run_loop
+from asyncio import sleep, start_server
+from random import Random
+from hashlib import sha256
+from hmac import compare_digest, new
+from time import perf_counter
+from typing import Dict, List, Tuple
+from uuid import uuid4
+
+from app.models.events import Subscription
+from app.models.services import Service
+from app.services.delivery import Delivery, WebhookDispatcher
+from app.services.signer import Signer
+
+TOKEN = b"bench-token"
+ORIGINS = 4
+SUBSCRIPTIONS = 200
+
+
+class StaticSigner(Signer):
+    """
+    Signs with a fixed token instead of the secret store.
+    """
+
+    def has_token(self, service: Service) -> bool:
+        return True
+
+    def get_active_kid_and_token(self, service: Service) -> Tuple[str, bytes]:
+        return "v1", TOKEN
+
+
+class StubWebhook:
+    """
+    Minimal HTTP/1.1 keep-alive server answering 204 after `delay` seconds
+    (random up to 2 * delay with `jitter`) and checking the signature of
+    every request. Answers 500 to a `fail_rate` share of the requests and
+    keeps the (path, body) of the others in `accepted`.
+    """
+
+    def __init__(self, delay: float, jitter: bool = False, fail_rate: float = 0.0):
+        self.delay = delay
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.rng = Random(42)
+        self.received = 0
+        self.bad_signatures = 0
+        self.accepted: List[Tuple[str, bytes]] = []
+
+    def _verify(self, head: List[bytes], body: bytes) -> bool:
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        path = head[0].split()[1].decode()
+        key = new(TOKEN, ("sub:" + path.rsplit("/", 1)[1]).encode(), sha256).digest()
+        msg = f"POST\n{path}\n{headers['x-timestamp']}\n{headers['x-nonce']}\n"
+        sig = new(key, msg.encode() + body, sha256).hexdigest()
+        return compare_digest(f"sha256={sig}", headers["x-signature"])
+
+    async def handle(self, reader: StreamReader, writer: StreamWriter) -> None:
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).split(b"\r\n")[:-2]
+                length = 0
+                for line in head:
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                body = await reader.readexactly(length) if length else b""
+                self.received += 1
+                self.bad_signatures += not self._verify(head, body)
+                if self.delay:
+                    jitter = self.rng.uniform(0, 2) if self.jitter else 1
+                    await sleep(self.delay * jitter)
+                if self.rng.random() < self.fail_rate:
+                    writer.write(b"HTTP/1.1 500 Boom\r\nContent-Length: 0\r\n\r\n")
+                else:
+                    self.accepted.append((head[0].split()[1].decode(), body))
+                    writer.write(
+                        b"HTTP/1.1 204 No Content\r\nContent-Length: 0\r\n\r\n"
+                    )
+                await writer.drain()
+        except (IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _deliver(size: int, delay: float) -> Dict[str, float]:
+    stub = StubWebhook(delay)
+    servers = [await start_server(stub.handle, "127.0.0.1", 0) for _ in range(ORIGINS)]
+    ports = [s.sockets[0].getsockname()[1] for s in servers]
+    subscriber = Service(name="bench", bootstrap_secret_ref="bench")
+    subscriptions = []
+    for i in range(SUBSCRIPTIONS):
+        subscription = Subscription(id=uuid4(), subscriber=subscriber)
+        port = ports[i % ORIGINS]
+        subscription.webhook_url = f"http://127.0.0.1:{port}/hooks/{subscription.id}"
+        subscriptions.append(subscription)
+    deliveries = [
+        Delivery(subscriptions[i % SUBSCRIPTIONS], i, None, b'{"offset":%d}' % i)
+        for i in range(size)
+    ]
+
+    async with WebhookDispatcher(StaticSigner(), 256, 8, 10.0) as dispatcher:
+        start = perf_counter()
+        results = await dispatcher.deliver_many(deliveries)
+        elapsed = perf_counter() - start
+    for server in servers:
+        server.close()
+        await server.wait_closed()
+
+    latencies = sorted(r.latency for r in results)
+    return {
+        "deliveries/sec": size / elapsed,
+        "p50 ms": latencies[len(latencies) // 2] * 1000,
+        "p99 ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "errors": sum(not r.ok for r in results),
+        "bad signatures": stub.bad_signatures,
+    }
+
+
+def run(size: int = 5000) -> Dict[str, float]:
+    """
+    Delivers `size` signed webhooks to 200 subscriptions spread over 4 local
+    stub origins (8 connections each, 256 in flight), with an instant
+    endpoint and with one that takes 50 ms to answer.
+    """
+    results: Dict[str, float] = {"deliveries": size}
+    for label, delay in (("instant", 0.0), ("50ms", 0.05)):
+        for metric, value in run_loop(_deliver(size, delay)).items():
+            results[f"{label} {metric}"] = value
+    return results
@@ -0,0 +1,52 @@
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict
+
+from orjson import dumps, loads
+
+from app.services.eventlog import EventLog
+
+BATCH = 500
+LOOKUPS = 2000
+
+
+def run(size: int = 1_000_000) -> Dict[str, float]:
+    """
+    Appends `size` ~200 byte events in batches of 500 to an EventLog in a
+    temporary directory (16 MB segments), then replays it whole, parsing
+    every payload, and reads single events at random offsets through the
+    sparse index.
+    """
+    rng = Random(42)
+    payloads = [
+        dumps({"order_id": f"ord_{i:08x}", "country": "IT", "amount": i % 997, "n": i})
+        + b" " * 120
+        for i in range(BATCH)
+    ]
+    results: Dict[str, float] = {}
+    with TemporaryDirectory() as path:
+        log = EventLog(path, segment_bytes=16 * 1024 * 1024, index_bytes=4096)
+        start = perf_counter()
+        for first in range(0, size, BATCH):
+            count = min(BATCH, size - first)
+            log.append([(f"k{rng.randrange(100)}", p) for p in payloads[:count]])
+        results["appended events/sec"] = size / (perf_counter() - start)
+        stats = log.stats()
+        results["segments"] = stats["segments"]
+        results["MB on disk"] = stats["bytes"] / 1024 / 1024
+
+        start = perf_counter()
+        replayed = 0
+        for event in log.read(1):
+            replayed += loads(event.payload)["n"] >= 0
+        assert replayed == size, "replay lost events"
+        results["replayed events/sec"] = size / (perf_counter() - start)
+
+        offsets = [rng.randint(1, size) for _ in range(LOOKUPS)]
+        start = perf_counter()
+        for offset in offsets:
+            event = next(log.read(offset, 1))
+            assert event.offset == offset, "seek landed on the wrong event"
+        results["us/random read"] = (perf_counter() - start) / LOOKUPS * 1e6
+    return results
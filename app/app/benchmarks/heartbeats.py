@@ -0,0 +1,63 @@
+from typing import Dict
+
+from django.utils import timezone
+
+from app.benchmarks import best_of, scratch
+from app.models.services import Service, ServiceInstance
+from app.services.leases import LeaseService, LeaseTable
+
+
+def run(size: int = 2000) -> Dict[str, float]:
+    """
+    Compares one UPDATE per heartbeat with the batched heartbeat path and the
+    in-memory lease table (absorbed beats, then the periodic flush).
+    """
+    with scratch():
+        service = Service.objects.create(
+            name="bench-heartbeats", bootstrap_secret_ref="bench"
+        )
+        ServiceInstance.objects.bulk_create(
+            ServiceInstance(
+                service=service,
+                node_id=f"node-{i % 50}",
+                task_slot=i,
+                base_url=f"http://10.0.0.1:{i}",
+                health_url=f"http://10.0.0.1:{i}/health",
+            )
+            for i in range(size)
+        )
+        ids = list(
+            ServiceInstance.objects.filter(service=service).values_list(
+                "instance_id", flat=True
+            )
+        )
+
+        def one_at_a_time():
+            now = timezone.now()
+            for instance_id in ids:
+                ServiceInstance.objects.filter(instance_id=instance_id).update(
+                    last_heartbeat_at=now, consecutive_miss=0
+                )
+
+        def batched():
+            LeaseService.beat_many(ids)
+
+        table = LeaseTable(flush_interval=2.0, background=False)
+        table.beat_many(ids)  # seed
+
+        def write_behind():
+            table.beat_many(ids)
+
+        single = best_of(one_at_a_time)
+        batch = best_of(batched)
+        absorbed = best_of(write_behind)
+        flush = best_of(table.flush, rounds=1)
+
+    return {
+        "instances": size,
+        "one_at_a_time heartbeats/sec": size / single,
+        "batched heartbeats/sec": size / batch,
+        "write_behind heartbeats/sec": size / absorbed,
+        "write_behind flush ms": flush * 1000,
+        "speedup": single / batch,
+    }
@@ -0,0 +1,107 @@
+from os import urandom
+from time import perf_counter, time
+from typing import Dict, List, Tuple
+from uuid import UUID, uuid4
+
+from django.db import IntegrityError
+from django.db.transaction import atomic
+
+from app.benchmarks import scratch
+from app.models.services import NonceSeen, Service, ServiceInstance
+from app.services.nonces import DbNonceStore, NonceStore
+
+WINDOW = 30.0
+BUCKET = 5.0
+RATE = 1000  # simulated requests per second
+REPLAY_EVERY = 10  # one request in 10 replays an earlier nonce
+
+
+def _requests(size: int) -> List[Tuple[str, float, float]]:
+    """
+    (nonce, X-Timestamp, arrival) of `size` requests at RATE per second,
+    sent up to 1 s before arrival; every REPLAY_EVERY-th replays the
+    request 5 s earlier, inside the window.
+    """
+    start = time()
+    requests: List[Tuple[str, float, float]] = []
+    for i in range(size):
+        now = start + i / RATE
+        if i % REPLAY_EVERY == REPLAY_EVERY - 1 and i >= 5 * RATE:
+            nonce, timestamp, _ = requests[i - 5 * RATE]
+        else:
+            nonce, timestamp = urandom(16).hex(), now - (i % 7) / 7
+        requests.append((nonce, timestamp, now))
+    return requests
+
+
+def _verify(store: NonceStore, scope: UUID | str, requests) -> Tuple[float, int]:
+    rejected = 0
+    start = perf_counter()
+    for nonce, timestamp, now in requests:
+        if not store.claim(scope, nonce, timestamp, now):
+            rejected += 1
+    return len(requests) / (perf_counter() - start), rejected
+
+
+def run(size: int = 200_000) -> Dict[str, float]:
+    """
+    Verifications/sec of the nonces of `size` requests at 1000/s of
+    simulated time (one in ten a replay) with a 30 s window, in memory
+    (exact and Bloom filtered) and as bucketed NonceSeen rows, against one
+    NonceSeen row per nonce kept forever. The stores hold the window only,
+    and catch every replay. The database runs take size / 4 requests, in a
+    rolled back transaction.
+    """
+    requests = _requests(size)
+    replays = sum(
+        1 for i in range(size) if i % REPLAY_EVERY == REPLAY_EVERY - 1 and i >= 5 * RATE
+    )
+    results: Dict[str, float] = {}
+
+    store = NonceStore(WINDOW, BUCKET)
+    rate, rejected = _verify(store, "bench", requests)
+    assert rejected == replays, "memory store missed replays"
+    results["memory verifications/sec"] = rate
+    results["memory nonces held"] = store.stats()["nonces"]
+
+    bloom = NonceStore(WINDOW, BUCKET, bloom_bits=8 * 64 * 1024)
+    rate, rejected = _verify(bloom, "bench", requests)
+    assert rejected >= replays, "bloom store missed replays"
+    results["bloom verifications/sec"] = rate
+    results["bloom false replays %"] = 100 * (rejected - replays) / size
+
+    db_requests = requests[: size // 4]
+    db_replays = sum(
+        1
+        for i in range(len(db_requests))
+        if i % REPLAY_EVERY == REPLAY_EVERY - 1 and i >= 5 * RATE
+    )
+    with scratch():
+        service = Service.objects.create(
+            name=f"bench-{uuid4().hex[:8]}", bootstrap_secret_ref="bench"
+        )
+        instance = ServiceInstance.objects.create(
+            service=service, base_url="http://127.0.0.1", health_url="/health"
+        )
+        with scratch():
+            rejected = 0
+            start = perf_counter()
+            for nonce, _, _ in db_requests:
+                try:
+                    with atomic():
+                        NonceSeen.objects.create(
+                            service_instance=instance, nonce=nonce, bucket=0
+                        )
+                except IntegrityError:
+                    rejected += 1
+            elapsed = perf_counter() - start
+            assert rejected == db_replays, "NonceSeen rows missed replays"
+            results["rows forever verifications/sec"] = len(db_requests) / elapsed
+            results["rows forever rows left"] = NonceSeen.objects.count()
+
+        shared = DbNonceStore(WINDOW, BUCKET)
+        rate, rejected = _verify(shared, instance.instance_id, db_requests)
+        assert rejected == db_replays, "db store missed replays"
+        results["db store verifications/sec"] = rate
+        results["db store rows left"] = NonceSeen.objects.count()
+    return results
@@ -0,0 +1,62 @@
+import inspect
+from time import perf_counter
+from typing import Any, Dict, Sequence
+
+from django.http import HttpRequest
+from django.test import RequestFactory
+
+from app.middlewares.default.pipeline import RoutePipe, compile_pipeline, pipeline
+
+
+def _pass(request: HttpRequest, data: Any, next) -> Any:
+    return next()
+
+
+def _endpoint(request: HttpRequest, data: Any) -> Any:
+    return data
+
+
+def _legacy(
+    handlers: Sequence[RoutePipe], index: int, request: HttpRequest, endpoint, data
+) -> Any:
+    # the previous execute_pipeline: signature() per request, one closure
+    # and one recursive call per hop
+    current = handlers[index] if index < len(handlers) else None
+
+    def next_func():
+        return _legacy(handlers, index + 1, request, endpoint, data)
+
+    if current is None:
+        if len(inspect.signature(endpoint).parameters) > 1:
+            return endpoint(request, data)
+        return endpoint(request)
+    return current(request, data, next_func)
+
+
+def run(size: int = 200_000) -> Dict[str, float]:
+    """
+    Per-request overhead in µs of a route pipeline with 0, 3 and 10
+    pass-through pipes before a trivial endpoint: the previous per-request
+    resolution, pipeline() (compiled on first use, looked up per call) and
+    compile_pipeline() at import time.
+    """
+    request = RequestFactory().get("/")
+    data = {"since": 0}
+    results: Dict[str, float] = {}
+    for pipes in (0, 3, 10):
+        handlers = (_pass,) * pipes
+        compiled = compile_pipeline(*handlers, endpoint=_endpoint)
+        runs = {
+            "previous": lambda: _legacy(handlers, 0, request, _endpoint, data),
+            "pipeline()": lambda: pipeline(
+                request, *handlers, endpoint=_endpoint, data=data
+            ),
+            "compiled": lambda: compiled(request, data),
+        }
+        for label, call in runs.items():
+            assert call() is data, f"{label} lost the data"
+            start = perf_counter()
+            for _ in range(size):
+                call()
+            results[f"{pipes} pipes {label} us"] = (perf_counter() - start) / size * 1e6
+    return results
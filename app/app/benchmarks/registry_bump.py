@@ -0,0 +1,84 @@
+from threading import Thread
+from time import perf_counter
+from typing import Callable, Dict, Tuple
+
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.db.transaction import atomic
+
+from app.benchmarks import throwaway_database
+from app.models.register import RegistryState
+
+# bumps issued by one mutating request (e.g. a batch touching 5 objects)
+BUMPS_PER_TRANSACTION = 5
+
+
+def _locked_bumps() -> None:
+    # the previous behaviour: every bump locks, updates and re-reads the row
+    for _ in range(BUMPS_PER_TRANSACTION):
+        obj, _ = RegistryState.objects.select_for_update().get_or_create(pkid=1)
+        obj.registry_version = F("registry_version") + 1
+        obj.save(update_fields=["registry_version"])
+        obj.refresh_from_db(fields=["registry_version"])
+
+
+def _coalesced_bumps() -> None:
+    for _ in range(BUMPS_PER_TRANSACTION):
+        RegistryState.bump()
+
+
+def _contend(
+    writers: int, transactions: int, body: Callable[[], None]
+) -> Tuple[float, int]:
+    """
+    Runs `transactions` transactions on each of `writers` threads and
+    returns the mutations (bumps) per second and the transactions retried
+    because the database was locked (SQLite).
+    """
+    retries = [0] * writers
+
+    def work(writer: int):
+        try:
+            done = 0
+            while done < transactions:
+                try:
+                    with atomic():
+                        body()
+                    done += 1
+                except OperationalError:
+                    retries[writer] += 1
+        finally:
+            connection.close()
+
+    threads = [Thread(target=work, args=(i,)) for i in range(writers)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+    return writers * transactions * BUMPS_PER_TRANSACTION / elapsed, sum(retries)
+
+
+def run(size: int = 200) -> Dict[str, float]:
+    """
+    Mutations/sec with N concurrent writers, before (one row lock per bump)
+    and after (one version per transaction, from a sequence on PostgreSQL
+    when FLUME_REGISTRY_SEQUENCE is set). The writers commit, so they run
+    on a throwaway test database.
+    """
+    results: Dict[str, float] = {}
+    with throwaway_database():
+        RegistryState.objects.get_or_create(pkid=1)
+        for writers in (1, 4, 8):
+            transactions = max(1, size // writers)
+            for label, body in (("before", _locked_bumps), ("after", _coalesced_bumps)):
+                rate, retries = _contend(writers, transactions, body)
+                results[f"{writers} writers {label} mutations/sec"] = rate
+                results[f"{writers} writers {label} retries"] = retries
+        # BUMPS_PER_TRANSACTION versions per locked transaction, one coalesced
+        expected = sum(
+            w * max(1, size // w) * (BUMPS_PER_TRANSACTION + 1) for w in (1, 4, 8)
+        )
+        assert RegistryState.current() == expected, "versions lost or skipped"
+    return results
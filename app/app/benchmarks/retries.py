@@ -0,0 +1,35 @@
+from random import Random
+from time import perf_counter
+from typing import Dict
+
+from app.services.retries import DelayHeap, backoff
+
+DUE_PER_ROUND = 1000
+
+
+def run(size: int = 1_000_000) -> Dict[str, float]:
+    """
+    Cost of the retry DelayHeap with 1k, then `size` pending retries:
+    pushes/sec and microseconds per due item (pop plus the push of its
+    next attempt), which grows with log(pending), not with pending.
+    """
+    rng = Random(42)
+    results: Dict[str, float] = {}
+    for pending in (1000, size):
+        heap = DelayHeap()
+        start = perf_counter()
+        for item in range(pending):
+            heap.push(backoff(rng.randint(1, 12), 1.0, 3600.0, rng), item)
+        results[f"{pending} pending pushes/sec"] = pending / (perf_counter() - start)
+
+        now, popped = 0.0, 0
+        start = perf_counter()
+        while popped < 50 * DUE_PER_ROUND:
+            now = heap.next_due() or now
+            for item in heap.pop_due(now + 1.0, DUE_PER_ROUND):
+                heap.push(now + backoff(rng.randint(1, 12), 1.0, 3600.0, rng), item)
+                popped += 1
+        results[f"{pending} pending us/due item"] = (
+            (perf_counter() - start) / popped * 1e6
+        )
+    return results
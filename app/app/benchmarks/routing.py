@@ -0,0 +1,66 @@
+from random import Random
+from typing import Any, Dict, List, Tuple
+from uuid import UUID, uuid4
+
+from app.benchmarks import best_of
+from app.services.routing import SubscriptionIndex, filters_match
+
+COUNTRIES = [f"C{i}" for i in range(30)]
+TIERS = ["free", "basic", "pro", "enterprise", "internal"]
+CHANNELS = [f"ch{i}" for i in range(12)]
+
+
+def _filters(rng: Random) -> Dict[str, Any]:
+    roll = rng.random()
+    if roll < 0.05:
+        return {}
+    filters: Dict[str, Any] = {"country": rng.sample(COUNTRIES, rng.randint(1, 3))}
+    if roll < 0.6:
+        filters["tier"] = rng.choice(TIERS)
+    if roll < 0.3:
+        filters["channel"] = rng.sample(CHANNELS, 2)
+    return filters
+
+
+def _payload(rng: Random) -> Dict[str, Any]:
+    return {
+        "country": rng.choice(COUNTRIES),
+        "tier": rng.choice(TIERS),
+        "channel": rng.choice(CHANNELS),
+        "amount": rng.randint(1, 1000),
+    }
+
+
+def run(size: int = 10000) -> Dict[str, float]:
+    """
+    Routes payloads against `size` subscriptions of one event: filters
+    evaluated one by one versus the inverted index.
+    """
+    rng = Random(42)
+    subscriptions: List[Tuple[UUID, Dict[str, Any]]] = [
+        (uuid4(), _filters(rng)) for _ in range(size)
+    ]
+    payloads = [_payload(rng) for _ in range(200)]
+
+    index = SubscriptionIndex()
+
+    def add_all() -> None:
+        for subscription_id, filters in subscriptions:
+            index.add(subscription_id, filters)
+
+    build = best_of(add_all, rounds=1)
+    for payload in payloads:
+        expected = {s for s, f in subscriptions if filters_match(f, payload)}
+        assert index.match(payload) == expected
+
+    scan = best_of(
+        lambda: [[s for s, f in subscriptions if filters_match(f, p)] for p in payloads]
+    )
+    indexed = best_of(lambda: [index.match(p) for p in payloads])
+    return {
+        "subscriptions": size,
+        "index build ms": build * 1000,
+        "scan events/sec": len(payloads) / scan,
+        "index events/sec": len(payloads) / indexed,
+        "speedup": scan / indexed,
+    }
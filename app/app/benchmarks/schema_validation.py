@@ -0,0 +1,89 @@
+from random import Random
+from typing import Any, Dict
+
+from jsonschema import ValidationError, validate
+
+from app.benchmarks import best_of
+from app.services.validators import ValidatorCache
+
+SCHEMA: Dict[str, Any] = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "required": ["order_id", "country", "amount", "items"],
+    "properties": {
+        "order_id": {"type": "string", "pattern": "^ord_[0-9a-f]{8}$"},
+        "country": {"type": "string", "minLength": 2, "maxLength": 2},
+        "amount": {"type": "number", "minimum": 0},
+        "tier": {"enum": ["free", "basic", "pro", "enterprise"]},
+        "items": {
+            "type": "array",
+            "maxItems": 20,
+            "items": {
+                "type": "object",
+                "required": ["sku", "qty"],
+                "properties": {
+                    "sku": {"type": "string"},
+                    "qty": {"type": "integer", "minimum": 1},
+                },
+            },
+        },
+    },
+}
+
+
+def _payload(rng: Random) -> Dict[str, Any]:
+    payload = {
+        "order_id": f"ord_{rng.getrandbits(32):08x}",
+        "country": rng.choice(["IT", "DE", "FR", "ES"]),
+        "amount": rng.randint(1, 10000) / 100,
+        "tier": rng.choice(["free", "basic", "pro", "enterprise"]),
+        "items": [
+            {"sku": f"sku{rng.randint(1, 99)}", "qty": rng.randint(1, 5)}
+            for _ in range(rng.randint(1, 5))
+        ],
+    }
+    if rng.random() < 0.1:
+        payload["amount"] = -1  # invalid
+    return payload
+
+
+def _interpreted(payload: Dict[str, Any]) -> str | None:
+    # the previous behaviour: validator resolved and schema checked per call
+    try:
+        validate(payload, SCHEMA)
+    except ValidationError as exc:
+        return exc.message
+    return None
+
+
+def run(size: int = 5000) -> Dict[str, float]:
+    """
+    Payloads/sec validated with jsonschema.validate() per call versus a
+    validator prepared once and served from the LRU, plus the hit/miss and
+    eviction counters of a cache smaller than the schema versions in use.
+    """
+    rng = Random(42)
+    payloads = [_payload(rng) for _ in range(size)]
+
+    cache = ValidatorCache(size=16)
+    for payload in payloads:
+        assert cache.validate("v1", SCHEMA, payload) == _interpreted(payload)
+
+    interpreted = best_of(lambda: [_interpreted(p) for p in payloads], rounds=1)
+    compiled = best_of(lambda: [cache.validate("v1", SCHEMA, p) for p in payloads])
+
+    # 32 schema versions round-robin over 16 slots: every lookup misses
+    churn = ValidatorCache(size=16)
+    for i in range(size):
+        churn.get(f"v{i % 32}", SCHEMA)
+    stats = churn.stats()
+    return {
+        "payloads": size,
+        "interpreted payloads/sec": size / interpreted,
+        "compiled payloads/sec": size / compiled,
+        "speedup": interpreted / compiled,
+        "hits": cache.stats()["hits"],
+        "misses": cache.stats()["misses"],
+        "churn misses": stats["misses"],
+        "churn evictions": stats["evictions"],
+    }
@@ -0,0 +1,124 @@
+from threading import Thread
+from time import perf_counter, sleep
+from typing import Dict, List
+
+from app.services.secrets import SecretsProvider, SecretsService
+
+THREADS = 16
+FETCH_SEC = 0.05  # latency of the stub secret store
+
+
+REFS = 64  # services warmed by the prefetch phase
+
+
+class StubStore(SecretsProvider):
+    """
+    Local stand-in for the secret store: answers after FETCH_SEC, or fails
+    while `down`.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.down = False
+
+    def fetch(self, name: str) -> Dict:
+        self.calls += 1
+        sleep(FETCH_SEC)
+        if self.down:
+            raise ConnectionError("secret store down")
+        return {"kid": "v1", "token": "bench"}
+
+
+def _hammer(secret: SecretsService, seconds: float) -> List[float]:
+    """
+    Calls get() from THREADS threads for `seconds`, once per ms per thread
+    like requests would (spinning threads starve the refresher of the GIL),
+    and returns every latency.
+    """
+    latencies: List[float] = []
+    stop = perf_counter() + seconds
+
+    def work() -> None:
+        while perf_counter() < stop:
+            start = perf_counter()
+            secret.get()
+            latencies.append(perf_counter() - start)
+            sleep(0.001)
+
+    threads = [Thread(target=work) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def run(size: int = 4) -> Dict[str, float]:
+    """
+    16 threads read one secret with a 1 s TTL for `size` seconds against a
+    stub store answering in 50 ms, then for 2 s while the store is down.
+    Single-flight sends one fetch for 16 cold callers, refresh-ahead keeps
+    the stub out of the request path afterwards (max get latency far below
+    50 ms), and stale values are served while the store is down. Then 64
+    services are warmed by prefetch() instead of one cold fetch each.
+    """
+    store = StubStore()
+    secret = SecretsService("bench", ttl_s=1, fetch=store.fetch, retry_s=0.5)
+    cold = [Thread(target=secret.get) for _ in range(THREADS)]
+    for thread in cold:
+        thread.start()
+    for thread in cold:
+        thread.join()
+    results: Dict[str, float] = {"cold: store calls for 16 callers": store.calls}
+
+    latencies = sorted(_hammer(secret, size))
+    stats = secret.stats()
+    results |= {
+        "store calls": store.calls,
+        "refreshes ahead": stats["refreshes"],
+        "blocking misses": stats["misses"],
+        "p99 get us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "max get ms": latencies[-1] * 1e3,
+    }
+
+    store.down = True
+    _hammer(secret, 2.0)
+    stats = secret.stats()
+    results["store down: errors"] = stats["errors"]
+    results["store down: stale served"] = stats["stale"]
+
+    results |= _prefetch(store)
+    return results
+
+
+def _prefetch(store: StubStore) -> Dict[str, float]:
+    """
+    First get() of REFS service secrets, one cold fetch after the other as
+    the first pushes would do, against a prefetch() loading them in parallel.
+    """
+    store.down = False
+    cold = [f"bench-cold-{i}" for i in range(REFS)]
+    warm = [f"bench-warm-{i}" for i in range(REFS)]
+    try:
+        start = perf_counter()
+        for ref in cold:
+            SecretsService.CACHES[ref] = SecretsService(ref, fetch=store.fetch)
+            SecretsService.CACHES[ref].get()
+        sequential = perf_counter() - start
+
+        start = perf_counter()
+        loaded, failed = SecretsService.prefetch(warm, provider=store)
+        prefetched = perf_counter() - start
+        assert loaded == REFS and not failed, "prefetch missed secrets"
+        misses = 0
+        for ref in warm:
+            SecretsService.CACHES[ref].get()
+            misses += SecretsService.CACHES[ref].misses
+        assert misses == 0, "prefetched secrets fetched again"
+    finally:
+        for ref in cold + warm:
+            SecretsService.CACHES.pop(ref, None)
+    return {
+        f"{REFS} secrets sequential ms": sequential * 1e3,
+        f"{REFS} secrets prefetched ms": prefetched * 1e3,
+    }
@@ -0,0 +1,55 @@
+from base64 import b64decode, b64encode
+from hashlib import sha256
+from hmac import new
+from os import urandom
+from time import perf_counter, time
+from typing import Dict
+from uuid import uuid4
+
+from app.models.services import Service, ServiceInstance
+from app.services.secrets import SecretsService
+from app.services.signer import KEYS, Signer
+
+INSTANCES = 1000
+BODY = b'{"event_key":"order.created","payload":{"order_id":"ord_0000"}}' * 16
+
+
+def _uncached(signer: Signer, instance: ServiceInstance, body: bytes) -> str:
+    # the previous Signer: decode the token, derive the key, key a new HMAC
+    data = SecretsService._get_cache_for_service(instance.service).get()
+    token = data["token"]
+    token_bytes = b64decode(token.split(":", 1)[1])
+    key = signer.derive_key(token_bytes, "push:" + str(instance.instance_id))
+    msg = f"POST\n/hook\n{int(time())}\n{urandom(16).hex()}\n".encode() + body
+    return new(key, msg, sha256).hexdigest()
+
+
+def run(size: int = 200_000) -> Dict[str, float]:
+    """
+    Signatures/sec of `size` 1 KB pushes to 1000 instances of one service,
+    with the previous per-call key derivation and with the KEYS cache.
+    The secret is preloaded, so neither side calls the secret store.
+    """
+    service = Service(name="bench", bootstrap_secret_ref=f"bench-{uuid4().hex[:8]}")
+    secret = SecretsService(service.bootstrap_secret_ref)
+    secret._val = {"kid": "v1", "token": "base64:" + b64encode(urandom(32)).decode()}
+    secret._exp = float("inf")
+    SecretsService.CACHES[service.bootstrap_secret_ref] = secret
+    instances = [ServiceInstance(service=service) for _ in range(INSTANCES)]
+    signer = Signer()
+    results: Dict[str, float] = {}
+    try:
+        start = perf_counter()
+        for i in range(size):
+            _uncached(signer, instances[i % INSTANCES], BODY)
+        results["uncached signatures/sec"] = size / (perf_counter() - start)
+
+        start = perf_counter()
+        for i in range(size):
+            signer.signed_headers_for(instances[i % INSTANCES], "POST", "/hook", BODY)
+        results["cached signatures/sec"] = size / (perf_counter() - start)
+        results["key cache hit %"] = 100 * KEYS.hits / (KEYS.hits + KEYS.misses)
+    finally:
+        del SecretsService.CACHES[service.bootstrap_secret_ref]
+        KEYS.invalidate(service.bootstrap_secret_ref)
+    return results
@@ -1,7 +1,38 @@
+from typing import Any, Dict, Type, TypeVar
+
 import orjson
+from django.http import HttpRequest
+from ninja import Schema
+from ninja.errors import ValidationError
 from ninja.parser import Parser
+from pydantic import ValidationError as SchemaValidationError
+
+S = TypeVar("S", bound=Schema)
 
 
 class ORJSONParser(Parser):
     def parse_body(self, request):
         return orjson.loads(request.body)
+
+
+def parse_body(request: HttpRequest, schema: Type[S]) -> S:
+    """
+    Parses the JSON body into `schema` like a ninja body parameter would,
+    for routes that look at the request first (e.g. verify its signature).
+    """
+    try:
+        return schema.model_validate_json(request.body)
+    except SchemaValidationError as exc:
+        raise ValidationError(exc.errors(include_url=False, include_context=False))
+
+
+def body_openapi(schema: Type[Schema]) -> Dict[str, Any]:
+    """
+    The `openapi_extra` documenting `schema` as the body of such routes.
+    """
+    return {
+        "requestBody": {
+            "content": {"application/json": {"schema": schema.model_json_schema()}},
+            "required": True,
+        }
+    }
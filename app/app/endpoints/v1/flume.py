@@ -1,30 +1,335 @@
-from django.http import HttpRequest
+from time import monotonic
+from typing import AsyncIterator
+from uuid import UUID
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from orjson import dumps
+from app.common.default.parser import parse_body
 from app.common.default.standard_response import standard_response
 from app.common.default.types import EndPointResponse
-from app.schemas.req.flume import RegisterRequest
-from app.schemas.res.flume import RegisterResponse
+from app.common.default.utils import get_data_from_req
+from app.schemas.req.flume import (
+    HeartbeatBatchRequest,
+    PublishRequest,
+    RegisterBatchRequest,
+    RegisterRequest,
+)
+from app.schemas.res.flume import (
+    HeartbeatBatchResponse,
+    HeartbeatResult,
+    PublishResponse,
+    PublishResult,
+    RegisterBatchResponse,
+    RegisterBatchResult,
+    RegisterResponse,
+    RegistryChangeItem,
+    RegistryChangesResponse,
+)
+from app.models.events import Subscription
+from app.services.leases import LEASES
+from app.services.notifier import NOTIFIER
+from app.services.publishing import PublishService
+from app.services.registration import RegistrationService
+from app.services.replay import REPLAYS, ReplayService
+from app.services.registry import SNAPSHOT, ChangeSet, RegistryService
+from app.services.verifier import VERIFIER
+from ninja.errors import HttpError
 
 
 def register_ep(request: HttpRequest, data: RegisterRequest) -> EndPointResponse:
+    registration, version = RegistrationService.register(data)
     return standard_response(
         status_code=200,
-        message="Flume endpoint",
+        message="Instance registered",
         data=RegisterResponse(
-            service_id=data,
-            lease_ttl_sec=data.heartbeat_interval_sec,
-            registry_version=1,
+            service_id=str(registration.service_id),
+            instance_id=str(registration.instance_id),
+            push_kid=registration.push_kid,
+            lease_ttl_sec=data.heartbeat_interval_sec * settings.FLUME_LEASE_MISSES,
+            registry_version=version,
         ),
     )
 
 
+def register_batch_ep(
+    request: HttpRequest, data: RegisterBatchRequest
+) -> EndPointResponse:
+    registrations, version = RegistrationService.register_many(data.items)
+    results = []
+    for item, registration in zip(data.items, registrations):
+        if registration is None:
+            results.append(
+                RegisterBatchResult(
+                    service_name=item.service_name, error="Service not found"
+                )
+            )
+            continue
+        results.append(
+            RegisterBatchResult(
+                service_name=item.service_name,
+                instance_id=str(registration.instance_id),
+                push_kid=registration.push_kid,
+                lease_ttl_sec=item.heartbeat_interval_sec * settings.FLUME_LEASE_MISSES,
+            )
+        )
+    return standard_response(
+        status_code=200,
+        message="Instances registered",
+        data=RegisterBatchResponse(results=results, registry_version=version),
+    )
+
+
 def deregister_ep(request: HttpRequest, data: dict) -> EndPointResponse:
     service_id = data["service_id"]
     instance_id = data["instance_id"]
+    version = RegistrationService.deregister(service_id, instance_id)
     return standard_response(
         status_code=200,
-        message="Flume endpoint",
+        message="Instance deregistered",
         data={
             "service_id": service_id,
             "instance_id": instance_id,
+            "registry_version": version,
         },
     )
+
+
+def heartbeats_ep(
+    request: HttpRequest,
+    data: HeartbeatBatchRequest,
+    service_id: UUID | None = None,
+) -> EndPointResponse:
+    if not data.instance_ids and data.node_id is None:
+        raise HttpError(400, "instance_ids or node_id is required")
+    results, version = LEASES.beat_many(
+        data.instance_ids, node_id=data.node_id, service_id=service_id
+    )
+    return standard_response(
+        status_code=200,
+        message="Heartbeats accepted",
+        data=HeartbeatBatchResponse(
+            results=[
+                HeartbeatResult(instance_id=str(instance_id), status=status)
+                for instance_id, status in results
+            ],
+            registry_version=version,
+        ),
+    )
+
+
+def heartbeats_signed_ep(request: HttpRequest) -> EndPointResponse:
+    data = parse_body(request, HeartbeatBatchRequest)
+    service_id = None
+    if settings.FLUME_VERIFY_SIGNATURES:
+        signer = get_data_from_req(request)
+        VERIFIER.check_heartbeats(
+            signer,
+            [str(instance_id) for instance_id in data.instance_ids],
+            data.node_id,
+        )
+        if not data.instance_ids:
+            # a node beat only covers the instances of the signer's service
+            service_id = signer.service_id
+    return heartbeats_ep(request, data, service_id)
+
+
+def changes_response(change_set: ChangeSet) -> RegistryChangesResponse:
+    return RegistryChangesResponse(
+        registry_version=change_set.registry_version,
+        resync=change_set.resync,
+        more=change_set.more,
+        changes=[
+            RegistryChangeItem(
+                registry_version=change.registry_version,
+                kind=change.kind,
+                object_id=change.object_id,
+                op=change.op,
+                data=change.data,
+            )
+            for change in change_set.changes
+        ],
+    )
+
+
+def changes_ep(request: HttpRequest, data: dict) -> EndPointResponse:
+    change_set = RegistryService.changes_since(data["since"], limit=data["limit"])
+    return standard_response(
+        status_code=200,
+        message="Registry changes",
+        data=changes_response(change_set),
+    )
+
+
+async def watch_ep(request: HttpRequest, data: dict) -> EndPointResponse:
+    timeout = min(data["timeout"], settings.FLUME_WATCH_MAX_TIMEOUT_SEC)
+    await NOTIFIER.wait_past(data["version"], timeout)
+    return await sync_to_async(changes_ep)(
+        request, {"since": data["version"], "limit": data["limit"]}
+    )
+
+
+async def registry_events(
+    since: int, limit: int, lifetime: float
+) -> AsyncIterator[str]:
+    """
+    Yields the registry mutations after `since` as Server-Sent Events, for
+    `lifetime` seconds.
+
+    Every batch of changes is followed by a `version` event carrying the
+    registry_version as SSE id: a client applies the changes when it gets
+    it, and resumes from it with Last-Event-ID once the stream ends.
+    """
+    version = since
+    deadline = monotonic() + lifetime
+    while (remaining := deadline - monotonic()) > 0:
+        current = await NOTIFIER.wait_past(
+            version, min(settings.FLUME_SSE_KEEPALIVE_SEC, remaining)
+        )
+        if current <= version:
+            yield ": keep-alive\n\n"
+            continue
+        change_set = await sync_to_async(RegistryService.changes_since)(
+            version, limit=limit
+        )
+        if change_set.resync:
+            version = change_set.registry_version
+            yield (
+                f"id: {version}\nevent: resync\n"
+                f"data: {dumps({'registry_version': version}).decode()}\n\n"
+            )
+            continue
+        for item in changes_response(change_set).changes:
+            yield f"event: {item.kind.lower()}\ndata: {item.model_dump_json()}\n\n"
+        version = change_set.registry_version
+        yield (
+            f"id: {version}\nevent: version\n"
+            f"data: {dumps({'registry_version': version}).decode()}\n\n"
+        )
+
+
+async def stream_ep(request: HttpRequest, data: dict) -> StreamingHttpResponse:
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id is not None and last_event_id.isdigit():
+        since = int(last_event_id)
+    elif data["since"] is not None:
+        since = data["since"]
+    else:
+        since = await NOTIFIER.current()
+    response = StreamingHttpResponse(
+        registry_events(since, data["limit"], settings.FLUME_SSE_MAX_STREAM_SEC),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match semantics (RFC 9110): "*" or any tag of the list,
+    compared weakly (W/"1" matches "1").
+    """
+    tags = parse_etags(if_none_match)
+    return "*" in tags or etag.removeprefix("W/") in (
+        tag.removeprefix("W/") for tag in tags
+    )
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether Accept-Encoding allows gzip: listed (or "*") with q > 0.
+    """
+    wildcard = None
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        name = name.strip().lower()
+        if name in ("gzip", "x-gzip"):
+            return q > 0
+        if name == "*":
+            wildcard = q > 0
+    return bool(wildcard)
+
+
+def snapshot_ep(request: HttpRequest) -> HttpResponse:
+    snapshot = SNAPSHOT.get()
+    etag = f'"{snapshot.registry_version}"'
+    if etag_matches(request.headers.get("If-None-Match", ""), etag):
+        response = HttpResponse(status=304)
+    elif accepts_gzip(request.headers.get("Accept-Encoding", "")):
+        response = HttpResponse(snapshot.gzip_body, content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(snapshot.body, content_type="application/json")
+    response["ETag"] = etag
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+
+def publish_ep(request: HttpRequest, data: dict) -> EndPointResponse:
+    body: PublishRequest = data["body"]
+    definition = PublishService.definition(
+        data["event_key"], data["major"], publisher=body.publisher
+    )
+    results = PublishService.publish(definition, body.events)
+    return standard_response(
+        status_code=200,
+        message="Events published",
+        data=PublishResponse(
+            event_id=str(definition.id),
+            accepted=sum(1 for r in results if r.error is None),
+            results=[PublishResult(offset=r.offset, error=r.error) for r in results],
+        ),
+    )
+
+
+async def replay_lines(
+    subscription: Subscription, since: int, limit: int | None
+) -> AsyncIterator[bytes]:
+    """
+    Yields the events of the subscription from `since` as NDJSON, one page
+    of FLUME_REPLAY_PAGE events per chunk: only one page is in memory.
+    """
+    offset: int | None = since
+    while offset is not None and (limit is None or limit > 0):
+        chunk, count, offset = await sync_to_async(ReplayService.page)(
+            subscription, offset, settings.FLUME_REPLAY_PAGE, limit
+        )
+        if limit is not None:
+            limit -= count
+        if chunk:
+            yield chunk
+
+
+async def replay_ep(request: HttpRequest, data: dict) -> StreamingHttpResponse:
+    """
+    Signed like the heartbeats (verify_signature) when FLUME_VERIFY_SIGNATURES
+    is set, by an instance of the subscriber, and rate limited per
+    subscription (REPLAYS).
+    """
+    signer = None
+    if settings.FLUME_VERIFY_SIGNATURES:
+        signer = await sync_to_async(VERIFIER.verify)(
+            request.headers, request.method or "", request.get_full_path(), b""
+        )
+    subscription = await sync_to_async(ReplayService.subscription)(data["id"])
+    if signer is not None and signer.service_id != subscription.subscriber_id:
+        raise HttpError(403, "Only the subscriber can replay its subscription")
+    REPLAYS.start(subscription.id)
+    # an async iterator: ASGI would buffer a sync one whole before sending it
+    response = StreamingHttpResponse(
+        replay_lines(subscription, data["from"], data["limit"]),
+        content_type="application/x-ndjson",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
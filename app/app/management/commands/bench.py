@@ -0,0 +1,25 @@
+from importlib import import_module
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Run a micro-benchmark from app.benchmarks (e.g. bench heartbeats)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", type=str, help="Benchmark module name")
+        parser.add_argument(
+            "--size", type=int, default=None, help="Workload size (benchmark specific)"
+        )
+
+    def handle(self, *args, **options):
+        name = options["name"]
+        try:
+            module = import_module(f"app.benchmarks.{name}")
+        except ModuleNotFoundError as exc:
+            raise CommandError(f"Unknown benchmark '{name}'") from exc
+
+        kwargs = {"size": options["size"]} if options["size"] is not None else {}
+        results = module.run(**kwargs)
+        for metric, value in results.items():
+            self.stdout.write(f"{metric:<40} {value:>14,.2f}")
+        self.stdout.write(self.style.SUCCESS(f"Benchmark {name} done"))
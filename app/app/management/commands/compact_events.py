@@ -0,0 +1,50 @@
+from os import nice
+from time import sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.common.default.utils import c_error
+from app.services.compactor import COMPACTOR
+
+
+class Command(BaseCommand):
+    help = "Delete the events (and dead delivery retries) past their retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep compacting until interrupted"
+        )
+        parser.add_argument(
+            "--every",
+            type=float,
+            default=settings.FLUME_COMPACT_EVERY_SEC,
+            help="Seconds between two passes with --loop",
+        )
+        parser.add_argument(
+            "--nice",
+            type=int,
+            default=10,
+            help="CPU niceness increment, so live traffic keeps priority",
+        )
+
+    def handle(self, *args, **options):
+        nice(options["nice"])
+        while True:
+            try:
+                reclaimed = COMPACTOR.compact()
+            except Exception as exc:
+                if not options["loop"]:
+                    raise
+                c_error(f"Compaction failed: {exc}")
+            else:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{reclaimed['events']} events "
+                        f"({reclaimed['bytes']:,} bytes) and "
+                        f"{reclaimed['retries']} dead retries deleted"
+                    )
+                )
+            if not options["loop"]:
+                break
+            sleep(options["every"])
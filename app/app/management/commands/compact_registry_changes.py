@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.services.registry import RegistryService
+
+
+class Command(BaseCommand):
+    help = "Delete old registry changes (clients behind them will resync)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep_versions",
+            type=int,
+            default=100000,
+            help="Number of most recent registry versions to keep",
+        )
+
+    def handle(self, *args, **options):
+        deleted = RegistryService.compact(options["keep_versions"])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} registry changes deleted"))
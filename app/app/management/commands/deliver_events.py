@@ -0,0 +1,49 @@
+from asyncio import run
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.services.delivery import WebhookDispatcher
+from app.services.engine import DeliveryEngine
+from app.services.retries import RetryScheduler
+
+
+class Command(BaseCommand):
+    help = "Deliver published events to the webhooks of matching subscriptions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep delivering until interrupted"
+        )
+        parser.add_argument(
+            "--every",
+            type=float,
+            default=settings.FLUME_DELIVERY_POLL_SEC,
+            help="Seconds between two polls of the event store while idle",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=settings.FLUME_DELIVERY_BATCH,
+            help="Events read per event definition and poll",
+        )
+
+    def handle(self, *args, **options):
+        run(self.deliver(options["loop"], options["every"], options["batch"]))
+
+    async def deliver(self, loop: bool, every: float, batch: int) -> None:
+        retry_dispatcher = WebhookDispatcher(
+            max_in_flight=settings.FLUME_RETRY_MAX_IN_FLIGHT
+        )
+        async with WebhookDispatcher() as dispatcher, retry_dispatcher:
+            engine = DeliveryEngine(dispatcher, RetryScheduler(retry_dispatcher), batch)
+            if loop:
+                await engine.run_forever(every)
+            await engine.step()
+            stats = engine.stats()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{stats['events']} events fanned out to {stats['deliveries']} "
+                    f"deliveries, {stats['stored']} failed or parked"
+                )
+            )
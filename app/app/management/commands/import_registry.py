@@ -0,0 +1,52 @@
+import sys
+from typing import List
+
+from django.core.management.base import BaseCommand
+from orjson import JSONDecodeError, loads
+from pydantic import ValidationError
+
+from app.schemas.req.flume import RegisterRequest
+from app.services.registration import RegistrationService
+
+
+class Command(BaseCommand):
+    help = "Register the instances of a JSON-lines file (one RegisterRequest per line)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=str, help="JSON-lines file, '-' for stdin")
+        parser.add_argument(
+            "--chunk", type=int, default=500, help="Registrations per transaction"
+        )
+
+    def handle(self, *args, **options):
+        chunk: List[RegisterRequest] = []
+        registered = skipped = 0
+
+        def flush() -> None:
+            nonlocal registered, skipped
+            registrations, version = RegistrationService.register_many(chunk)
+            done = sum(1 for r in registrations if r is not None)
+            registered += done
+            skipped += len(chunk) - done
+            self.stdout.write(f"{registered} registered (registry version {version})")
+            chunk.clear()
+
+        stream = sys.stdin if options["path"] == "-" else open(options["path"], "rb")
+        with stream:
+            for number, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    chunk.append(RegisterRequest(**loads(line)))
+                except (JSONDecodeError, ValidationError, TypeError) as exc:
+                    skipped += 1
+                    self.stderr.write(f"Line {number} skipped: {exc}")
+                    continue
+                if len(chunk) >= options["chunk"]:
+                    flush()
+            if chunk:
+                flush()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{registered} instances registered, {skipped} skipped")
+        )
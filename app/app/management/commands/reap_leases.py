@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.services.reaper import REAPER
+
+
+class Command(BaseCommand):
+    help = "Mark instances with expired leases as missed / DOWN"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep sweeping until interrupted"
+        )
+        parser.add_argument(
+            "--every",
+            type=float,
+            default=settings.FLUME_REAPER_EVERY_SEC,
+            help="Seconds between two sweeps with --loop",
+        )
+
+    def handle(self, *args, **options):
+        if options["loop"]:
+            # logs the failed sweeps and keeps going
+            REAPER.run_forever(options["every"])
+        missed, down, version = REAPER.sweep()
+        if missed:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{missed} leases missed, {down} instances DOWN "
+                    f"(registry version {version})"
+                )
+            )
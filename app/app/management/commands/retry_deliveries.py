@@ -0,0 +1,43 @@
+from asyncio import run
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.services.delivery import WebhookDispatcher
+from app.services.retries import RetryScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Retry failed webhook deliveries and forward them to dead letters. "
+        "deliver_events retries on its own: only run this one without it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep retrying until interrupted"
+        )
+        parser.add_argument(
+            "--every",
+            type=float,
+            default=settings.FLUME_RETRY_EVERY_SEC,
+            help="Max seconds between two ticks with --loop",
+        )
+
+    def handle(self, *args, **options):
+        run(self.retry(options["loop"], options["every"]))
+
+    async def retry(self, loop: bool, every: float) -> None:
+        dispatcher = WebhookDispatcher(max_in_flight=settings.FLUME_RETRY_MAX_IN_FLIGHT)
+        async with dispatcher:
+            scheduler = RetryScheduler(dispatcher)
+            if loop:
+                await scheduler.run_forever(every)
+            attempted = await scheduler.tick()
+            stats = scheduler.stats()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{attempted} retries attempted: {stats['delivered']} delivered, "
+                    f"{stats['dead_lettered']} dead lettered, {stats['dead']} dead"
+                )
+            )
@@ -1,5 +1,6 @@
-import inspect
-from typing import Any, Callable, Sequence, TypeAlias, Union
+from functools import lru_cache, partial
+from inspect import signature
+from typing import Any, Callable, TypeAlias, Union
 
 from django.http import HttpRequest
 
@@ -19,6 +20,48 @@ RoutePipe: TypeAlias = Callable[[HttpRequest, Any, NextPipe], EndPointResponse]
 """
 Represents a route handler function.
 """
+CompiledPipeline: TypeAlias = Callable[[HttpRequest, Any], EndPointResponse]
+"""
+Represents a route pipeline resolved ahead of time, called with (request, data).
+"""
+
+
+def _link(handler: RoutePipe, rest: CompiledPipeline) -> CompiledPipeline:
+    def step(request: HttpRequest, data: Any) -> EndPointResponse:
+        return handler(request, data, partial(rest, request, data))
+
+    return step
+
+
+@lru_cache(maxsize=256)
+def compile_pipeline(
+    *handlers: RoutePipe, endpoint: FlexibleEndpointType
+) -> CompiledPipeline:
+    """
+    Resolve a sequence of route handlers once, e.g. at import time.
+
+    The endpoint signature is inspected here instead of on every request,
+    and every handler is bound to the rest of the chain, so a request only
+    pays one call (and one `next`) per handler.
+
+    Args:
+        *handlers (RoutePipe): A sequence of route handlers.
+        endpoint (FlexibleEndpointType): The final endpoint to call.
+
+    Returns:
+        CompiledPipeline: Runs the handlers and the endpoint on (request, data).
+    """
+    # Assuming param 1 is always 'request'. If more params, pass 'data'.
+    if len(signature(endpoint).parameters) > 1:
+        chain: CompiledPipeline = endpoint  # type: ignore[assignment]
+    else:
+
+        def chain(request: HttpRequest, data: Any) -> EndPointResponse:
+            return endpoint(request)  # type: ignore[call-arg]
+
+    for handler in reversed(handlers):
+        chain = _link(handler, chain)
+    return chain
 
 
 def pipeline(
@@ -30,6 +73,9 @@ def pipeline(
     """
     Resolve a sequence of route handlers.
 
+    Prefer compile_pipeline() at import time; this compiles the chain on
+    first use and looks it up on every call.
+
     Args:
         *handlers (RoutePipe): A sequence of route handlers.
         endpoint (FlexibleEndpointType): The final endpoint to call.
@@ -38,40 +84,4 @@ def pipeline(
     Returns:
         EndPointResponse: The response from the resolved route handlers.
     """
-    response = execute_pipeline(handlers, 0, request, endpoint, data)
-    return response
-
-
-def execute_pipeline(
-    pipeline_sequence: Sequence[RoutePipe],
-    index: int,
-    request: HttpRequest,
-    endpoint: Union[
-        Callable[[HttpRequest, Any], EndPointResponse],
-        Callable[[HttpRequest], EndPointResponse],
-    ],
-    data: Any,
-) -> EndPointResponse:
-    """
-    Execute a route pipeline.
-    """
-    current_func = pipeline_sequence[index] if index < len(pipeline_sequence) else None
-
-    def next_func():
-        return execute_pipeline(pipeline_sequence, index + 1, request, endpoint, data)
-
-    if current_func is None:
-        # Inspect the endpoint signature to call it correctly
-        sig = inspect.signature(endpoint)
-        num_params = len(sig.parameters)
-
-        # Assuming param 1 is always 'request'. If more params, pass 'data'.
-        # A more robust check could be by parameter names like 'data' if standardized.
-        if num_params > 1:
-            # We've checked it takes more than one param, assume it's (request, data)
-            return endpoint(request, data)  # type: ignore[call-arg]
-        else:
-            # We've checked it takes one param, assume it's (request)
-            return endpoint(request)  # type: ignore[call-arg]
-    # The T for RoutePipe's data argument is passed along.
-    return current_func(request, data, next_func)
+    return compile_pipeline(*handlers, endpoint=endpoint)(request, data)
@@ -0,0 +1,27 @@
+from typing import Any
+
+from django.conf import settings
+from django.http import HttpRequest
+
+from app.common.default.types import EndPointResponse
+from app.common.default.utils import append_data_to_req
+from app.middlewares.default.pipeline import NextPipe
+from app.services.verifier import VERIFIER
+
+
+def verify_signature(
+    request: HttpRequest, data: Any, next: NextPipe
+) -> EndPointResponse:
+    """
+    Lets through only requests signed by the instance in X-Instance-Id
+    (X-Timestamp, X-Nonce, X-Key-Id, X-Signature), when
+    FLUME_VERIFY_SIGNATURES is set. Put it before the body is parsed: an
+    unsigned request is answered 401 without any parsing. The signing
+    ServiceInstance is appended to the request (get_data_from_req).
+    """
+    if settings.FLUME_VERIFY_SIGNATURES:
+        signer = VERIFIER.verify(
+            request.headers, request.method or "", request.get_full_path(), request.body
+        )
+        append_data_to_req(request, signer)
+    return next()
@@ -1,7 +1,15 @@
-from .flume import RegisteredService, ServiceCapabilities, ServiceMeta
+from .services import Service, ServiceInstance, NonceSeen
+from .register import RegistryState, RegistryChange
+from .events import EventDefinition, Subscription, EventRecord, DeliveryRetry
 
 __all__ = [
-    "RegisteredService",
-    "ServiceCapabilities",
-    "ServiceMeta",
+    "Service",
+    "ServiceInstance",
+    "NonceSeen",
+    "RegistryState",
+    "RegistryChange",
+    "EventDefinition",
+    "Subscription",
+    "EventRecord",
+    "DeliveryRetry",
 ]
@@ -5,14 +5,26 @@ from django.db.models import (
     JSONField,
     TextField,
     ForeignKey,
+    OneToOneField,
     UniqueConstraint,
     Index,
     CASCADE,
     UUIDField,
     BooleanField,
+    BigAutoField,
+    BigIntegerField,
+    DateTimeField,
+    TextChoices,
 )
+from datetime import timedelta
+from typing import Any, Dict
 from uuid import uuid4
-from app.models.services import Service
+from django.db.models.signals import post_delete, post_init, post_save
+from django.db.transaction import on_commit
+from django.dispatch import receiver
+from orjson import OPT_SORT_KEYS, dumps
+from app.models.register import RegistryChange, RegistryState
+from app.models.services import Service, ServiceInstance
 
 
 class EventDefinition(BaseModel):
@@ -45,6 +57,32 @@ class EventDefinition(BaseModel):
     def __str__(self):
         return f"{self.publisher.name}:{self.event_key}@v{self.major}"
 
+    def registry_view(self) -> Dict[str, Any]:
+        """
+        Return the view published in the registry change log.
+        """
+        return {
+            "id": str(self.id),
+            "publisher_id": str(self.publisher_id),
+            "event_key": self.event_key,
+            "major": self.major,
+            "ordering_key_field": self.ordering_key_field,
+            "delivery_modes": self.delivery_modes,
+            "version_hash": self.version_hash,
+        }
+
+    @property
+    def retention_period(self) -> timedelta | None:
+        """
+        How long events are kept, None when they are kept forever
+        (no retention, or a policy other than "days" / "hours").
+        """
+        retention = self.retention or {}
+        unit = {"days": 86400, "hours": 3600}.get(retention.get("policy"))
+        if unit is None or not retention.get("value"):
+            return None
+        return timedelta(seconds=unit * float(retention["value"]))
+
 
 class Subscription(BaseModel):
     """
@@ -82,3 +120,157 @@ class Subscription(BaseModel):
 
     def __str__(self):
         return f"{self.subscriber.name} -> {self.event}"
+
+    def registry_view(self) -> Dict[str, Any]:
+        """
+        Return the view published in the registry change log.
+        """
+        return {
+            "id": str(self.id),
+            "event_id": str(self.event_id),
+            "subscriber_id": str(self.subscriber_id),
+            "webhook_url": self.webhook_url,
+            "filters": self.filters,
+            "enabled": self.enabled,
+        }
+
+
+class EventRecord(BaseModel):
+    """
+    An event published for an EventDefinition.
+    The id is the offset of the event: it only grows, subscribers replay from it.
+    """
+
+    id = BigAutoField(primary_key=True)
+    event = ForeignKey(EventDefinition, on_delete=CASCADE, related_name="records")
+    ordering_key = CharField(max_length=200, null=True, blank=True)
+    payload = JSONField()
+
+    class Meta:
+        indexes = [
+            Index(fields=["event", "id"]),
+            Index(fields=["event", "created_at"]),
+            Index(fields=["created_at"]),
+        ]
+
+
+class DeliveryRetry(BaseModel):
+    """
+    A webhook delivery that failed and waits for its next attempt.
+    Deleted once delivered or forwarded to the dead letter of the subscription.
+    The event is (event, offset) in the event store, so it is not a foreign
+    key: with the log store there is no EventRecord row.
+    """
+
+    class State(TextChoices):
+        PENDING = "PENDING"
+        # behind an earlier delivery of the same ordering key, not attempted yet
+        PARKED = "PARKED"
+        DEAD = "DEAD"  # out of attempts and the dead letter failed (or is unset)
+
+    id = BigAutoField(primary_key=True)
+    subscription = ForeignKey(Subscription, on_delete=CASCADE, related_name="retries")
+    event = ForeignKey(EventDefinition, on_delete=CASCADE, related_name="retries")
+    offset = BigIntegerField()
+    ordering_key = CharField(max_length=200, null=True, blank=True)
+    attempts = PositiveIntegerField(default=1)  # attempts made so far
+    next_attempt_at = DateTimeField()
+    last_error = TextField(null=True, blank=True)
+    state = CharField(max_length=10, choices=State.choices, default=State.PENDING)
+
+    class Meta:
+        indexes = [
+            Index(fields=["state", "next_attempt_at"]),
+            Index(fields=["subscription", "ordering_key", "state"]),
+            Index(fields=["event", "created_at"]),
+        ]
+
+
+class DeliveryCursor(BaseModel):
+    """
+    Where the delivery engine is in the event store of an EventDefinition:
+    the offset of the next event to fan out. Moved once the deliveries of
+    the events before it are done and their failures stored as retries.
+    """
+
+    event = OneToOneField(
+        EventDefinition,
+        on_delete=CASCADE,
+        primary_key=True,
+        related_name="delivery_cursor",
+    )
+    offset = BigIntegerField(default=0)
+
+
+_KINDS = {
+    Service: RegistryChange.Kind.SERVICE,
+    ServiceInstance: RegistryChange.Kind.INSTANCE,
+    EventDefinition: RegistryChange.Kind.EVENT,
+    Subscription: RegistryChange.Kind.SUBSCRIPTION,
+}
+
+
+def _registry_view(instance) -> bytes | None:
+    """
+    The serialized registry view, None if fields are deferred (reading them
+    would query the database).
+    """
+    if instance.get_deferred_fields():
+        return None
+    return dumps(instance.registry_view(), option=OPT_SORT_KEYS)
+
+
+@receiver(post_init, sender=Service)
+@receiver(post_init, sender=EventDefinition)
+@receiver(post_init, sender=Subscription)
+def remember_view(sender, instance, **kwargs):
+    """
+    Keeps the registry view as loaded, so saves that leave it alone (e.g.
+    of secret_ref or notes) are not registry mutations.
+    """
+    instance._registry_view = _registry_view(instance)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=EventDefinition)
+@receiver(post_save, sender=Subscription)
+def record_saved(sender, instance, created, **kwargs):
+    """
+    Services, event definitions and subscriptions are registry mutations
+    when their registry view changes. Instances are logged by the
+    registration and lease services, which write them in bulk.
+    """
+    view = _registry_view(instance)
+    if not created and view is not None and view == instance._registry_view:
+        return
+    on_commit(lambda: setattr(instance, "_registry_view", view))
+    RegistryState.bump(
+        [
+            RegistryChange(
+                kind=_KINDS[sender],
+                object_id=str(instance.pk),
+                data=instance.registry_view(),
+            )
+        ]
+    )
+
+
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=ServiceInstance)
+@receiver(post_delete, sender=EventDefinition)
+@receiver(post_delete, sender=Subscription)
+def record_deleted(sender, instance, **kwargs):
+    """
+    Deletions of all of them, deregistered instances included (also when
+    their service is deleted), so delta clients drop them too.
+    """
+    RegistryState.bump(
+        [
+            RegistryChange(
+                kind=_KINDS[sender],
+                object_id=str(instance.pk),
+                op=RegistryChange.Op.DELETE,
+                data={},
+            )
+        ]
+    )
@@ -1,7 +1,101 @@
-from django.db.models import F, IntegerField, BigIntegerField
-from django.db.transaction import atomic
+from threading import Lock, local
+from typing import Callable, Sequence
+from django.conf import settings
+from django.db import connection
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.utils import CursorWrapper
+from django.db.models import (
+    F,
+    Value,
+    IntegerField,
+    BigIntegerField,
+    CharField,
+    JSONField,
+    TextChoices,
+    Index,
+)
+from django.db.models.functions import Greatest
+from django.db.transaction import atomic, on_commit
 from app.models.default.base_model import BaseModel
 
+_SEQUENCE = "flume_registry_version_seq"
+_ALLOCATE = "flume_allocate_registry_version"
+# advisory lock keys (int4, int4): (_ALLOCATING, 0) is held shared while a
+# version is being taken, (_ALLOCATED, version % _KEYS) until its commit
+_ALLOCATING = 0x464C554D
+_ALLOCATED = _ALLOCATING + 1
+_KEYS = 2**31 - 1
+
+_watermark = 0
+_watermark_lock = Lock()
+
+_transaction = local()
+
+
+def hold_until_commit(cursor: CursorWrapper, allocated: int, value: int) -> None:
+    """
+    Takes the advisory lock (`allocated`, value % _KEYS) shared until the
+    running transaction ends, which keeps committed_through() below `value`.
+    """
+    cursor.execute(
+        "SELECT pg_advisory_xact_lock_shared(%s, %s)", [allocated, value % _KEYS]
+    )
+
+
+def committed_through(
+    cursor: CursorWrapper, allocated_to: int, allocating: int, allocated: int
+) -> int | None:
+    """
+    Returns the highest value up to `allocated_to` below which every value
+    taken from a PostgreSQL sequence has committed, when the writers hold
+    the advisory lock (`allocated`, value % _KEYS) from before they take
+    `value` (or lower) until their commit; and (`allocating`, 0), if they
+    need it, while they take values. None while one is held: a value below
+    `allocated_to` may be taken.
+    """
+    for _ in range(3):
+        cursor.execute(
+            "SELECT classid::bigint, objid::bigint FROM pg_locks "
+            "WHERE locktype = 'advisory' AND granted AND objsubid = 2 "
+            "AND classid::bigint IN (%s, %s) AND database = "
+            "(SELECT oid FROM pg_database WHERE datname = current_database())",
+            [allocating, allocated],
+        )
+        held = cursor.fetchall()
+        if all(classid == allocated for classid, _ in held):
+            break
+    else:
+        return None
+    watermark = allocated_to
+    for _, key in held:
+        behind = (allocated_to - key) % _KEYS  # values in flight are close
+        if behind < _KEYS // 2 and allocated_to - behind <= watermark:
+            watermark = allocated_to - behind - 1
+    return watermark
+
+
+def _coalesced_version() -> int | None:
+    """
+    Returns the version already allocated by the running transaction, if any.
+    The on_commit marker registered with it is dropped by Django on commit
+    and on rollback (also of the savepoint it was taken in).
+    """
+    marker: Callable[[], None] | None = getattr(_transaction, "marker", None)
+    if marker is None:
+        return None
+    if any(func is marker for _, func, _ in connection.run_on_commit):
+        return _transaction.version
+    _transaction.marker = None
+    return None
+
+
+def _coalesce(version: int) -> None:
+    def marker() -> None:
+        _transaction.marker = None
+
+    _transaction.marker, _transaction.version = marker, version
+    on_commit(marker)
+
 
 class RegistryState(BaseModel):
     """
@@ -11,34 +105,181 @@ class RegistryState(BaseModel):
 
     pkid = IntegerField(primary_key=True, default=1, editable=False)
     registry_version = BigIntegerField(default=0)
+    # changes up to this version have been compacted away
+    compacted_through = BigIntegerField(default=0)
 
     @classmethod
     @atomic
-    def bump(cls) -> int:
+    def bump(cls, changes: Sequence["RegistryChange"] = ()) -> int:
+        """
+        Returns the new version, allocated once per transaction: further
+        bumps in the same transaction coalesce into it.
+        The given changes are stamped with the version and written in
+        the same transaction.
+        """
+        version = _coalesced_version()
+        if version is None:
+            if settings.FLUME_REGISTRY_SEQUENCE and connection.vendor == "postgresql":
+                version = cls._allocate_from_sequence()
+            else:
+                version = cls._allocate_locked()
+            _coalesce(version)
+        if changes:
+            for change in changes:
+                change.registry_version = version
+            RegistryChange.objects.bulk_create(changes)
+        return version
+
+    @classmethod
+    def _allocate_locked(cls) -> int:
+        """
+        Increments the version on the single row.
+        The UPDATE locks the row so multiple ledger replicas don't race:
+        concurrent writers are serialized until commit, but versions commit
+        in order. Updating before reading also avoids SQLite lock upgrades.
         """
-        Atomically increments and returns the new version.
-        Locks the single row so multiple ledger replicas don't race.
+        bump = {"registry_version": F("registry_version") + 1}
+        if not cls.objects.filter(pkid=1).update(**bump):
+            cls.objects.get_or_create(pkid=1)
+            cls.objects.filter(pkid=1).update(**bump)
+        return cls.objects.values_list("registry_version", flat=True).get(pkid=1)
+
+    @classmethod
+    def _allocate_from_sequence(cls) -> int:
+        """
+        Takes the version from a PostgreSQL sequence, without any row lock,
+        and publishes it on the row right after commit. The sequence and its
+        allocation function are created after migrate (create_sequence).
+
+        Concurrent transactions may commit their versions out of order: a
+        client reading the change log between the two commits would move
+        past the slower version for good. The allocation function holds an
+        advisory lock on the version until commit, so current() only
+        reports versions below which every allocated one has committed.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {_ALLOCATE}()")
+            version = cursor.fetchone()[0]
+
+        def publish():
+            cls.objects.filter(pkid=1).update(
+                registry_version=Greatest(F("registry_version"), Value(version))
+            )
+
+        on_commit(publish, robust=True)
+        return version
+
+    @staticmethod
+    def create_sequence(using: BaseDatabaseWrapper) -> None:
+        """
+        Creates (or moves past the published version) the version sequence
+        and its allocation function on PostgreSQL. Run after every migrate,
+        outside of any request transaction.
         """
-        obj, _ = cls.objects.select_for_update().get_or_create(pkid=1)
-        obj.registry_version = F("registry_version") + 1
-        obj.save(update_fields=["registry_version"])
-        obj.refresh_from_db(fields=["registry_version"])  # resolve F()
-        return obj.registry_version
+        if using.vendor != "postgresql":
+            return
+        RegistryState.objects.using(using.alias).get_or_create(pkid=1)
+        table = using.ops.quote_name(RegistryState._meta.db_table)
+        with using.cursor() as cursor:
+            cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {_SEQUENCE}")
+            cursor.execute(
+                f"SELECT setval('{_SEQUENCE}', GREATEST("
+                f"(SELECT last_value FROM {_SEQUENCE}), "
+                f"(SELECT registry_version FROM {table} WHERE pkid = 1), 1))"
+            )
+            cursor.execute(
+                f"""
+                CREATE OR REPLACE FUNCTION {_ALLOCATE}() RETURNS bigint
+                LANGUAGE plpgsql AS $$
+                DECLARE
+                    allocated bigint;
+                BEGIN
+                    PERFORM pg_advisory_lock_shared({_ALLOCATING}, 0);
+                    BEGIN
+                        allocated := nextval('{_SEQUENCE}');
+                        PERFORM pg_advisory_xact_lock(
+                            {_ALLOCATED}, (allocated % {_KEYS})::integer
+                        );
+                    EXCEPTION WHEN OTHERS THEN
+                        PERFORM pg_advisory_unlock_shared({_ALLOCATING}, 0);
+                        RAISE;
+                    END;
+                    PERFORM pg_advisory_unlock_shared({_ALLOCATING}, 0);
+                    RETURN allocated;
+                END $$
+                """
+            )
+
+    @classmethod
+    def committed(cls, published: int) -> int:
+        """
+        Returns the committed watermark for the published version: the
+        highest version up to which every allocated version has committed.
+        Versions from the row lock commit in order, so it is `published`
+        itself; with the sequence, versions still held by a running
+        transaction (or being taken) keep it back.
+        """
+        global _watermark
+        if not (settings.FLUME_REGISTRY_SEQUENCE and connection.vendor == "postgresql"):
+            return published
+        if published <= _watermark:
+            return published
+        with _watermark_lock, connection.cursor() as cursor:
+            watermark = committed_through(cursor, published, _ALLOCATING, _ALLOCATED)
+            if watermark is None:
+                # versions are being taken: one may be below `published`
+                return min(published, _watermark)
+            _watermark = max(_watermark, watermark)
+            return min(published, _watermark)
 
     @classmethod
     def current(cls) -> int:
+        """
+        Returns the committed registry version: every change up to it can
+        be read, none will show up later below it.
+        """
         try:
-            return cls.objects.only("registry_version").get(pkid=1).registry_version
+            published = cls.objects.only("registry_version").get(pkid=1)
         except cls.DoesNotExist:
             return 0
+        return cls.committed(published.registry_version)
 
     @classmethod
     @atomic
-    def maybe_bump(cls, changed: bool) -> int:
+    def maybe_bump(cls, changed: bool, changes: Sequence["RegistryChange"] = ()) -> int:
         """
         Bump only if 'changed' is True, otherwise return current.
         Useful to keep logic tidy in endpoints.
         """
         if changed:
-            return cls.bump()
+            return cls.bump(changes)
         return cls.current()
+
+
+class RegistryChange(BaseModel):
+    """
+    Append-only log of registry mutations, one row per changed object.
+    `data` is the full public view of the object after the change, so a
+    client only needs the last change of every object to catch up.
+    """
+
+    class Kind(TextChoices):
+        SERVICE = "SERVICE"
+        INSTANCE = "INSTANCE"
+        SUBSCRIPTION = "SUBSCRIPTION"
+        EVENT = "EVENT"
+
+    class Op(TextChoices):
+        UPSERT = "UPSERT"
+        DELETE = "DELETE"
+
+    registry_version = BigIntegerField()
+    kind = CharField(max_length=16, choices=Kind.choices)
+    object_id = CharField(max_length=64)
+    op = CharField(max_length=8, choices=Op.choices, default=Op.UPSERT)
+    data = JSONField(default=dict)
+
+    class Meta:
+        indexes = [
+            Index(fields=["registry_version"]),
+        ]
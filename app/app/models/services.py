@@ -10,7 +10,8 @@ from django.db.models import (
     UniqueConstraint,
     Q,
 )
-from django.db.models import IntegerField, DateTimeField
+from django.db.models import BigIntegerField, IntegerField, DateTimeField
+from typing import Any, Dict
 from uuid import uuid4
 from app.models.default.base_model import BaseModel
 
@@ -36,6 +37,18 @@ class Service(BaseModel):
     def __str__(self):
         return self.name
 
+    def registry_view(self) -> Dict[str, Any]:
+        """
+        Return the view published in the registry change log.
+        """
+        return {
+            "service_id": str(self.service_id),
+            "name": self.name,
+            "publishes": self.publishes,
+            "consumes": self.consumes,
+            "meta": self.meta,
+        }
+
 
 class ServiceInstance(BaseModel):
     class Status(TextChoices):
@@ -89,10 +102,22 @@ class ServiceInstance(BaseModel):
 
 
 class NonceSeen(BaseModel):
+    """
+    A nonce used by an instance, kept while its timestamp is inside the
+    acceptance window (see app.services.nonces.DbNonceStore).
+    """
+
     service_instance = ForeignKey(
         ServiceInstance, on_delete=CASCADE, related_name="nonces"
     )
-    nonce = CharField(max_length=64, db_index=True)
+    nonce = CharField(max_length=64)
+    # X-Timestamp // FLUME_NONCE_BUCKET_SEC: expired buckets are purged in bulk
+    bucket = BigIntegerField()
 
     class Meta:
-        unique_together = ("service_instance", "nonce")
+        constraints = [
+            UniqueConstraint(
+                fields=["bucket", "service_instance", "nonce"],
+                name="uniq_nonce_by_bucket_instance",
+            ),
+        ]
@@ -1,17 +1,120 @@
-from ninja import Router
-from app.endpoints.v1.flume import deregister_ep, register_ep
+from typing import Optional
+from uuid import UUID
+from ninja import Query, Router
+from app.endpoints.v1.flume import (
+    changes_ep,
+    deregister_ep,
+    heartbeats_signed_ep,
+    publish_ep,
+    register_batch_ep,
+    register_ep,
+    replay_ep,
+    snapshot_ep,
+    stream_ep,
+    watch_ep,
+)
 from django.http import HttpRequest
-from app.schemas.req.flume import RegisterRequest
-from app.middlewares.default.pipeline import pipeline
+from app.schemas.req.flume import (
+    HeartbeatBatchRequest,
+    PublishRequest,
+    RegisterBatchRequest,
+    RegisterRequest,
+)
+from app.common.default.parser import body_openapi
+from app.middlewares.default.pipeline import compile_pipeline
+from app.middlewares.default.signature import verify_signature
 
 v1 = Router(tags=["Flume"])
 
 
+register_pipeline = compile_pipeline(endpoint=register_ep)
+
+
 @v1.post("/services/register")
 def register(request: HttpRequest, data: RegisterRequest):
-    return pipeline(request, endpoint=register_ep, data=data)
+    return register_pipeline(request, data)
+
+
+register_batch_pipeline = compile_pipeline(endpoint=register_batch_ep)
+
+
+@v1.post("/services/register/batch")
+def register_batch(request: HttpRequest, data: RegisterBatchRequest):
+    return register_batch_pipeline(request, data)
+
+
+deregister_pipeline = compile_pipeline(endpoint=deregister_ep)
 
 
 @v1.delete("/services/{service_id}/instances/{instance_id}")
 def deregister(request: HttpRequest, service_id: str, instance_id: str):
-    return pipeline(request, endpoint=deregister_ep, data={service_id, instance_id})
+    return deregister_pipeline(
+        request, {"service_id": service_id, "instance_id": instance_id}
+    )
+
+
+heartbeats_pipeline = compile_pipeline(verify_signature, endpoint=heartbeats_signed_ep)
+
+
+@v1.post("/heartbeats", openapi_extra=body_openapi(HeartbeatBatchRequest))
+def heartbeats(request: HttpRequest):
+    # signed by the instances: the body is parsed once the signature checks out
+    return heartbeats_pipeline(request, None)
+
+
+changes_pipeline = compile_pipeline(endpoint=changes_ep)
+
+
+@v1.get("/changes")
+def changes(request: HttpRequest, since: int = 0, limit: int = 1000):
+    return changes_pipeline(request, {"since": since, "limit": limit})
+
+
+@v1.get("/watch")
+async def watch(
+    request: HttpRequest,
+    version: int = 0,
+    timeout: float = 30,
+    limit: int = 1000,
+):
+    # long-poll: the pipeline is synchronous, the endpoint awaits by itself
+    return await watch_ep(
+        request, {"version": version, "timeout": timeout, "limit": limit}
+    )
+
+
+@v1.get("/stream")
+async def stream(request: HttpRequest, since: Optional[int] = None, limit: int = 1000):
+    # Server-Sent Events, resumable with Last-Event-ID
+    return await stream_ep(request, {"since": since, "limit": limit})
+
+
+snapshot_pipeline = compile_pipeline(endpoint=snapshot_ep)
+
+
+@v1.get("/registry")
+def snapshot(request: HttpRequest):
+    return snapshot_pipeline(request, None)
+
+
+publish_pipeline = compile_pipeline(endpoint=publish_ep)
+
+
+@v1.post("/events/{event_key}/v{major}/publish")
+def publish(request: HttpRequest, event_key: str, major: int, data: PublishRequest):
+    return publish_pipeline(
+        request, {"event_key": event_key, "major": major, "body": data}
+    )
+
+
+@v1.get("/subscriptions/{subscription_id}/replay")
+async def replay(
+    request: HttpRequest,
+    subscription_id: UUID,
+    since: int = Query(0, alias="from"),
+    limit: Optional[int] = None,
+):
+    # NDJSON stream of the stored events matching the subscription filters
+    return await replay_ep(
+        request, {"id": subscription_id, "from": since, "limit": limit}
+    )
@@ -1,7 +1,7 @@
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from uuid import UUID
 from ninja import Schema
-from pydantic import AnyHttpUrl, constr, conint
+from pydantic import AnyHttpUrl, constr, conint, conlist
 
 
 # ---- nested ----
@@ -16,6 +16,7 @@ class RegisterRequestMeta(Schema):
     zone: Optional[str] = None  # es: "z1" / "eu-central-1a"
     node_id: Optional[str] = None  # stable identifier of the node
     task_slots: Optional[int] = None  # number of tasks the node can run
+    task_slot: Optional[int] = None  # slot of this task, es. {{.Task.Slot}}
     boot_id: Optional[str] = None  # changes on every reboot
     weight: conint(ge=1, le=100) = 1  # for client-side balancing
 
@@ -26,7 +27,7 @@ class RegisterRequestMeta(Schema):
 class RegisterRequest(Schema):
     # logical service name (not the replica)
     service_name: constr(
-        strip_whitespace=True, min_length=1, regex=r"^[a-z][a-z0-9-_]{1,63}$"
+        strip_whitespace=True, min_length=1, pattern=r"^[a-z][a-z0-9-_]{1,63}$"
     )
     # where the instance listens in the internal network
     base_url: AnyHttpUrl  # es: http://10.0.1.11:8080
@@ -37,3 +38,21 @@ class RegisterRequest(Schema):
     capabilities: Optional[RegisterRequestCapabilities] = None
     meta: Optional[RegisterRequestMeta] = None
     # NB: no instance_id here – the ledger generates it
+
+
+class HeartbeatBatchRequest(Schema):
+    # instances beating in this call (a sidecar sends all the replicas it fronts)
+    instance_ids: conlist(UUID, max_length=5000) = []
+    # optional node scope: without instance_ids every instance on the node beats
+    node_id: Optional[str] = None
+
+
+class RegisterBatchRequest(Schema):
+    # many registrations at once (es. a whole node after a rollout)
+    items: conlist(RegisterRequest, min_length=1, max_length=1000)
+
+
+class PublishRequest(Schema):
+    # service name of the publisher, only needed if the event_key is ambiguous
+    publisher: Optional[str] = None
+    events: conlist(Dict[str, Any], min_length=1, max_length=1000)
@@ -0,0 +1,59 @@
+from typing import Any, Dict, List, Optional
+from ninja import Schema
+
+
+class RegisterResponse(Schema):
+    service_id: str
+    instance_id: str
+    push_kid: str
+    lease_ttl_sec: int
+    registry_version: int
+
+
+class RegisterBatchResult(Schema):
+    service_name: str
+    instance_id: Optional[str] = None
+    push_kid: Optional[str] = None
+    lease_ttl_sec: Optional[int] = None
+    error: Optional[str] = None  # es: unknown service
+
+
+class RegisterBatchResponse(Schema):
+    results: List[RegisterBatchResult]
+    registry_version: int
+
+
+class HeartbeatResult(Schema):
+    instance_id: str
+    status: str  # UP / DOWN / DRAIN, UNKNOWN means "register again"
+
+
+class HeartbeatBatchResponse(Schema):
+    results: List[HeartbeatResult]
+    registry_version: int
+
+
+class RegistryChangeItem(Schema):
+    registry_version: int
+    kind: str  # SERVICE / INSTANCE / SUBSCRIPTION / EVENT
+    object_id: str
+    op: str  # UPSERT / DELETE
+    data: Dict[str, Any]
+
+
+class RegistryChangesResponse(Schema):
+    registry_version: int
+    resync: bool  # too old: download the full registry again
+    more: bool  # truncated: ask again with since=registry_version
+    changes: List[RegistryChangeItem]
+
+
+class PublishResult(Schema):
+    offset: Optional[int] = None
+    error: Optional[str] = None  # why the event was rejected
+
+
+class PublishResponse(Schema):
+    event_id: str
+    accepted: int
+    results: List[PublishResult]
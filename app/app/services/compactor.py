@@ -0,0 +1,80 @@
+from datetime import datetime
+from time import sleep
+from typing import Dict
+
+from django.conf import settings
+from django.utils import timezone
+
+from app.models.events import DeliveryRetry, EventDefinition
+from app.services.eventstore import EVENTS
+
+
+class RetentionCompactor:
+    """
+    Enforces EventDefinition.retention: deletes the expired events of every
+    definition from the event store, and the DEAD delivery retries older
+    than the retention, `batch` rows at a time with `pause` seconds between
+    two batches. Pending and parked retries belong to the RetryScheduler,
+    which counts them in its blocked ordering keys: it resolves the ones
+    whose event expired itself. Every batch is its own short statement, so compaction never
+    holds locks for long and yields to live traffic.
+    """
+
+    def __init__(self, batch: int, pause: float):
+        self.batch = batch
+        self.pause = pause
+        self.events = self.bytes = self.retries = 0
+
+    def _retries(self, definition: EventDefinition, before: datetime) -> int:
+        ids = list(
+            DeliveryRetry.objects.filter(
+                event=definition,
+                state=DeliveryRetry.State.DEAD,
+                created_at__lt=before,
+            )
+            .order_by("created_at")
+            .values_list("id", flat=True)[: self.batch]
+        )
+        if ids:
+            DeliveryRetry.objects.filter(id__in=ids).delete()
+        return len(ids)
+
+    def compact(self, now: datetime | None = None) -> Dict[str, int]:
+        """
+        Runs one pass over the definitions with a retention.
+
+        Returns:
+            Dict[str, int]: The events, event bytes and retries deleted.
+        """
+        now = now or timezone.now()
+        reclaimed = {"events": 0, "bytes": 0, "retries": 0}
+        for definition in EventDefinition.objects.filter(retention__isnull=False):
+            period = definition.retention_period
+            if period is None:
+                continue
+            before = now - period
+            while True:
+                events, size = EVENTS.expire(definition, before, self.batch)
+                reclaimed["events"] += events
+                reclaimed["bytes"] += size
+                if events < self.batch:
+                    break
+                sleep(self.pause)
+            while True:
+                retries = self._retries(definition, before)
+                reclaimed["retries"] += retries
+                if retries < self.batch:
+                    break
+                sleep(self.pause)
+        self.events += reclaimed["events"]
+        self.bytes += reclaimed["bytes"]
+        self.retries += reclaimed["retries"]
+        return reclaimed
+
+
+COMPACTOR = RetentionCompactor(
+    batch=settings.FLUME_COMPACT_BATCH, pause=settings.FLUME_COMPACT_PAUSE_SEC
+)
+"""
+The retention compactor of this process.
+"""
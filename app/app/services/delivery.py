@@ -0,0 +1,207 @@
+from asyncio import (
+    FIRST_COMPLETED,
+    Queue,
+    Semaphore,
+    Task,
+    create_task,
+    gather,
+    to_thread,
+    wait,
+)
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, NamedTuple, Set
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from httpx import AsyncClient, Limits
+from orjson import Fragment, dumps, loads
+
+from app.common.default.utils import c_error
+from app.models.events import EventDefinition, Subscription
+from app.services.eventstore import StoredEvent
+from app.services.routing import ROUTER
+from app.services.signer import Signer
+
+
+class Delivery(NamedTuple):
+    subscription: Subscription  # with its subscriber loaded
+    offset: int
+    ordering_key: str | None
+    body: bytes
+
+
+class DeliveryResult(NamedTuple):
+    delivery: Delivery
+    status: int | None  # HTTP status, None when no response came back
+    error: str | None
+    latency: float  # seconds on the wire, waiting for a slot excluded
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class FanOutService:
+    """
+    Turns stored events into webhook deliveries for the matching subscriptions.
+    """
+
+    @staticmethod
+    def body(definition: EventDefinition, event: StoredEvent) -> bytes:
+        return dumps(
+            {
+                "event_key": definition.event_key,
+                "major": definition.major,
+                "offset": event.offset,
+                "ordering_key": event.ordering_key,
+                "published_at": event.created_at,
+                "payload": Fragment(bytes(event.payload)),
+            }
+        )
+
+    @staticmethod
+    def deliveries(
+        definition: EventDefinition, events: Iterable[StoredEvent]
+    ) -> List[Delivery]:
+        """
+        Returns one delivery per (event, matching subscription), in offset
+        order. One query loads every subscription involved.
+        """
+        matches = [(e, ROUTER.match(definition.id, loads(e.payload))) for e in events]
+        ids = set().union(*(m for _, m in matches))
+        subscriptions = Subscription.objects.select_related("subscriber").in_bulk(ids)
+        deliveries: List[Delivery] = []
+        for event, matched in matches:
+            body = FanOutService.body(definition, event)
+            for subscription_id in matched:
+                subscription = subscriptions.get(subscription_id)
+                if subscription is not None:
+                    deliveries.append(
+                        Delivery(subscription, event.offset, event.ordering_key, body)
+                    )
+        return deliveries
+
+
+class WebhookDispatcher:
+    """
+    Delivers webhooks from one event loop with one pooled AsyncClient per
+    subscriber origin: at most `max_per_host` requests in flight per origin
+    and `max_in_flight` overall, so a slow subscriber only queues behind
+    itself. Clients are bound to the loop: create the dispatcher inside it.
+    """
+
+    def __init__(
+        self,
+        signer: Signer | None = None,
+        max_in_flight: int | None = None,
+        max_per_host: int | None = None,
+        timeout: float | None = None,
+    ):
+        self.signer = signer or Signer()
+        self.max_in_flight = max_in_flight or settings.FLUME_DELIVERY_MAX_IN_FLIGHT
+        self.max_per_host = max_per_host or settings.FLUME_DELIVERY_MAX_PER_HOST
+        self.timeout = timeout or settings.FLUME_DELIVERY_TIMEOUT_SEC
+        self._slots = Semaphore(self.max_in_flight)
+        self._clients: Dict[str, AsyncClient] = {}
+        self._host_slots: Dict[str, Semaphore] = {}
+        self.errors = 0
+
+    async def __aenter__(self) -> "WebhookDispatcher":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await gather(*(client.aclose() for client in self._clients.values()))
+        self._clients.clear()
+        self._host_slots.clear()
+
+    def _client(self, origin: str) -> AsyncClient:
+        client = self._clients.get(origin)
+        if client is None:
+            limits = Limits(
+                max_connections=self.max_per_host,
+                max_keepalive_connections=self.max_per_host,
+            )
+            client = self._clients[origin] = AsyncClient(
+                timeout=self.timeout, limits=limits
+            )
+            self._host_slots[origin] = Semaphore(self.max_per_host)
+        return client
+
+    async def deliver(
+        self, delivery: Delivery, url: str | None = None
+    ) -> DeliveryResult:
+        """
+        POSTs the delivery to the subscription webhook (or to `url`), signed
+        for the subscriber. Never raises: any error (network, secret store,
+        bad URL) is the error of the result.
+        """
+        start = perf_counter()
+        try:
+            url = url or delivery.subscription.webhook_url
+            parts = urlsplit(url)
+            path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            origin = f"{parts.scheme}://{parts.netloc}"
+            subscriber = delivery.subscription.subscriber
+            if not self.signer.has_token(subscriber):
+                # the secret store blocks: fetch off the event loop
+                await to_thread(self.signer.get_active_kid_and_token, subscriber)
+            client = self._client(origin)
+            async with self._host_slots[origin], self._slots:
+                # signed once a slot is free, so the timestamp is the sending time
+                headers = self.signer.signed_headers_for_subscription(
+                    delivery.subscription, "POST", path, delivery.body
+                )
+                start = perf_counter()
+                response = await client.post(
+                    url, content=delivery.body, headers=headers
+                )
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            return DeliveryResult(delivery, None, error, perf_counter() - start)
+        latency = perf_counter() - start
+        status = response.status_code
+        error = None if 200 <= status < 300 else f"HTTP {status}"
+        return DeliveryResult(delivery, status, error, latency)
+
+    async def deliver_many(
+        self, deliveries: Iterable[Delivery]
+    ) -> List[DeliveryResult]:
+        return list(await gather(*(self.deliver(d) for d in deliveries)))
+
+    async def run(
+        self, queue: "Queue[Delivery]", on_result: Callable[[DeliveryResult], None]
+    ) -> None:
+        """
+        Worker loop: delivers what is put on the queue until cancelled,
+        keeping at most 4 * max_in_flight deliveries taken off the queue.
+        The errors of on_result are logged and counted in `errors`; the
+        deliveries still in flight are cancelled with the loop.
+        """
+        pending: Set[Task] = set()
+
+        async def deliver(delivery: Delivery) -> None:
+            try:
+                on_result(await self.deliver(delivery))
+            finally:
+                queue.task_done()
+
+        def done(task: Task) -> None:
+            pending.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                self.errors += 1
+                c_error(f"Webhook delivery result failed: {task.exception()!r}")
+
+        try:
+            while True:
+                while len(pending) >= 4 * self.max_in_flight:
+                    await wait(pending, return_when=FIRST_COMPLETED)
+                task = create_task(deliver(await queue.get()))
+                pending.add(task)
+                task.add_done_callback(done)
+        finally:
+            for task in pending:
+                task.cancel()
+            await gather(*pending, return_exceptions=True)
@@ -0,0 +1,130 @@
+from asyncio import Queue, create_task, gather, sleep
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from app.common.default.utils import c_error
+from app.models.events import DeliveryCursor, EventDefinition
+from app.services.delivery import Delivery, FanOutService, WebhookDispatcher
+from app.services.eventstore import EVENTS
+from app.services.lanes import DeliveryLanes
+from app.services.retries import RetryScheduler
+
+
+class DeliveryEngine:
+    """
+    Tails the event store of every event definition and delivers the new
+    events to the matching subscriptions: definitions with an ordering key
+    field go through DeliveryLanes, the others straight to the dispatcher
+    worker (WebhookDispatcher.run). Failures become retries of the
+    RetryScheduler the engine ticks, so run one engine per deployment.
+
+    The position in every definition is its DeliveryCursor, moved past a
+    batch of `batch` events once its deliveries are done and the failures
+    stored: after a crash the batch is delivered again, never lost. The
+    store only reads up to its committed watermark (EventStore.read), so
+    an event committed late below the cursor cannot be skipped either.
+    """
+
+    def __init__(
+        self,
+        dispatcher: WebhookDispatcher,
+        retries: RetryScheduler,
+        batch: int | None = None,
+    ):
+        self.dispatcher = dispatcher
+        self.retries = retries
+        self.batch = batch or settings.FLUME_DELIVERY_BATCH
+        self.events = self.deliveries = 0
+
+    @staticmethod
+    def _cursors() -> List[Tuple[EventDefinition, int]]:
+        offsets = dict(DeliveryCursor.objects.values_list("event_id", "offset"))
+        return [(d, offsets.get(d.id, 0)) for d in EventDefinition.objects.all()]
+
+    def _fan_out(
+        self, definition: EventDefinition, since: int
+    ) -> Tuple[List[Delivery], int | None]:
+        """
+        Returns the deliveries of the next batch of events and the offset
+        after it, None when there is no new event.
+        """
+        events = list(EVENTS.read(definition, since, self.batch))
+        if not events:
+            return [], None
+        self.events += len(events)
+        return FanOutService.deliveries(definition, events), events[-1].offset + 1
+
+    @staticmethod
+    def _advance(offsets: Dict[UUID, int]) -> None:
+        for event_id, offset in offsets.items():
+            DeliveryCursor.objects.update_or_create(
+                event_id=event_id, defaults={"offset": offset}
+            )
+
+    @asynccontextmanager
+    async def _running(self) -> AsyncIterator[Tuple[DeliveryLanes, "Queue[Delivery]"]]:
+        queue: "Queue[Delivery]" = Queue(self.batch)
+        async with DeliveryLanes(self.dispatcher, self.retries) as lanes:
+            worker = create_task(self.dispatcher.run(queue, self.retries.failed))
+            try:
+                yield lanes, queue
+            finally:
+                worker.cancel()
+                await gather(worker, return_exceptions=True)
+
+    async def _step(self, lanes: DeliveryLanes, queue: "Queue[Delivery]") -> int:
+        offsets: Dict[UUID, int] = {}
+        events = self.events
+        for definition, since in await sync_to_async(self._cursors)():
+            deliveries, after = await sync_to_async(self._fan_out)(definition, since)
+            if after is None:
+                continue
+            offsets[definition.id] = after
+            for delivery in deliveries:
+                if definition.ordering_key_field:
+                    await lanes.put(delivery)
+                else:
+                    await queue.put(delivery)
+            self.deliveries += len(deliveries)
+        await gather(lanes.join(), queue.join())
+        # the failures are stored as retries before the cursors move past them
+        retried = await self.retries.tick()
+        await sync_to_async(self._advance)(offsets)
+        return self.events - events + retried
+
+    async def step(self) -> int:
+        """
+        Delivers the next batch of every definition, ticks the retries, then
+        moves the cursors.
+
+        Returns:
+            int: The events fanned out and the retries attempted.
+        """
+        async with self._running() as (lanes, queue):
+            return await self._step(lanes, queue)
+
+    async def run_forever(self, every: float) -> None:
+        """
+        Steps until cancelled, every `every` seconds while idle, logging
+        failures instead of dying.
+        """
+        async with self._running() as (lanes, queue):
+            while True:
+                try:
+                    if await self._step(lanes, queue):
+                        continue
+                except Exception as exc:
+                    c_error(f"Event delivery failed: {exc}")
+                await sleep(every)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "events": self.events,
+            "deliveries": self.deliveries,
+            "errors": self.dispatcher.errors,
+            **self.retries.stats(),
+        }
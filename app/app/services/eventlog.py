@@ -0,0 +1,426 @@
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from fcntl import LOCK_EX, LOCK_UN, flock
+from mmap import ACCESS_READ, mmap
+from os import fsync
+from pathlib import Path
+from struct import Struct
+from threading import Lock, RLock
+from time import time
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+from uuid import UUID
+
+from django.conf import settings
+from orjson import dumps
+
+from app.models.events import EventDefinition
+from app.services.eventstore import EventStore, StoredEvent
+
+# payload length, offset, created_at (unix seconds), ordering key length
+FRAME = Struct("<IQdH")
+INDEX_ENTRY = Struct("<QQ")  # offset, position of its frame in the segment
+NO_KEY = 0xFFFF  # ordering key length of the events without one
+# a segment spans at most this fraction of the retention, so expired events
+# are deleted with whole segments at most retention / 10 late
+SEGMENTS_PER_RETENTION = 10
+
+
+def _frames(buf: Any, pos: int, end: int) -> Iterator[Tuple[int, float, int, int, int]]:
+    """
+    Yields (offset, created_at, key position, payload position, end position)
+    of the complete frames in buf[pos:end]. The key position is -1 when the
+    event has no ordering key.
+    """
+    while pos + FRAME.size <= end:
+        length, offset, at, key_len = FRAME.unpack_from(buf, pos)
+        key = pos + FRAME.size
+        start = key + (0 if key_len == NO_KEY else key_len)
+        if start + length > end:
+            return
+        yield offset, at, -1 if key_len == NO_KEY else key, start, start + length
+        pos = start + length
+
+
+class Segment:
+    """
+    One file of an EventLog: frames appended back to back from offset
+    `base`, and a sparse index (the .idx file) with an entry every
+    `index_bytes` written, so reads seek close to any offset instead of
+    scanning the segment.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.index_path = path.with_suffix(".idx")
+        self.base = int(path.stem)
+        self.offsets: List[int] = []
+        self.positions: List[int] = []
+        self.size = 0  # bytes of complete frames
+        self.next_offset = self.base
+        self.first_at: float | None = None
+        self.last_at: float | None = None
+
+    def find(self, offset: int) -> int:
+        """
+        Returns the position of an indexed frame at or before `offset`.
+        """
+        i = bisect_right(self.offsets, offset) - 1
+        return self.positions[i] if i >= 0 else 0
+
+    def recover(self, truncate: bool = False) -> None:
+        """
+        Loads the index and scans from its last entry to the end of the
+        file. With `truncate` (writers only), a frame torn by a crash is cut.
+        """
+        size = self.path.stat().st_size
+        raw = self.index_path.read_bytes() if self.index_path.exists() else b""
+        entries = [
+            INDEX_ENTRY.unpack_from(raw, i)
+            for i in range(0, len(raw) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)
+        ]
+        entries = [(o, p) for o, p in entries if p < size]
+        end, next_offset = entries[-1][::-1] if entries else (0, self.base)
+        first_at, last_at = self.first_at, self.last_at
+        if size:
+            with open(self.path, "rb") as f, mmap(
+                f.fileno(), 0, access=ACCESS_READ
+            ) as buf:
+                if first_at is None and size >= FRAME.size:
+                    first_at = FRAME.unpack_from(buf, 0)[2]
+                for offset, at, _, _, stop in _frames(buf, end, size):
+                    if offset != next_offset:
+                        break  # garbage after a crash
+                    next_offset, end, last_at = offset + 1, stop, at
+        entries = [(o, p) for o, p in entries if p < end]
+        # positions first: lock-free readers bisect offsets
+        self.positions = [p for _, p in entries]
+        self.offsets = [o for o, _ in entries]
+        self.first_at, self.last_at = (first_at, last_at) if end else (None, None)
+        self.next_offset, self.size = next_offset, end
+        if truncate and self.size < size:
+            with open(self.path, "r+b") as f:
+                f.truncate(self.size)
+        if truncate and len(entries) * INDEX_ENTRY.size != len(raw):
+            self.index_path.write_bytes(
+                b"".join(INDEX_ENTRY.pack(o, p) for o, p in entries)
+            )
+
+
+class EventLog:
+    """
+    Append-only log of one event definition: segment files named after
+    their first offset in `path`, rolled once `segment_bytes` big or
+    `roll_every` old, and deleted whole by expire().
+
+    Appends are serialized across processes with flock on path/.lock.
+    Reads take no lock: they mmap the segments and see the frames that
+    were complete when they started.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        segment_bytes: int | None = None,
+        index_bytes: int | None = None,
+        roll_every: timedelta | None = None,
+        sync: bool | None = None,
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes or settings.FLUME_EVENT_LOG_SEGMENT_BYTES
+        self.index_bytes = index_bytes or settings.FLUME_EVENT_LOG_INDEX_BYTES
+        self.roll_every = roll_every
+        self.sync = settings.FLUME_EVENT_LOG_FSYNC if sync is None else sync
+        self._lock = RLock()  # threads of this process, flock covers the others
+        self._lock_file = open(self.path / ".lock", "a+b")
+        self._segments: List[Segment] = []
+        with self._lock:
+            self._refresh()
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        with self._lock:
+            flock(self._lock_file.fileno(), LOCK_EX)
+            try:
+                self._refresh(truncate=True)
+                yield
+            finally:
+                flock(self._lock_file.fileno(), LOCK_UN)
+
+    def _refresh(self, truncate: bool = False) -> None:
+        """
+        Picks up the segments written or deleted by other processes. Only
+        new segments and the last ones can have changed, and only when
+        their size did.
+        """
+        known = {s.base: s for s in self._segments}
+        last = self._segments[-1].base if self._segments else None
+        files = sorted(self.path.glob("*.log"), key=lambda p: int(p.stem))
+        segments: List[Segment] = []
+        for i, file in enumerate(files):
+            segment = known.get(int(file.stem))
+            is_last = i == len(files) - 1
+            if segment is None or segment.base == last or is_last:
+                segment = segment or Segment(file)
+                try:
+                    if file.stat().st_size != segment.size or not segment.size:
+                        segment.recover(truncate and is_last)
+                except FileNotFoundError:
+                    continue  # expired meanwhile
+            segments.append(segment)
+        self._segments = segments
+
+    def _roll(self, now: float) -> Segment:
+        """
+        Returns the segment to append to, starting a new one when the last
+        one is full or too old.
+        """
+        if not self._segments:
+            segment = Segment(self.path / f"{1:020d}.log")
+        else:
+            last = self._segments[-1]
+            too_old = (
+                self.roll_every is not None
+                and last.first_at is not None
+                and now - last.first_at >= self.roll_every.total_seconds()
+            )
+            if not last.size or (last.size < self.segment_bytes and not too_old):
+                return last
+            segment = Segment(self.path / f"{last.next_offset:020d}.log")
+        segment.path.touch()
+        self._segments.append(segment)
+        return segment
+
+    def _write(self, segment: Segment, data: bytearray, index: bytearray) -> None:
+        with open(segment.path, "ab") as f:
+            f.write(data)
+            if self.sync:
+                f.flush()
+                fsync(f.fileno())
+        if index:
+            with open(segment.index_path, "ab") as f:
+                f.write(index)
+        segment.size += len(data)
+
+    def append(
+        self, events: Sequence[Tuple[str | None, bytes]], now: float | None = None
+    ) -> List[int]:
+        """
+        Appends (ordering key, JSON payload) pairs with one write per segment.
+
+        Returns:
+            List[int]: The offset of every event, in order.
+        """
+        if not events:
+            return []
+        now = time() if now is None else now
+        offsets: List[int] = []
+        with self._exclusive():
+            segment = self._roll(now)
+            data, index = bytearray(), bytearray()
+            for key, payload in events:
+                if segment.size + len(data) >= self.segment_bytes:
+                    self._write(segment, data, index)
+                    data, index = bytearray(), bytearray()
+                    segment = self._roll(now)
+                key_bytes = b"" if key is None else key.encode()
+                if len(key_bytes) >= NO_KEY:
+                    raise ValueError("Ordering key too long for the event log")
+                position = segment.size + len(data)
+                offset = segment.next_offset
+                if not segment.positions or (
+                    position - segment.positions[-1] >= self.index_bytes
+                ):
+                    index += INDEX_ENTRY.pack(offset, position)
+                    # positions first: lock-free readers bisect offsets
+                    segment.positions.append(position)
+                    segment.offsets.append(offset)
+                key_len = NO_KEY if key is None else len(key_bytes)
+                data += FRAME.pack(len(payload), offset, now, key_len)
+                data += key_bytes
+                data += payload
+                segment.next_offset = offset + 1
+                if segment.first_at is None:
+                    segment.first_at = now
+                segment.last_at = now
+                offsets.append(offset)
+            self._write(segment, data, index)
+        return offsets
+
+    @staticmethod
+    @contextmanager
+    def _mapped(segment: Segment, size: int) -> Iterator[mmap | None]:
+        """
+        Maps the first `size` bytes of the segment for the block, None when
+        it expired meanwhile.
+        """
+        try:
+            f = open(segment.path, "rb")
+        except FileNotFoundError:
+            yield None
+            return
+        with f, mmap(f.fileno(), size, access=ACCESS_READ) as buf:
+            yield buf
+
+    @staticmethod
+    def _event(buf: mmap, frame: Tuple[int, float, int, int, int]) -> StoredEvent:
+        offset, at, key, start, stop = frame
+        return StoredEvent(
+            offset,
+            None if key < 0 else buf[key:start].decode(),
+            datetime.fromtimestamp(at, dt_timezone.utc),
+            buf[start:stop],
+        )
+
+    def _scan(
+        self, segments: List[Segment], since: int, limit: int | None
+    ) -> Iterator[StoredEvent]:
+        i = max(bisect_right([s.base for s in segments], since) - 1, 0)
+        count = 0
+        for segment in segments[i:]:
+            size = segment.size
+            if not size or segment.next_offset <= since:
+                continue
+            with self._mapped(segment, size) as buf:
+                if buf is None:
+                    continue  # expired meanwhile
+                for frame in _frames(buf, segment.find(since), size):
+                    if frame[0] < since:
+                        continue
+                    yield self._event(buf, frame)
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+
+    def read(self, since: int, limit: int | None = None) -> Iterator[StoredEvent]:
+        """
+        Yields the events from offset `since` (included) on, in offset order.
+        Every segment is mapped while its events are read, and unmapped
+        right after (payloads are copied out of it).
+        """
+        with self._lock:
+            self._refresh()
+            segments = list(self._segments)
+        return self._scan(segments, since, limit)
+
+    def get_many(self, offsets: Iterable[int]) -> Dict[int, StoredEvent]:
+        """
+        Returns the events still stored among `offsets`, by offset: every
+        segment involved is mapped once, and scanned forward from the index
+        entry of each offset.
+        """
+        with self._lock:
+            self._refresh()
+            segments = list(self._segments)
+        bases = [s.base for s in segments]
+        by_segment: Dict[int, List[int]] = {}
+        for offset in sorted(set(offsets)):
+            i = bisect_right(bases, offset) - 1
+            if i >= 0 and offset < segments[i].next_offset:
+                by_segment.setdefault(i, []).append(offset)
+        found: Dict[int, StoredEvent] = {}
+        for i, wanted in by_segment.items():
+            segment, size = segments[i], segments[i].size
+            with self._mapped(segment, size) as buf:
+                if buf is None:
+                    continue  # expired meanwhile
+                pos = 0
+                for offset in wanted:
+                    for frame in _frames(buf, max(pos, segment.find(offset)), size):
+                        if frame[0] == offset:
+                            found[offset] = self._event(buf, frame)
+                            pos = frame[4]  # the next frame
+                        if frame[0] >= offset:
+                            break
+        return found
+
+    def expire(self, before: float, limit: int | None = None) -> Tuple[int, int]:
+        """
+        Deletes the segments whose events are all older than `before` (unix
+        seconds), the last one included: the next append starts a new one.
+        With `limit`, stops once that many events are deleted.
+
+        Returns:
+            Tuple[int, int]: The events and bytes deleted.
+        """
+        events = reclaimed = 0
+        with self._exclusive():
+            for segment in list(self._segments):
+                if limit is not None and events >= limit:
+                    break
+                if (
+                    not segment.size
+                    or segment.last_at is None
+                    or segment.last_at >= before
+                ):
+                    break
+                if segment is self._segments[-1]:
+                    # an empty segment keeps the next offset
+                    empty = Segment(self.path / f"{segment.next_offset:020d}.log")
+                    empty.path.touch()
+                    self._segments.append(empty)
+                for path in (segment.path, segment.index_path):
+                    if path.exists():
+                        reclaimed += path.stat().st_size
+                        path.unlink()
+                events += segment.next_offset - segment.base
+                self._segments.remove(segment)
+        return events, reclaimed
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "segments": len(self._segments),
+            "bytes": sum(s.size for s in self._segments),
+            "next_offset": self._segments[-1].next_offset if self._segments else 1,
+        }
+
+
+class LogEventStore(EventStore):
+    """
+    Keeps the events of every definition in its own EventLog, under
+    `path`/<definition id>. Offsets start at 1 per definition.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self._lock = Lock()
+        self._logs: Dict[UUID, EventLog] = {}
+
+    def log(self, definition: EventDefinition) -> EventLog:
+        with self._lock:
+            log = self._logs.get(definition.id)
+            if log is None:
+                period = definition.retention_period
+                log = self._logs[definition.id] = EventLog(
+                    self.path / str(definition.id),
+                    roll_every=period / SEGMENTS_PER_RETENTION if period else None,
+                )
+        return log
+
+    def append(
+        self,
+        definition: EventDefinition,
+        events: Sequence[Tuple[str | None, Dict[str, Any]]],
+    ) -> List[int]:
+        return self.log(definition).append(
+            [(key, dumps(payload)) for key, payload in events]
+        )
+
+    def read(
+        self, definition: EventDefinition, since: int, limit: int | None = None
+    ) -> Iterator[StoredEvent]:
+        return self.log(definition).read(since, limit)
+
+    def get_many(
+        self, definition: EventDefinition, offsets: Iterable[int]
+    ) -> Dict[int, StoredEvent]:
+        return self.log(definition).get_many(offsets)
+
+    def expire(
+        self, definition: EventDefinition, before: datetime, limit: int
+    ) -> Tuple[int, int]:
+        """
+        Deletes whole segments, so up to a segment more than `limit` events.
+        """
+        return self.log(definition).expire(before.timestamp(), limit)
@@ -0,0 +1,163 @@
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from django.db.models import TextField
+from django.db.models.functions import Cast, Length
+from django.db.transaction import atomic
+from orjson import dumps
+
+from app.models.events import EventDefinition, EventRecord
+from app.models.register import committed_through, hold_until_commit
+
+# advisory lock keys of the EventRecord ids (see models.register): appends
+# hold (_APPENDED, next id) until commit, nobody takes _APPENDING
+_APPENDING = 0x464C5545
+_APPENDED = _APPENDING + 1
+
+
+class StoredEvent(NamedTuple):
+    offset: int  # only grows within an event definition
+    ordering_key: str | None
+    created_at: datetime
+    payload: bytes | memoryview  # JSON
+
+
+class EventStore:
+    """
+    Where published events are kept, per EventDefinition. The base class
+    stores them as EventRecord rows; FLUME_EVENT_STORE = "log" switches to
+    LogEventStore (app.services.eventlog).
+
+    On PostgreSQL the ids come from a sequence and concurrent appends may
+    commit out of order: reads stop at the committed watermark, so a reader
+    moving past an offset never sees a lower one show up later.
+    """
+
+    def __init__(self) -> None:
+        self._sequence: str | None = None
+        self._watermark = 0
+        self._watermark_lock = Lock()
+
+    def _allocated(self, cursor: CursorWrapper) -> int:
+        """
+        Returns the last id taken from the EventRecord sequence (PostgreSQL).
+        """
+        if self._sequence is None:
+            cursor.execute(
+                "SELECT pg_get_serial_sequence(%s, 'id')", [EventRecord._meta.db_table]
+            )
+            self._sequence = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END "
+            f"FROM {self._sequence}"
+        )
+        return int(cursor.fetchone()[0])
+
+    @atomic
+    def append(
+        self,
+        definition: EventDefinition,
+        events: Sequence[Tuple[str | None, Dict[str, Any]]],
+    ) -> List[int]:
+        """
+        Stores (ordering key, payload) pairs with one bulk INSERT.
+
+        Returns:
+            List[int]: The offset of every event, in order.
+        """
+        if connection.vendor == "postgresql":
+            # every id taken next is above it: held until commit, the lock
+            # keeps the committed watermark below the ids of this append
+            with connection.cursor() as cursor:
+                hold_until_commit(cursor, _APPENDED, self._allocated(cursor) + 1)
+        records = EventRecord.objects.bulk_create(
+            EventRecord(event=definition, ordering_key=key, payload=payload)
+            for key, payload in events
+        )
+        return [r.id for r in records]
+
+    def committed(self) -> int | None:
+        """
+        Returns the offset up to which every appended event has committed,
+        None when appends commit in offset order (not PostgreSQL).
+        """
+        if connection.vendor != "postgresql":
+            return None
+        with self._watermark_lock, connection.cursor() as cursor:
+            # read before the locks: an append of a lower id holds one by then
+            allocated = self._allocated(cursor)
+            watermark = committed_through(cursor, allocated, _APPENDING, _APPENDED)
+            if watermark is not None:
+                self._watermark = max(self._watermark, watermark)
+            return self._watermark
+
+    @staticmethod
+    def _stored(record: EventRecord) -> StoredEvent:
+        return StoredEvent(
+            record.id, record.ordering_key, record.created_at, dumps(record.payload)
+        )
+
+    def read(
+        self, definition: EventDefinition, since: int, limit: int | None = None
+    ) -> Iterator[StoredEvent]:
+        """
+        Yields the events from offset `since` (included) on, in offset order,
+        up to the committed watermark.
+        """
+        qs = EventRecord.objects.filter(event=definition, id__gte=since).order_by("id")
+        committed = self.committed()
+        if committed is not None:
+            qs = qs.filter(id__lte=committed)
+        if limit is not None:
+            qs = qs[:limit]
+        for record in qs.iterator(chunk_size=2000):
+            yield self._stored(record)
+
+    def get_many(
+        self, definition: EventDefinition, offsets: Iterable[int]
+    ) -> Dict[int, StoredEvent]:
+        """
+        Returns the events still stored among `offsets`, by offset.
+        """
+        qs = EventRecord.objects.filter(event=definition, id__in=list(offsets))
+        return {r.id: self._stored(r) for r in qs}
+
+    def expire(
+        self, definition: EventDefinition, before: datetime, limit: int
+    ) -> Tuple[int, int]:
+        """
+        Deletes up to `limit` events published before `before`, oldest
+        first, with one short DELETE by primary key.
+
+        Returns:
+            Tuple[int, int]: The events and payload bytes deleted.
+        """
+        rows = list(
+            EventRecord.objects.filter(event=definition, created_at__lt=before)
+            .order_by("created_at")
+            .annotate(size=Length(Cast("payload", TextField())))
+            .values_list("id", "size")[:limit]
+        )
+        if rows:
+            EventRecord.objects.filter(id__in=[i for i, _ in rows]).delete()
+        return len(rows), sum(size or 0 for _, size in rows)
+
+
+def event_store() -> EventStore:
+    if settings.FLUME_EVENT_STORE == "log":
+        from app.services.eventlog import LogEventStore
+
+        return LogEventStore(settings.FLUME_EVENT_LOG_DIR)
+    if settings.FLUME_EVENT_STORE != "db":
+        raise ValueError(f"Unknown FLUME_EVENT_STORE '{settings.FLUME_EVENT_STORE}'")
+    return EventStore()
+
+
+EVENTS = event_store()
+"""
+The event store of this process.
+"""
@@ -0,0 +1,95 @@
+from asyncio import Queue, Task, create_task, gather
+from typing import Callable, List
+from zlib import crc32
+
+from django.conf import settings
+
+from app.common.default.utils import c_error
+from app.services.delivery import Delivery, DeliveryResult, WebhookDispatcher
+from app.services.retries import RetryScheduler
+
+
+class DeliveryLanes:
+    """
+    Partitions deliveries into `lanes` serial lanes by hash of (subscription,
+    ordering key): deliveries of one key go through one lane, one at a time,
+    in the order they were put, while different keys deliver in parallel.
+    Deliveries without an ordering key are spread by offset.
+
+    With a RetryScheduler, a failed delivery keeps its key blocked until it
+    is resolved: the later deliveries of the key are parked behind it
+    instead of overtaking it. The scheduler tracks the blocked keys in
+    memory, so it must be the only one of the deployment and tick in the
+    process of the lanes: DeliveryEngine (deliver_events) does both, and
+    retry_deliveries must not run next to it. A delivery that raises is
+    logged and handed to the scheduler as failed; the lane keeps going.
+    """
+
+    def __init__(
+        self,
+        dispatcher: WebhookDispatcher,
+        retries: RetryScheduler | None = None,
+        lanes: int | None = None,
+        depth: int = 1000,
+        on_result: Callable[[DeliveryResult], None] | None = None,
+    ):
+        self.dispatcher = dispatcher
+        self.retries = retries
+        self.on_result = on_result
+        self._queues: List["Queue[Delivery]"] = [
+            Queue(depth) for _ in range(lanes or settings.FLUME_DELIVERY_LANES)
+        ]
+        self._tasks: List[Task] = []
+
+    async def __aenter__(self) -> "DeliveryLanes":
+        if self.retries is not None:
+            await self.retries.load()
+        self._tasks = [create_task(self._lane(q)) for q in self._queues]
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def lane_of(self, delivery: Delivery) -> int:
+        if delivery.ordering_key is None:
+            return delivery.offset % len(self._queues)
+        key = f"{delivery.subscription.id}:{delivery.ordering_key}"
+        return crc32(key.encode()) % len(self._queues)
+
+    async def put(self, delivery: Delivery) -> None:
+        """
+        Queues the delivery on its lane, waiting while the lane is full.
+        """
+        await self._queues[self.lane_of(delivery)].put(delivery)
+
+    async def join(self) -> None:
+        """
+        Waits until every queued delivery is done (delivered, failed or parked).
+        """
+        await gather(*(q.join() for q in self._queues))
+
+    async def _lane(self, queue: "Queue[Delivery]") -> None:
+        while True:
+            delivery = await queue.get()
+            held = False
+            try:
+                if self.retries is not None and self.retries.is_blocked(delivery):
+                    self.retries.park(delivery)
+                    continue
+                result = await self.dispatcher.deliver(delivery)
+                if self.retries is not None:
+                    held = True
+                    self.retries.failed(result)
+                if self.on_result is not None:
+                    self.on_result(result)
+            except Exception as exc:
+                c_error(f"Delivery lane failed at offset {delivery.offset}: {exc!r}")
+                if self.retries is not None and not held:
+                    # retried like a failed attempt, so its key stays blocked
+                    error = f"{type(exc).__name__}: {exc}"
+                    self.retries.failed(DeliveryResult(delivery, None, error, 0.0))
+            finally:
+                queue.task_done()
@@ -0,0 +1,372 @@
+from array import array
+from atexit import register as at_exit
+from datetime import datetime, UTC
+from threading import Lock, Thread
+from time import sleep, time
+from typing import Dict, Iterable, List, Set, Tuple
+from uuid import UUID
+
+from django.conf import settings
+
+from django.db.models import Case, F, Q, Value, When
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from app.common.default.utils import c_error
+from app.models.register import RegistryChange, RegistryState
+from app.models.services import ServiceInstance
+from app.services.registry import RegistryService
+
+UNKNOWN = "UNKNOWN"
+"""
+Status reported for heartbeats of instances the ledger does not know
+(never registered or already deregistered): the client must register again.
+"""
+
+
+class LeaseService:
+    """
+    Refreshes instance leases (last_heartbeat_at / consecutive_miss).
+    """
+
+    @staticmethod
+    @atomic
+    def beat_many(
+        instance_ids: Iterable[UUID],
+        node_id: str | None = None,
+        now: datetime | None = None,
+        service_id: UUID | None = None,
+    ) -> Tuple[List[Tuple[UUID, str]], int]:
+        """
+        Refreshes the leases of many instances with a single UPDATE.
+
+        Instances that were DOWN come back UP; DRAIN is left untouched.
+        The registry is bumped once if at least one instance changed status.
+        last_heartbeat_at never moves backwards, so late flushes are harmless.
+
+        Args:
+            instance_ids (Iterable[UUID]): The instances that are beating.
+            node_id (str | None): If set, restricts the beat to this node. When
+                no instance_ids are given, every instance on the node beats.
+            now (datetime | None): The heartbeat time, defaults to now.
+            service_id (UUID | None): If set, restricts the beat to the
+                instances of this service (the one of the signer).
+
+        Returns:
+            Tuple[List[Tuple[UUID, str]], int]: (instance_id, status) for every
+                requested instance and the current registry version.
+        """
+        now = now or timezone.now()
+        requested = list(dict.fromkeys(instance_ids))
+
+        qs = ServiceInstance.objects.all()
+        if requested:
+            qs = qs.filter(instance_id__in=requested)
+        if service_id is not None:
+            qs = qs.filter(service_id=service_id)
+        if node_id is not None:
+            qs = qs.filter(node_id=node_id)
+        elif not requested:
+            return [], RegistryState.current()
+
+        known: Dict[UUID, str] = dict(qs.values_list("instance_id", "status"))
+        if not known:
+            return [(i, UNKNOWN) for i in requested], RegistryState.current()
+
+        ServiceInstance.objects.filter(
+            Q(last_heartbeat_at__isnull=True) | Q(last_heartbeat_at__lt=now),
+            instance_id__in=list(known),
+        ).update(
+            last_heartbeat_at=now,
+            consecutive_miss=0,
+            status=Case(
+                When(
+                    status=ServiceInstance.Status.DOWN,
+                    then=Value(ServiceInstance.Status.UP),
+                ),
+                default=F("status"),
+            ),
+        )
+        revived = [i for i, s in known.items() if s == ServiceInstance.Status.DOWN]
+        for instance_id in revived:
+            known[instance_id] = ServiceInstance.Status.UP
+        version = RegistryState.maybe_bump(
+            bool(revived),
+            RegistryService.instance_changes(
+                ServiceInstance.objects.filter(instance_id__in=revived)
+            )
+            if revived
+            else (),
+        )
+
+        order = requested or list(known)
+        return [(i, known.get(i, UNKNOWN)) for i in order], version
+
+
+_STATUSES: Tuple[str, ...] = tuple(ServiceInstance.Status.values)
+
+
+class LeaseTable:
+    """
+    Process-local lease table with write-behind persistence.
+
+    Heartbeats of known instances are absorbed in memory and flushed to
+    ServiceInstance.last_heartbeat_at every `flush_interval` seconds, grouped
+    per second so a flush costs a handful of UPDATEs whatever the fleet size.
+
+    Staleness: the DB lags the real heartbeats by at most `flush_interval`
+    (plus the flush time). A crash loses at most that window, which is safe as
+    long as it is shorter than the lease TTL; after a restart the table is
+    empty and every first heartbeat goes through the DB path again.
+
+    Status transitions are never decided here: flushes go through
+    LeaseService.beat_many, which revives DOWN instances and bumps the
+    registry, and evicts instances the ledger no longer knows. The statuses
+    answered from memory follow the registry change log: whenever a beat
+    sees a new registry version, the INSTANCE changes since the last one
+    seen are applied (e.g. the reaper setting an instance DOWN or DRAIN),
+    so they are never older than the registry version returned with them.
+    """
+
+    __slots__ = (
+        "flush_interval",
+        "_background",
+        "_lock",
+        "_index",
+        "_ids",
+        "_beats",
+        "_status",
+        "_dirty",
+        "_free",
+        "_flusher",
+        "_synced",
+        "_syncing",
+    )
+
+    def __init__(self, flush_interval: float, background: bool = True):
+        self.flush_interval = flush_interval
+        self._background = background
+        self._lock = Lock()
+        self._index: Dict[UUID, int] = {}
+        self._ids: List[UUID | None] = []
+        self._beats = array("d")  # last heartbeat, epoch seconds
+        self._status = bytearray()  # index into _STATUSES
+        self._dirty: Set[int] = set()
+        self._free: List[int] = []
+        self._flusher: Thread | None = None
+        self._synced: int | None = None  # registry version of the statuses
+        self._syncing = Lock()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def beat_many(
+        self,
+        instance_ids: Iterable[UUID],
+        node_id: str | None = None,
+        service_id: UUID | None = None,
+    ) -> Tuple[List[Tuple[UUID, str]], int]:
+        """
+        Same contract as LeaseService.beat_many, but known instances are only
+        touched in memory. Unknown instances and node or service scoped beats
+        go to the DB.
+        """
+        requested = list(dict.fromkeys(instance_ids))
+        if node_id is not None or service_id is not None or self.flush_interval <= 0:
+            results, version = LeaseService.beat_many(
+                requested, node_id=node_id, service_id=service_id
+            )
+            self._remember(results)
+            return results, version
+
+        now = time()
+        statuses: Dict[UUID, str] = {}
+        misses: List[UUID] = []
+        with self._lock:
+            for instance_id in requested:
+                slot = self._index.get(instance_id)
+                if slot is None:
+                    misses.append(instance_id)
+                    continue
+                self._beats[slot] = now
+                self._dirty.add(slot)
+                statuses[instance_id] = _STATUSES[self._status[slot]]
+
+        if misses:
+            results, version = LeaseService.beat_many(misses)
+            self._remember(results)
+            statuses.update(results)
+        else:
+            version = RegistryState.current()
+        if self._sync(version):
+            with self._lock:
+                for instance_id in statuses:
+                    slot = self._index.get(instance_id)
+                    if slot is not None:
+                        statuses[instance_id] = _STATUSES[self._status[slot]]
+        self._ensure_flusher()
+        return [(i, statuses[i]) for i in requested], version
+
+    def _sync(self, version: int) -> bool:
+        """
+        Applies the instance status changes logged up to `version`.
+
+        Returns:
+            bool: True if cached statuses may have changed.
+        """
+        if self._synced is not None and version <= self._synced:
+            return False
+        if not self._syncing.acquire(blocking=False):
+            return False  # another thread is catching up
+        try:
+            since = self._synced
+            if since is None:
+                # nothing is cached yet that the log could contradict
+                self._synced = version
+                return False
+            changed = False
+            while since < version:
+                change_set = RegistryService.changes_since(since)
+                if change_set.resync:
+                    with self._lock:
+                        self._forget()
+                    since = RegistryState.current()
+                    changed = True
+                    break
+                if change_set.registry_version <= since:
+                    break
+                changed |= self._apply(change_set.changes)
+                since = change_set.registry_version
+                if not change_set.more:
+                    break
+            self._synced = since
+            return changed
+        finally:
+            self._syncing.release()
+
+    def _apply(self, changes: Iterable[RegistryChange]) -> bool:
+        changed = False
+        with self._lock:
+            for change in changes:
+                if change.kind != RegistryChange.Kind.INSTANCE:
+                    continue
+                instance_id = UUID(change.object_id)
+                slot = self._index.get(instance_id)
+                if slot is None:
+                    continue
+                changed = True
+                status = change.data.get("status")
+                if change.op == RegistryChange.Op.DELETE or status not in _STATUSES:
+                    self._evict(instance_id, slot)
+                else:
+                    self._status[slot] = _STATUSES.index(status)
+        return changed
+
+    def _evict(self, instance_id: UUID, slot: int) -> None:
+        """
+        Forgets an instance: its next heartbeat goes through the DB. Call it
+        holding _lock.
+        """
+        del self._index[instance_id]
+        self._ids[slot] = None
+        self._dirty.discard(slot)
+        self._free.append(slot)
+
+    def _forget(self) -> None:
+        """
+        Forgets every instance that has no heartbeat waiting for a flush.
+        Call it holding _lock.
+        """
+        for instance_id, slot in list(self._index.items()):
+            if slot not in self._dirty:
+                self._evict(instance_id, slot)
+
+    def flush(self) -> int:
+        """
+        Persists the absorbed heartbeats.
+
+        Every group is tried even if an earlier one fails; the instances of
+        the failed groups stay dirty for the next flush, and the first error
+        is raised at the end.
+
+        Returns:
+            int: The number of instances flushed.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            by_second: Dict[int, List[UUID]] = {}
+            for slot in dirty:
+                instance_id = self._ids[slot]
+                if instance_id is not None:
+                    by_second.setdefault(int(self._beats[slot]), []).append(instance_id)
+
+        flushed = 0
+        error: Exception | None = None
+        for second, ids in sorted(by_second.items()):
+            try:
+                results, _ = LeaseService.beat_many(
+                    ids, now=datetime.fromtimestamp(second, tz=UTC)
+                )
+            except Exception as exc:
+                # keep them dirty, the next flush will retry
+                with self._lock:
+                    self._dirty.update(self._index[i] for i in ids if i in self._index)
+                error = error or exc
+                continue
+            self._remember(results)
+            flushed += len(ids)
+        if error is not None:
+            raise error
+        return flushed
+
+    def _remember(self, results: Iterable[Tuple[UUID, str]]) -> None:
+        """
+        Records the statuses coming from the DB, evicting unknown instances.
+        """
+        with self._lock:
+            for instance_id, status in results:
+                slot = self._index.get(instance_id)
+                if status == UNKNOWN:
+                    if slot is not None:
+                        self._evict(instance_id, slot)
+                    continue
+                code = _STATUSES.index(status)
+                if slot is not None:
+                    self._status[slot] = code
+                elif self._free:
+                    slot = self._free.pop()
+                    self._ids[slot] = instance_id
+                    self._beats[slot] = 0.0
+                    self._status[slot] = code
+                    self._index[instance_id] = slot
+                else:
+                    self._index[instance_id] = len(self._ids)
+                    self._ids.append(instance_id)
+                    self._beats.append(0.0)
+                    self._status.append(code)
+
+    def _ensure_flusher(self) -> None:
+        if not self._background or self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = Thread(
+                target=self._run, name="flume-lease-flusher", daemon=True
+            )
+            self._flusher.start()
+        at_exit(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as exc:
+                c_error(f"Lease flush failed: {exc}")
+
+
+LEASES = LeaseTable(settings.FLUME_LEASE_FLUSH_INTERVAL_SEC)
+"""
+The lease table of this worker process.
+"""
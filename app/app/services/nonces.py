@@ -0,0 +1,197 @@
+from hashlib import blake2b
+from threading import Lock
+from time import time
+from typing import Dict, List, Set
+from uuid import UUID
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.transaction import atomic
+
+from app.models.services import NonceSeen
+
+
+class BloomFilter:
+    """
+    Fixed-size set of strings with false positives (never false negatives):
+    `bits` bits and `hashes` probes per key, by double hashing one blake2b.
+    """
+
+    __slots__ = ("bits", "hashes", "_array")
+
+    def __init__(self, bits: int, hashes: int = 4):
+        self.bits = max(bits, 8)
+        self.hashes = hashes
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _probes(self, key: str) -> List[int]:
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        array = self._array
+        return all(array[p >> 3] & (1 << (p & 7)) for p in self._probes(key))
+
+    def add(self, key: str) -> None:
+        array = self._array
+        for p in self._probes(key):
+            array[p >> 3] |= 1 << (p & 7)
+
+
+class NonceStore:
+    """
+    Replay protection for signed requests: remembers the nonces of a scope
+    (the ServiceInstance) only as long as their X-Timestamp is accepted,
+    `window` seconds either side of now. Nonces are kept in one set per
+    `bucket_s` seconds of timestamp; a replay carries the same (signed)
+    timestamp, so it is looked up in one bucket, and whole buckets are
+    dropped once they leave the window. With `bloom_bits`, every bucket is
+    a Bloom filter of that many bits instead: memory stays flat at any
+    rate, and a fresh nonce is rejected as a replay with a small false
+    positive rate.
+
+    The base class keeps the nonces in this process; DbNonceStore shares
+    them between workers.
+    """
+
+    def __init__(self, window: float, bucket_s: float, bloom_bits: int = 0):
+        self.window = window
+        self.bucket_s = bucket_s
+        self.bloom_bits = bloom_bits
+        self._lock = Lock()
+        self._buckets: Dict[int, Set[str] | BloomFilter] = {}
+        self._oldest = 0  # first bucket still inside the window
+        self.accepted = self.replays = self.expired = 0
+
+    def bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_s)
+
+    def _rotate(self, now: float) -> bool:
+        """
+        Drops the buckets that left the window. Call it holding _lock.
+
+        Returns:
+            bool: True if the window moved past at least one bucket.
+        """
+        oldest = self.bucket(now - self.window)
+        if oldest <= self._oldest:
+            return False
+        self._oldest = oldest
+        for bucket in [b for b in self._buckets if b < oldest]:
+            del self._buckets[bucket]
+        return True
+
+    def _claim(self, key: str, bucket: int, now: float) -> bool:
+        with self._lock:
+            self._rotate(now)
+            seen = self._buckets.get(bucket)
+            if seen is None:
+                seen = self._buckets[bucket] = (
+                    BloomFilter(self.bloom_bits) if self.bloom_bits else set()
+                )
+            if key in seen:
+                return False
+            seen.add(key)
+            return True
+
+    def claim(
+        self, scope: UUID | str, nonce: str, timestamp: float, now: float | None = None
+    ) -> bool:
+        """
+        Records the nonce of a signed request.
+
+        Returns:
+            bool: False if the timestamp is outside the window or the nonce
+                was already used by the scope with it (a replay).
+        """
+        now = time() if now is None else now
+        if abs(now - timestamp) > self.window:
+            self.expired += 1
+            return False
+        if not self._claim(f"{scope}\n{nonce}", self.bucket(timestamp), now):
+            self.replays += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            held = sum(
+                len(b) for b in self._buckets.values() if not isinstance(b, BloomFilter)
+            )
+            return {
+                "buckets": len(self._buckets),
+                "nonces": held,
+                "accepted": self.accepted,
+                "replays": self.replays,
+                "expired": self.expired,
+            }
+
+
+class DbNonceStore(NonceStore):
+    """
+    NonceStore shared between workers as NonceSeen rows, partitioned by
+    bucket: a nonce is one INSERT, its replay a unique violation, and the
+    buckets that left the window go with one range DELETE on the leading
+    column of the unique index. The in-process buckets stay in front, so a
+    replay to the same worker never reaches the database.
+    """
+
+    def __init__(self, window: float, bucket_s: float, bloom_bits: int = 0):
+        super().__init__(window, bucket_s, bloom_bits)
+        self.purged = 0
+
+    def purge(self, now: float | None = None) -> int:
+        """
+        Deletes the nonces of the buckets that left the window.
+        """
+        now = time() if now is None else now
+        deleted, _ = NonceSeen.objects.filter(
+            bucket__lt=self.bucket(now - self.window)
+        ).delete()
+        self.purged += deleted
+        return deleted
+
+    def claim(
+        self, scope: UUID | str, nonce: str, timestamp: float, now: float | None = None
+    ) -> bool:
+        now = time() if now is None else now
+        with self._lock:
+            rotated = self._rotate(now)
+        if rotated:
+            self.purge(now)
+        if not super().claim(scope, nonce, timestamp, now):
+            return False
+        try:
+            with atomic():
+                NonceSeen.objects.create(
+                    service_instance_id=scope,
+                    nonce=nonce,
+                    bucket=self.bucket(timestamp),
+                )
+        except IntegrityError:
+            self.accepted -= 1
+            self.replays += 1  # seen by another worker
+            return False
+        return True
+
+
+def nonce_store() -> NonceStore:
+    options = (
+        settings.FLUME_NONCE_WINDOW_SEC,
+        settings.FLUME_NONCE_BUCKET_SEC,
+        settings.FLUME_NONCE_BLOOM_BITS,
+    )
+    if settings.FLUME_NONCE_STORE == "db":
+        return DbNonceStore(*options)
+    if settings.FLUME_NONCE_STORE != "memory":
+        raise ValueError(f"Unknown FLUME_NONCE_STORE '{settings.FLUME_NONCE_STORE}'")
+    return NonceStore(*options)
+
+
+NONCES = nonce_store()
+"""
+The nonce replay store of this process.
+"""
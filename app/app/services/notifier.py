@@ -0,0 +1,122 @@
+from asyncio import (
+    AbstractEventLoop,
+    Event,
+    Task,
+    get_running_loop,
+    shield,
+    sleep,
+    wait_for,
+)
+from time import monotonic
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from app.common.default.utils import c_error
+from app.models.register import RegistryState
+
+
+class RegistryNotifier:
+    """
+    Wakes up coroutines waiting for the registry to move past a version.
+
+    One notifier per worker: a single poller task reads RegistryState every
+    `poll_interval` seconds while somebody is waiting, whatever the number
+    of waiters, and wakes them all through a shared Event. Concurrent reads
+    share the one in flight.
+    """
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self.version = 0
+        self._polled_at = float("-inf")
+        self._waiters = 0
+        self._loop: AbstractEventLoop | None = None
+        self._changed: Event | None = None
+        self._poller: Task | None = None
+        self._polling: Task | None = None
+
+    def _bind(self) -> Event:
+        loop = get_running_loop()
+        if self._loop is not loop or self._changed is None:
+            self._loop, self._changed = loop, Event()
+            self._poller = self._polling = None
+        return self._changed
+
+    async def _read(self) -> None:
+        version = await sync_to_async(RegistryState.current)()
+        self._polled_at = monotonic()
+        if version != self.version:
+            self.version = version
+            changed, self._changed = self._bind(), Event()
+            changed.set()
+
+    def _polled(self, polling: Task) -> None:
+        if self._polling is polling:
+            self._polling = None
+        if not polling.cancelled():
+            polling.exception()  # raised to the callers awaiting it
+
+    async def _poll(self) -> None:
+        """
+        Reads the registry version, or waits for the read in flight.
+        """
+        self._bind()
+        polling = self._polling
+        if polling is None:
+            polling = self._polling = get_running_loop().create_task(self._read())
+            polling.add_done_callback(self._polled)
+        # a cancelled caller does not cancel the read of the others
+        await shield(polling)
+
+    async def _run(self) -> None:
+        while self._waiters:
+            await sleep(self.poll_interval)
+            try:
+                await self._poll()
+            except Exception as exc:
+                c_error(f"Registry poll failed: {exc}")
+        self._poller = None
+
+    async def current(self) -> int:
+        """
+        Returns the registry version, read from the DB at most once per
+        poll interval.
+        """
+        self._bind()
+        if monotonic() - self._polled_at >= self.poll_interval:
+            await self._poll()
+        return self.version
+
+    async def wait_past(self, version: int, timeout: float) -> int:
+        """
+        Waits until the registry version is greater than `version`.
+
+        Returns:
+            int: The current version (still `version` or lower on timeout).
+        """
+        deadline = monotonic() + timeout
+        current = await self.current()
+        self._waiters += 1
+        try:
+            while current <= version:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                changed = self._bind()
+                if self._poller is None:
+                    self._poller = get_running_loop().create_task(self._run())
+                try:
+                    await wait_for(changed.wait(), remaining)
+                except TimeoutError:
+                    break
+                current = self.version
+        finally:
+            self._waiters -= 1
+        return current
+
+
+NOTIFIER = RegistryNotifier(settings.FLUME_WATCH_POLL_SEC)
+"""
+The registry notifier of this worker process.
+"""
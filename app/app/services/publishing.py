@@ -0,0 +1,79 @@
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+from django.db.transaction import atomic
+from django.http import Http404
+from ninja.errors import HttpError
+
+from app.models.events import EventDefinition
+from app.services.eventstore import EVENTS
+from app.services.validators import VALIDATORS
+
+
+class PublishResult(NamedTuple):
+    offset: int | None  # offset of the stored event, None when rejected
+    error: str | None
+
+
+class PublishService:
+    """
+    Validates published events against their definition and stores them.
+    """
+
+    @staticmethod
+    def definition(
+        event_key: str, major: int, publisher: str | None = None
+    ) -> EventDefinition:
+        """
+        Returns the event definition, the publisher is only needed when two
+        services define the same event_key and major.
+        """
+        qs = EventDefinition.objects.filter(event_key=event_key, major=major)
+        if publisher is not None:
+            qs = qs.filter(publisher__name=publisher)
+        definitions = list(qs[:2])
+        if not definitions:
+            raise Http404(f"Event {event_key}@v{major} not found")
+        if len(definitions) > 1:
+            raise HttpError(400, f"Event {event_key}@v{major} needs a publisher")
+        return definitions[0]
+
+    @staticmethod
+    def validate(definition: EventDefinition, payload: Dict[str, Any]) -> str | None:
+        """
+        Returns why the payload does not match the definition schema, if it does not.
+        """
+        return VALIDATORS.validate(
+            definition.version_hash, definition.payload_schema, payload
+        )
+
+    @staticmethod
+    @atomic
+    def publish(
+        definition: EventDefinition, payloads: Sequence[Dict[str, Any]]
+    ) -> List[PublishResult]:
+        """
+        Stores the valid payloads in one append to the event store.
+
+        Returns:
+            List[PublishResult]: The result of every payload, in order.
+        """
+        errors: List[str | None] = []
+        events: List[Tuple[str | None, Dict[str, Any]]] = []
+        for payload in payloads:
+            error = PublishService.validate(definition, payload)
+            errors.append(error)
+            if error is not None:
+                continue
+            ordering_key = None
+            if definition.ordering_key_field:
+                value = payload.get(definition.ordering_key_field)
+                ordering_key = None if value is None else str(value)
+            events.append((ordering_key, payload))
+
+        stored = iter(EVENTS.append(definition, events))
+        return [
+            PublishResult(next(stored), None)
+            if error is None
+            else PublishResult(None, error)
+            for error in errors
+        ]
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+from threading import Thread
+from time import sleep
+from typing import Dict, List, Tuple
+from uuid import UUID
+
+from django.conf import settings
+from django.db.transaction import atomic, on_commit
+from django.utils import timezone
+
+from app.common.default.utils import c_error
+from app.models.register import RegistryState
+from app.models.services import ServiceInstance
+from app.services.registry import RegistryService
+
+
+class LeaseReaper:
+    """
+    Marks instances that stopped beating: every missed heartbeat interval
+    increments consecutive_miss, after `misses` of them the instance is DOWN.
+
+    A sweep only looks at the leases that expired since the previous sweep:
+    for every heartbeat interval I and miss level m it updates the rows whose
+    last_heartbeat_at fell in [prev - m*I - grace, now - m*I - grace), a range
+    scan on the last_heartbeat_at index. The cost is O(expired), not O(fleet).
+    Instances that never beat (no last_heartbeat_at) go DOWN once their
+    whole lease has passed since they were created.
+
+    The windows only move forward when the sweep commits: a failed sweep is
+    rolled back and its leases are looked at again by the next one.
+    """
+
+    def __init__(self, misses: int, grace_sec: float, refresh_every: int = 30):
+        self.misses = misses
+        self.grace = timedelta(seconds=grace_sec)
+        self.refresh_every = refresh_every
+        # heartbeat interval -> time of the last sweep that covered it
+        self._since: Dict[int, datetime | None] = {}
+        self._sweeps = 0
+
+    def _intervals(self) -> List[int]:
+        """
+        The heartbeat intervals in use, re-read every `refresh_every` sweeps.
+        A new interval starts with an unbounded window so nothing is skipped.
+        """
+        if self._sweeps % self.refresh_every == 0:
+            in_use = (
+                ServiceInstance.objects.exclude(status=ServiceInstance.Status.DOWN)
+                .values_list("heartbeat_interval_sec", flat=True)
+                .distinct()
+            )
+            for interval in in_use:
+                self._since.setdefault(interval, None)
+        self._sweeps += 1
+        return list(self._since)
+
+    @atomic
+    def sweep(self, now: datetime | None = None) -> Tuple[int, int, int]:
+        """
+        Runs one sweep.
+
+        Returns:
+            Tuple[int, int, int]: missed leases, instances marked DOWN and the
+                registry version (bumped once if anything went DOWN).
+        """
+        now = now or timezone.now()
+        missed = 0
+        down_ids: List[UUID] = []
+        swept: Dict[int, datetime | None] = {}
+        for interval in self._intervals():
+            since = self._since[interval]
+            lease = timedelta(seconds=interval * self.misses) + self.grace
+            never_beat = list(
+                ServiceInstance.objects.filter(
+                    heartbeat_interval_sec=interval,
+                    last_heartbeat_at__isnull=True,
+                    created_at__lt=now - lease,
+                )
+                .exclude(status=ServiceInstance.Status.DOWN)
+                .values_list("instance_id", flat=True)
+            )
+            if never_beat:
+                missed += ServiceInstance.objects.filter(
+                    instance_id__in=never_beat
+                ).update(
+                    consecutive_miss=self.misses, status=ServiceInstance.Status.DOWN
+                )
+                down_ids.extend(never_beat)
+            # highest level first, so a long overdue lease goes DOWN at once
+            for level in range(self.misses, 0, -1):
+                lag = timedelta(seconds=interval * level) + self.grace
+                qs = ServiceInstance.objects.filter(
+                    heartbeat_interval_sec=interval,
+                    consecutive_miss__lt=level,
+                    last_heartbeat_at__lt=now - lag,
+                ).exclude(status=ServiceInstance.Status.DOWN)
+                if since is not None:
+                    qs = qs.filter(last_heartbeat_at__gte=since - lag)
+                if level == self.misses:
+                    ids = list(qs.values_list("instance_id", flat=True))
+                    updated = ServiceInstance.objects.filter(
+                        instance_id__in=ids
+                    ).update(consecutive_miss=level, status=ServiceInstance.Status.DOWN)
+                    down_ids.extend(ids)
+                else:
+                    updated = qs.update(consecutive_miss=level)
+                missed += updated
+            swept[interval] = now
+        on_commit(lambda: self._since.update(swept))
+        version = RegistryState.maybe_bump(
+            bool(down_ids),
+            RegistryService.instance_changes(
+                ServiceInstance.objects.filter(instance_id__in=down_ids)
+            )
+            if down_ids
+            else (),
+        )
+        return missed, len(down_ids), version
+
+    def run_forever(self, every: float) -> None:
+        """
+        Sweeps every `every` seconds, logging failures instead of dying.
+        """
+        while True:
+            try:
+                self.sweep()
+            except Exception as exc:
+                c_error(f"Lease sweep failed: {exc}")
+            sleep(every)
+
+
+REAPER = LeaseReaper(
+    misses=settings.FLUME_LEASE_MISSES,
+    # leases in the DB can lag up to one write-behind flush
+    grace_sec=settings.FLUME_LEASE_FLUSH_INTERVAL_SEC + 1,
+)
+"""
+The lease reaper of this process.
+"""
+
+
+def start_in_process_reaper() -> None:
+    """
+    Starts REAPER in a daemon thread when FLUME_REAPER_IN_PROCESS is set.
+    Enable it on one replica only, or run `manage.py reap_leases --loop`.
+    """
+    if not settings.FLUME_REAPER_IN_PROCESS:
+        return
+    Thread(
+        target=REAPER.run_forever,
+        args=(settings.FLUME_REAPER_EVERY_SEC,),
+        name="flume-lease-reaper",
+        daemon=True,
+    ).start()
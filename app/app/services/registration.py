@@ -0,0 +1,232 @@
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+from uuid import UUID, uuid4
+
+from django.db import connection
+from django.db.transaction import atomic
+from django.http import Http404
+from django.utils import timezone
+
+from app.models.register import RegistryChange, RegistryState
+from app.models.services import Service, ServiceInstance
+from app.schemas.req.flume import RegisterRequest
+from app.services.registry import RegistryService
+
+# instances per INSERT, keeps the bound parameters under the SQLite limit
+UPSERT_CHUNK = 500
+# columns overwritten when an instance registers again on the same slot
+VOLATILE = ("base_url", "health_url", "heartbeat_interval_sec", "meta", "status")
+# taken from the new registration, without moving the registry version
+REFRESHED = ("boot_id", "last_heartbeat_at", "consecutive_miss", "push_kid")
+INSERTED = (
+    "instance_id",
+    "service_id",
+    "node_id",
+    "task_slot",
+    *REFRESHED,
+    *VOLATILE,
+    "created_at",
+    "updated_at",
+)
+
+
+class Registration(NamedTuple):
+    service_id: UUID
+    instance_id: UUID
+    push_kid: str
+    # base_url, health_url, interval, meta or status differ from the last time
+    changed: bool
+
+
+class RegistrationService:
+    """
+    Registers instances with a single INSERT ... ON CONFLICT on the
+    (service, node_id, task_slot) slot, so a restarted replica keeps its
+    instance_id and an unchanged one does not move the registry version.
+    """
+
+    @staticmethod
+    def _row(service: Service, data: RegisterRequest, now: datetime) -> Dict[str, Any]:
+        meta = data.meta
+        return {
+            "instance_id": uuid4(),
+            "service_id": service.service_id,
+            "node_id": meta.node_id if meta else None,
+            "task_slot": meta.task_slot if meta else None,
+            "boot_id": meta.boot_id if meta else None,
+            "last_heartbeat_at": now,
+            "consecutive_miss": 0,
+            "base_url": str(data.base_url),
+            "health_url": str(data.health_url or data.base_url),
+            "heartbeat_interval_sec": data.heartbeat_interval_sec,
+            "meta": {"zone": meta.zone, "weight": meta.weight} if meta else {},
+            "status": ServiceInstance.Status.UP,
+            "push_kid": service.active_kid,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    @staticmethod
+    def _key(row: Dict[str, Any]) -> Tuple[Any, ...]:
+        """
+        The identity of a row in the upsert: its slot when it has one,
+        otherwise the instance_id generated for it.
+        """
+        if row["node_id"] is not None and row["task_slot"] is not None:
+            return (row["service_id"], row["node_id"], row["task_slot"])
+        return (row["instance_id"],)
+
+    @staticmethod
+    def _upsert_sql(rows: int) -> str:
+        """
+        Returns the upsert for `rows` rows. updated_at only moves when a
+        volatile column changes, which is how RETURNING tells changed rows.
+        Needs PostgreSQL or SQLite >= 3.39 (RETURNING, IS DISTINCT FROM).
+        """
+        qn = connection.ops.quote_name
+        table = qn(ServiceInstance._meta.db_table)
+        columns = ", ".join(qn(c) for c in INSERTED)
+        values = ", ".join(["(" + ", ".join(["%s"] * len(INSERTED)) + ")"] * rows)
+        distinct = " OR ".join(
+            f"{table}.{qn(c)} IS DISTINCT FROM excluded.{qn(c)}" for c in VOLATILE
+        )
+        assignments = ", ".join(
+            f"{qn(c)} = excluded.{qn(c)}" for c in (*VOLATILE, *REFRESHED)
+        )
+        returning = ", ".join(
+            qn(c) for c in ("instance_id", "service_id", "node_id", "task_slot")
+        )
+        return (
+            f"INSERT INTO {table} ({columns}) VALUES {values} "
+            f"ON CONFLICT ({qn('service_id')}, {qn('node_id')}, {qn('task_slot')}) "
+            f"WHERE {qn('node_id')} IS NOT NULL AND {qn('task_slot')} IS NOT NULL "
+            f"DO UPDATE SET {assignments}, {qn('updated_at')} = CASE WHEN {distinct} "
+            f"THEN excluded.{qn('updated_at')} ELSE {table}.{qn('updated_at')} END "
+            f"RETURNING {returning}, {qn('push_kid')}, {qn('updated_at')} = %s"
+        )
+
+    @staticmethod
+    def _upsert(
+        rows: List[Dict[str, Any]], now: datetime
+    ) -> Dict[Tuple[Any, ...], Registration]:
+        """
+        Upserts the rows in one statement.
+
+        Returns:
+            Dict[Tuple[Any, ...], Registration]: The registrations by row key.
+        """
+        fields = {
+            c: ServiceInstance._meta.get_field("service" if c == "service_id" else c)
+            for c in INSERTED
+        }
+        params: List[Any] = []
+        for row in rows:
+            params.extend(
+                fields[c].get_db_prep_save(row[c], connection) for c in INSERTED
+            )
+        params.append(fields["updated_at"].get_db_prep_save(now, connection))
+        with connection.cursor() as cursor:
+            cursor.execute(RegistrationService._upsert_sql(len(rows)), params)
+            returned = cursor.fetchall()
+
+        to_uuid = ServiceInstance._meta.pk.to_python
+        registrations: Dict[Tuple[Any, ...], Registration] = {}
+        for instance_id, service_id, node_id, task_slot, push_kid, changed in returned:
+            registration = Registration(
+                to_uuid(service_id), to_uuid(instance_id), push_kid, bool(changed)
+            )
+            key = RegistrationService._key(
+                {
+                    "instance_id": registration.instance_id,
+                    "service_id": registration.service_id,
+                    "node_id": node_id,
+                    "task_slot": task_slot,
+                }
+            )
+            registrations[key] = registration
+        return registrations
+
+    @staticmethod
+    @atomic
+    def register_many(
+        items: Sequence[RegisterRequest],
+    ) -> Tuple[List[Registration | None], int]:
+        """
+        Registers many instances in one transaction: one query for the
+        services, one upsert per `UPSERT_CHUNK` instances and one registry
+        bump for everything that changed.
+
+        Returns:
+            Tuple[List[Registration | None], int]: The registration of every
+                item (None when its service does not exist) and the registry
+                version.
+        """
+        names = {item.service_name for item in items}
+        services = {
+            service.name: service
+            for service in Service.objects.filter(name__in=names).only(
+                "service_id", "name", "active_kid"
+            )
+        }
+        now = timezone.now()
+        keys: List[Tuple[Any, ...] | None] = []
+        # the same slot twice in one statement is an error: the last one wins
+        rows: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for item in items:
+            service = services.get(item.service_name)
+            if service is None:
+                keys.append(None)
+                continue
+            row = RegistrationService._row(service, item, now)
+            key = RegistrationService._key(row)
+            keys.append(key)
+            rows[key] = row
+
+        unique = list(rows.values())
+        registrations: Dict[Tuple[Any, ...], Registration] = {}
+        for start in range(0, len(unique), UPSERT_CHUNK):
+            registrations.update(
+                RegistrationService._upsert(unique[start : start + UPSERT_CHUNK], now)
+            )
+
+        changed = [r.instance_id for r in registrations.values() if r.changed]
+        changes: List[RegistryChange] = []
+        if changed:
+            changes = RegistryService.instance_changes(
+                ServiceInstance.objects.filter(instance_id__in=changed)
+            )
+        version = RegistryState.maybe_bump(bool(changes), changes)
+        return [registrations[k] if k else None for k in keys], version
+
+    @staticmethod
+    def register(data: RegisterRequest) -> Tuple[Registration, int]:
+        """
+        Registers (or re-registers) an instance of an existing service.
+
+        Returns:
+            Tuple[Registration, int]: The registration and the registry
+                version, bumped only when something visible changed.
+        """
+        (registration,), version = RegistrationService.register_many([data])
+        if registration is None:
+            raise Http404(f"Service {data.service_name} not found")
+        return registration, version
+
+    @staticmethod
+    @atomic
+    def deregister(service_id: str, instance_id: str) -> int:
+        """
+        Deletes an instance of a service; the deletion is logged in the
+        registry change log (see models.events.record_deleted).
+
+        Returns:
+            int: The registry version of the deletion.
+        """
+        try:
+            key = {"service_id": UUID(service_id), "instance_id": UUID(instance_id)}
+        except ValueError:
+            raise Http404(f"Instance {instance_id} not found") from None
+        deleted, _ = ServiceInstance.objects.filter(**key).delete()
+        if not deleted:
+            raise Http404(f"Instance {instance_id} not found")
+        return RegistryState.bump()
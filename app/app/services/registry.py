@@ -0,0 +1,237 @@
+from gzip import compress
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any, Dict, List, NamedTuple
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.db.transaction import atomic
+from orjson import dumps
+
+from app.models.register import RegistryChange, RegistryState
+from app.models.services import Service, ServiceInstance
+
+INSTANCE_FIELDS = (
+    "instance_id",
+    "service_id",
+    "service__name",
+    "base_url",
+    "health_url",
+    "status",
+    "heartbeat_interval_sec",
+    "meta",
+)
+"""
+The ServiceInstance columns exposed to discovery clients.
+"""
+
+
+class ChangeSet(NamedTuple):
+    changes: List[RegistryChange]
+    # the version the client is up to date with after applying the changes
+    registry_version: int
+    # the requested version was compacted away: fetch the full registry
+    resync: bool
+    # the page was truncated, ask again from registry_version
+    more: bool
+
+
+class RegistryService:
+    """
+    Change log of the registry and delta discovery on top of it.
+    """
+
+    @staticmethod
+    def instance_view(row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Returns the JSON view of an instance from a values(*INSTANCE_FIELDS) row.
+        """
+        return {
+            "instance_id": str(row["instance_id"]),
+            "service_id": str(row["service_id"]),
+            "service_name": row["service__name"],
+            "base_url": row["base_url"],
+            "health_url": row["health_url"],
+            "status": row["status"],
+            "heartbeat_interval_sec": row["heartbeat_interval_sec"],
+            "meta": row["meta"],
+        }
+
+    @staticmethod
+    def instance_changes(
+        instances: QuerySet[ServiceInstance],
+    ) -> List[RegistryChange]:
+        """
+        Returns the (unsaved) upsert changes for the given instances, to be
+        passed to RegistryState.bump.
+        """
+        return [
+            RegistryChange(
+                kind=RegistryChange.Kind.INSTANCE,
+                object_id=str(row["instance_id"]),
+                data=RegistryService.instance_view(row),
+            )
+            for row in instances.values(*INSTANCE_FIELDS)
+        ]
+
+    @staticmethod
+    def changes_since(since: int, limit: int = 1000) -> ChangeSet:
+        """
+        Returns the last change of every object modified after `since`.
+
+        At most `limit` changes are read (rounded up to a whole version);
+        when truncated, `more` is set and registry_version is the last
+        version included. Reads stop at the committed watermark
+        (RegistryState.committed), so no version is skipped.
+        """
+        state = RegistryState.objects.filter(pkid=1).first()
+        published = state.registry_version if state else 0
+        compacted = state.compacted_through if state else 0
+        if since < compacted or since > published:
+            return ChangeSet([], published, True, False)
+        # never read past a version that may still commit under it
+        current = RegistryState.committed(published)
+        if since >= current:
+            # a writer may be ahead of the watermark: bring it back to it
+            return ChangeSet([], current, False, False)
+
+        qs = RegistryChange.objects.filter(
+            registry_version__gt=since, registry_version__lte=current
+        ).order_by("registry_version", "id")
+        upto, more = current, False
+        last = qs.values_list("registry_version", flat=True)[limit : limit + 1]
+        if last:
+            upto, more = last[0] - 1, True
+            if upto <= since:
+                # a single version bigger than limit: send it whole
+                upto = last[0]
+            qs = qs.filter(registry_version__lte=upto)
+            more = upto < current
+
+        latest: Dict[tuple, RegistryChange] = {}
+        for change in qs:
+            key = (change.kind, change.object_id)
+            latest.pop(key, None)  # keep the log order of the last change
+            latest[key] = change
+        return ChangeSet(list(latest.values()), upto, False, more)
+
+    @staticmethod
+    def compact(
+        keep_versions: int,
+        batch: int = settings.FLUME_COMPACT_BATCH,
+        pause: float = settings.FLUME_COMPACT_PAUSE_SEC,
+    ) -> int:
+        """
+        Deletes the changes older than the last `keep_versions` versions.
+        Clients behind the compaction point are told to resync.
+
+        The compaction point is committed first, then the changes behind it
+        are deleted `batch` rows at a time with `pause` seconds between two
+        batches, so the change log is never locked for long.
+
+        Returns:
+            int: The number of deleted changes.
+        """
+        with atomic():
+            state = RegistryState.objects.select_for_update().filter(pkid=1).first()
+            if state is None:
+                return 0
+            through = state.registry_version - keep_versions
+            if through > state.compacted_through:
+                state.compacted_through = through
+                state.save(update_fields=["compacted_through"])
+            through = state.compacted_through
+        deleted = 0
+        while True:
+            ids = list(
+                RegistryChange.objects.filter(registry_version__lte=through)
+                .order_by("registry_version")
+                .values_list("id", flat=True)[:batch]
+            )
+            if ids:
+                deleted += RegistryChange.objects.filter(id__in=ids).delete()[0]
+            if len(ids) < batch:
+                return deleted
+            sleep(pause)
+
+
+class Snapshot(NamedTuple):
+    registry_version: int
+    body: bytes  # the JSON response, already rendered
+    gzip_body: bytes
+
+
+class RegistrySnapshot:
+    """
+    The full registry view (services and their UP instances), rendered once
+    per registry version and served as cached bytes.
+
+    The version is checked against the DB at most once every `max_age`
+    seconds, so conditional requests in between cost no DB work at all.
+    """
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._lock = Lock()
+        self._snapshot: Snapshot | None = None
+        self._checked_at = float("-inf")
+
+    def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and monotonic() - self._checked_at < self.max_age:
+            return snapshot
+        with self._lock:
+            # another thread may have refreshed it while we waited
+            if self._snapshot is not None and (
+                monotonic() - self._checked_at < self.max_age
+            ):
+                return self._snapshot
+            version = RegistryState.current()
+            if self._snapshot is None or self._snapshot.registry_version != version:
+                self._snapshot = self._render(version)
+            self._checked_at = monotonic()
+            return self._snapshot
+
+    @staticmethod
+    def _render(version: int) -> Snapshot:
+        services: Dict[Any, Dict[str, Any]] = {
+            service_id: {"service_id": str(service_id), "name": name, "instances": []}
+            for service_id, name in Service.objects.order_by("name").values_list(
+                "service_id", "name"
+            )
+        }
+        instances = (
+            ServiceInstance.objects.filter(status=ServiceInstance.Status.UP)
+            .order_by("instance_id")
+            .values("instance_id", "service_id", "base_url", "health_url", "meta")
+        )
+        for row in instances:
+            service = services.get(row["service_id"])
+            if service is None:  # created after we listed the services
+                continue
+            meta = row["meta"] or {}
+            service["instances"].append(
+                {
+                    "instance_id": str(row["instance_id"]),
+                    "base_url": row["base_url"],
+                    "health_url": row["health_url"],
+                    "zone": meta.get("zone"),
+                    "weight": meta.get("weight", 1),
+                }
+            )
+        body = dumps(
+            {
+                "data": {
+                    "registry_version": version,
+                    "services": list(services.values()),
+                },
+                "message": "Registry snapshot",
+            }
+        )
+        return Snapshot(version, body, compress(body, compresslevel=6))
+
+
+SNAPSHOT = RegistrySnapshot(settings.FLUME_SNAPSHOT_MAX_AGE_SEC)
+"""
+The registry snapshot of this worker process.
+"""
@@ -0,0 +1,99 @@
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Tuple
+from uuid import UUID
+
+from django.conf import settings
+from django.http import Http404
+from ninja.errors import HttpError
+from orjson import loads
+
+from app.models.events import Subscription
+from app.services.delivery import FanOutService
+from app.services.eventstore import EVENTS
+from app.services.routing import filters_match
+
+
+class ReplayService:
+    """
+    Replays the stored events of a subscription from an offset, page by
+    page, so a catch-up of any length runs in constant memory.
+    """
+
+    @staticmethod
+    def subscription(subscription_id: UUID) -> Subscription:
+        subscription = (
+            Subscription.objects.select_related("event")
+            .filter(id=subscription_id)
+            .first()
+        )
+        if subscription is None:
+            raise Http404(f"Subscription {subscription_id} not found")
+        return subscription
+
+    @staticmethod
+    def page(
+        subscription: Subscription, since: int, size: int, limit: int | None = None
+    ) -> Tuple[bytes, int, int | None]:
+        """
+        Reads up to `size` events from offset `since` and renders the ones
+        matching the subscription filters (at most `limit`) as NDJSON, one
+        webhook body per line.
+
+        Returns:
+            Tuple[bytes, int, int | None]: The lines, how many, and the offset
+                to read the next page from (None past the last stored event).
+        """
+        definition = subscription.event
+        lines: List[bytes] = []
+        read = 0
+        next_offset = since
+        for event in EVENTS.read(definition, since, size):
+            read += 1
+            next_offset = event.offset + 1
+            if subscription.filters and not filters_match(
+                subscription.filters, loads(event.payload)
+            ):
+                continue
+            lines.append(FanOutService.body(definition, event) + b"\n")
+            if limit is not None and len(lines) >= limit:
+                break
+        more = read == size or (limit is not None and len(lines) >= limit)
+        return b"".join(lines), len(lines), next_offset if more else None
+
+
+class ReplayLimiter:
+    """
+    At most `per_minute` replays started per subscription and minute (fixed
+    windows) in this process: a replay reads the event store from any
+    offset, so a looping client would keep a worker busy.
+    """
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._lock = Lock()
+        self._windows: Dict[UUID, Tuple[int, int]] = {}  # id -> (minute, started)
+
+    def start(self, subscription_id: UUID) -> None:
+        """
+        Counts a replay of the subscription, raises HttpError(429) past the
+        limit.
+        """
+        minute = int(monotonic() // 60)
+        with self._lock:
+            window, started = self._windows.get(subscription_id, (minute, 0))
+            if window != minute:
+                # a new minute: forget the windows that ended
+                self._windows = {
+                    s: w for s, w in self._windows.items() if w[0] == minute
+                }
+                started = 0
+            if started >= self.per_minute:
+                raise HttpError(429, "Too many replays of this subscription")
+            self._windows[subscription_id] = (minute, started + 1)
+
+
+REPLAYS = ReplayLimiter(settings.FLUME_REPLAY_PER_MINUTE)
+"""
+The replay rate limiter of this process.
+"""
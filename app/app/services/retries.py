@@ -0,0 +1,457 @@
+from asyncio import gather, sleep
+from datetime import datetime, timedelta
+from heapq import heappop, heappush
+from random import Random
+from typing import Dict, Iterable, List, Set, Tuple
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count
+from django.db.transaction import atomic
+from django.utils import timezone
+from orjson import Fragment, dumps
+
+from app.common.default.utils import c_error
+from app.models.events import DeliveryRetry, Subscription
+from app.services.delivery import (
+    Delivery,
+    DeliveryResult,
+    FanOutService,
+    WebhookDispatcher,
+)
+from app.services.eventstore import EVENTS, StoredEvent
+
+OrderKey = Tuple[UUID, str]  # (subscription id, ordering key)
+
+
+def backoff(attempts: int, base: float, cap: float, rng: Random) -> float:
+    """
+    Seconds before the next attempt: exponential with "equal jitter", half
+    of min(cap, base * 2^(attempts - 1)) plus a random share of the other
+    half, so the retries of one outage do not come back all together.
+    """
+    delay = min(cap, base * 2.0 ** min(attempts - 1, 62))
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+class DelayHeap:
+    """
+    Min-heap of (due timestamp, id): push and pop are O(log n), a due item
+    costs the same with a hundred or a million pending.
+    """
+
+    __slots__ = ("_heap", "_ids")
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, int]] = []
+        self._ids: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, item: int) -> bool:
+        return item in self._ids
+
+    def push(self, due: float, item: int) -> None:
+        if item not in self._ids:
+            self._ids.add(item)
+            heappush(self._heap, (due, item))
+
+    def next_due(self) -> float | None:
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float, limit: int) -> List[int]:
+        """
+        Pops up to `limit` items due at `now`, the most overdue first.
+        """
+        heap = self._heap
+        due: List[int] = []
+        while heap and heap[0][0] <= now and len(due) < limit:
+            item = heappop(heap)[1]
+            self._ids.discard(item)
+            due.append(item)
+        return due
+
+
+class RetryScheduler:
+    """
+    Retries failed webhook deliveries with exponential backoff and jitter,
+    then forwards them to the dead letter of the subscription
+    ({"url": ..., "max_attempts": 12}) once out of attempts.
+
+    Retries are DeliveryRetry rows: only the ones due within `horizon`
+    seconds (at most `max_loaded`) are held in a DelayHeap, refilled from
+    the (state, next_attempt_at) index. Retries go through their own
+    dispatcher, so they never take the connections or the concurrency
+    slots of first attempts. Run one scheduler per deployment: the one of
+    deliver_events, or retry_deliveries when no engine runs.
+
+    Ordering keys stay in order across retries: while a key has unresolved
+    retries, later deliveries of the key are parked behind them (park())
+    and only the oldest one is ever pending.
+    """
+
+    def __init__(
+        self,
+        dispatcher: WebhookDispatcher,
+        base: float | None = None,
+        cap: float | None = None,
+        max_attempts: int | None = None,
+        horizon: float | None = None,
+        batch: int = 500,
+        max_loaded: int = 100_000,
+        seed: int | None = None,
+    ):
+        self.dispatcher = dispatcher
+        self.base = base or settings.FLUME_RETRY_BASE_SEC
+        self.cap = cap or settings.FLUME_RETRY_MAX_DELAY_SEC
+        self.max_attempts = max_attempts or settings.FLUME_RETRY_MAX_ATTEMPTS
+        self.horizon = horizon or settings.FLUME_RETRY_HORIZON_SEC
+        self.batch = batch
+        self.max_loaded = max_loaded
+        self._rng = Random(seed)
+        self._heap = DelayHeap()
+        # retries due before this are in the heap (or attempted already)
+        self._loaded_until: datetime | None = None
+        # deliveries to store, with their error (None when parked)
+        self._failed: List[Tuple[Delivery, str | None]] = []
+        # unresolved retries per ordering key, stored or still in _failed
+        self._blocked: Dict[OrderKey, int] = {}
+        self._blocked_loaded = False
+        self.stored = self.delivered = self.dead_lettered = self.dead = 0
+
+    @staticmethod
+    def order_key(delivery: Delivery) -> OrderKey | None:
+        if delivery.ordering_key is None:
+            return None
+        return delivery.subscription.id, delivery.ordering_key
+
+    def is_blocked(self, delivery: Delivery) -> bool:
+        """
+        Whether earlier deliveries of the same ordering key are unresolved.
+        """
+        key = self.order_key(delivery)
+        return key is not None and key in self._blocked
+
+    def _hold(self, delivery: Delivery, error: str | None) -> None:
+        key = self.order_key(delivery)
+        if key is not None:
+            self._blocked[key] = self._blocked.get(key, 0) + 1
+        self._failed.append((delivery, error))
+
+    def failed(self, result: DeliveryResult) -> None:
+        """
+        on_result hook of the first-attempt dispatcher: failures are stored
+        as retries on the next tick.
+        """
+        if not result.ok:
+            self._hold(result.delivery, result.error)
+
+    def park(self, delivery: Delivery) -> None:
+        """
+        Queues a delivery behind the unresolved retries of its ordering key,
+        without attempting it.
+        """
+        self._hold(delivery, None)
+
+    def _resolved(self, keys: Iterable[OrderKey]) -> None:
+        for key in keys:
+            left = self._blocked.get(key, 0) - 1
+            if left > 0:
+                self._blocked[key] = left
+            else:
+                self._blocked.pop(key, None)
+
+    @staticmethod
+    def _count_blocked() -> Dict[OrderKey, int]:
+        rows = (
+            DeliveryRetry.objects.filter(
+                state__in=[DeliveryRetry.State.PENDING, DeliveryRetry.State.PARKED],
+                ordering_key__isnull=False,
+            )
+            .values_list("subscription_id", "ordering_key")
+            .annotate(n=Count("id"))
+        )
+        return {(s, key): n for s, key, n in rows}
+
+    async def load(self) -> None:
+        """
+        Loads the ordering keys blocked by stored retries. Call it before
+        first attempts start (DeliveryLanes does), tick() does it as well.
+        """
+        if self._blocked_loaded:
+            return
+        for key, n in (await sync_to_async(self._count_blocked)()).items():
+            self._blocked[key] = self._blocked.get(key, 0) + n
+        self._blocked_loaded = True
+
+    def max_attempts_for(self, subscription: Subscription) -> int:
+        dead_letter = subscription.dead_letter or {}
+        return int(dead_letter.get("max_attempts") or self.max_attempts)
+
+    def _due_at(self, now: datetime, attempts: int) -> datetime:
+        delay = backoff(attempts, self.base, self.cap, self._rng)
+        return now + timedelta(seconds=delay)
+
+    def _track(self, retries: List[DeliveryRetry]) -> None:
+        """
+        Pushes the retries due inside the loaded window, the others are
+        found by a later refill.
+        """
+        for retry in retries:
+            if self._loaded_until and retry.next_attempt_at < self._loaded_until:
+                self._heap.push(retry.next_attempt_at.timestamp(), retry.id)
+
+    def _release(self, keys: Iterable[OrderKey], now: datetime) -> None:
+        """
+        Makes the oldest parked retry of every key pending, unless the key
+        still has a pending one.
+        """
+        for subscription_id, ordering_key in keys:
+            retries = DeliveryRetry.objects.filter(
+                subscription_id=subscription_id, ordering_key=ordering_key
+            )
+            if retries.filter(state=DeliveryRetry.State.PENDING).exists():
+                continue
+            head = (
+                retries.filter(state=DeliveryRetry.State.PARKED)
+                .order_by("offset")
+                .first()
+            )
+            if head is None:
+                continue
+            head.state = DeliveryRetry.State.PENDING
+            head.next_attempt_at = now
+            head.save(update_fields=["state", "next_attempt_at", "updated_at"])
+            self._track([head])
+
+    @atomic
+    def _store(self, failed: List[Tuple[Delivery, str | None]], now: datetime) -> None:
+        """
+        Stores the failed and parked deliveries as retries, all or none.
+        """
+        retries = DeliveryRetry.objects.bulk_create(
+            DeliveryRetry(
+                subscription=delivery.subscription,
+                event_id=delivery.subscription.event_id,
+                offset=delivery.offset,
+                ordering_key=delivery.ordering_key,
+                attempts=0 if error is None else 1,
+                next_attempt_at=now if error is None else self._due_at(now, 1),
+                last_error=error,
+                state=DeliveryRetry.State.PARKED
+                if error is None
+                else DeliveryRetry.State.PENDING,
+            )
+            for delivery, error in failed
+        )
+        # parked behind a retry resolved meanwhile
+        self._release(
+            {
+                key
+                for delivery, error in failed
+                if error is None and (key := self.order_key(delivery)) is not None
+            },
+            now,
+        )
+        self.stored += len(retries)
+        self._track([r for r in retries if r.state == DeliveryRetry.State.PENDING])
+
+    def _refill(self, now: datetime) -> None:
+        until = now + timedelta(seconds=self.horizon)
+        if self._loaded_until and self._loaded_until - now > (until - now) / 2:
+            return
+        room = self.max_loaded - len(self._heap)
+        if room <= 0:
+            return
+        qs = DeliveryRetry.objects.filter(
+            state=DeliveryRetry.State.PENDING, next_attempt_at__lt=until
+        )
+        if self._loaded_until:
+            qs = qs.filter(next_attempt_at__gte=self._loaded_until)
+        rows = list(
+            qs.order_by("next_attempt_at").values_list("id", "next_attempt_at")[:room]
+        )
+        for retry_id, due in rows:
+            self._heap.push(due.timestamp(), retry_id)
+        # a full page stops at its last due time, the heap skips repeats
+        self._loaded_until = rows[-1][1] if len(rows) == room else until
+
+    @staticmethod
+    def _load(ids: List[int]) -> List[Tuple[DeliveryRetry, StoredEvent | None]]:
+        """
+        Loads the retries still pending with their event, None when it is
+        no longer stored (expired).
+        """
+        retries = list(
+            DeliveryRetry.objects.select_related(
+                "subscription__subscriber", "event"
+            ).filter(id__in=ids, state=DeliveryRetry.State.PENDING)
+        )
+        by_event: Dict[UUID, List[DeliveryRetry]] = {}
+        for retry in retries:
+            by_event.setdefault(retry.event_id, []).append(retry)
+        events: Dict[Tuple[UUID, int], StoredEvent] = {}
+        for event_id, group in by_event.items():
+            stored = EVENTS.get_many(group[0].event, [r.offset for r in group])
+            events.update(((event_id, o), e) for o, e in stored.items())
+        return [(r, events.get((r.event_id, r.offset))) for r in retries]
+
+    @staticmethod
+    def _dead_letter_body(retry: DeliveryRetry, body: bytes) -> bytes:
+        return dumps(
+            {
+                "subscription_id": retry.subscription_id,
+                "attempts": retry.attempts,
+                "last_error": retry.last_error,
+                "event": Fragment(body),
+            }
+        )
+
+    async def _attempt(
+        self, retry: DeliveryRetry, event: StoredEvent | None
+    ) -> Tuple[DeliveryRetry, DeliveryResult | None, bool]:
+        """
+        Retries the delivery, or forwards it to the dead letter when out of
+        attempts. Returns the retry, the result (None when there was nothing
+        to send) and whether it went to the dead letter.
+        """
+        if not retry.subscription.enabled or event is None:
+            return retry, None, False
+        body = FanOutService.body(retry.event, event)
+        delivery = Delivery(retry.subscription, event.offset, event.ordering_key, body)
+        if retry.attempts < self.max_attempts_for(retry.subscription):
+            return retry, await self.dispatcher.deliver(delivery), False
+        url = (retry.subscription.dead_letter or {}).get("url")
+        if not url:
+            return retry, None, True
+        dead_letter = delivery._replace(body=self._dead_letter_body(retry, body))
+        return retry, await self.dispatcher.deliver(dead_letter, url), True
+
+    @atomic
+    def _settle(
+        self,
+        outcomes: List[Tuple[DeliveryRetry, DeliveryResult | None, bool]],
+        now: datetime,
+    ) -> List[OrderKey]:
+        """
+        Stores the outcomes.
+
+        Returns:
+            List[OrderKey]: The ordering key of every retry resolved.
+        """
+        done: List[int] = []
+        again: List[DeliveryRetry] = []
+        dead: List[DeliveryRetry] = []
+        resolved: List[OrderKey] = []
+        for retry, result, dead_letter in outcomes:
+            retried = result is not None and not result.ok and not dead_letter
+            if not retried and retry.ordering_key is not None:
+                resolved.append((retry.subscription_id, retry.ordering_key))
+            if result is None and not dead_letter:
+                done.append(retry.id)  # subscription disabled or event expired
+            elif result is not None and result.ok:
+                done.append(retry.id)
+                if dead_letter:
+                    self.dead_lettered += 1
+                else:
+                    self.delivered += 1
+            elif dead_letter:
+                retry.state = DeliveryRetry.State.DEAD
+                if result is not None:
+                    retry.last_error = f"dead letter: {result.error}"
+                dead.append(retry)
+            elif result is not None:
+                retry.attempts += 1
+                retry.last_error = result.error
+                retry.next_attempt_at = self._due_at(now, retry.attempts)
+                again.append(retry)
+        if done:
+            DeliveryRetry.objects.filter(id__in=done).delete()
+        fields = ["attempts", "last_error", "next_attempt_at", "state", "updated_at"]
+        for retry in again + dead:
+            retry.updated_at = now
+        DeliveryRetry.objects.bulk_update(again + dead, fields, batch_size=500)
+        self.dead += len(dead)
+        self._track(again)
+        self._release(set(resolved), now)
+        return resolved
+
+    def _retry_later(self, ids: Iterable[int], now: datetime) -> None:
+        """
+        Puts retries taken from the heap back, due `base` seconds from now
+        so a failing store or dispatcher is not hammered.
+        """
+        for retry_id in ids:
+            self._heap.push(now.timestamp() + self.base, retry_id)
+
+    async def tick(self) -> int:
+        """
+        Stores the new failures, then attempts up to `batch` due retries.
+        Failures leave the buffer only once stored; the retries taken from
+        the heap go back to it when their load, attempt or settle raised.
+
+        Returns:
+            int: The retries attempted.
+        """
+        await self.load()
+        now = timezone.now()
+        failed = self._failed[:]  # the lanes may add more meanwhile
+        if failed:
+            await sync_to_async(self._store)(failed, now)
+            del self._failed[: len(failed)]
+        await sync_to_async(self._refill)(now)
+        ids = self._heap.pop_due(now.timestamp(), self.batch)
+        if not ids:
+            return 0
+        raised: List[int] = []
+        try:
+            retries = await sync_to_async(self._load)(ids)
+            attempts = await gather(
+                *(self._attempt(r, e) for r, e in retries), return_exceptions=True
+            )
+            outcomes = []
+            for (retry, _), attempt in zip(retries, attempts):
+                if isinstance(attempt, BaseException):
+                    c_error(f"Delivery retry failed: {attempt!r}")
+                    raised.append(retry.id)
+                else:
+                    outcomes.append(attempt)
+            resolved = await sync_to_async(self._settle)(outcomes, timezone.now())
+        except BaseException:
+            self._retry_later(ids, now)
+            raise
+        # the ones that raised stay pending; the ids not loaded are gone
+        # (deleted, or no longer pending) and are dropped
+        self._retry_later(raised, now)
+        self._resolved(resolved)
+        return len(retries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "loaded": len(self._heap),
+            "buffered": len(self._failed),
+            "blocked_keys": len(self._blocked),
+            "stored": self.stored,
+            "delivered": self.delivered,
+            "dead_lettered": self.dead_lettered,
+            "dead": self.dead,
+        }
+
+    async def run_forever(self, every: float) -> None:
+        """
+        Ticks until cancelled, at most every `every` seconds while idle,
+        logging failures instead of dying.
+        """
+        while True:
+            try:
+                if await self.tick():
+                    continue
+            except Exception as exc:
+                c_error(f"Delivery retries failed: {exc}")
+            next_due = self._heap.next_due()
+            wait = every
+            if next_due is not None:
+                wait = min(every, max(0.0, next_due - timezone.now().timestamp()))
+            await sleep(wait)
@@ -0,0 +1,224 @@
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, Hashable, Iterable, Mapping, Set
+from uuid import UUID
+
+from django.conf import settings
+
+from app.common.default.utils import c_error
+from app.models.events import Subscription
+from app.models.register import RegistryChange, RegistryState
+from app.services.registry import RegistryService
+
+
+def _key(value: Any) -> Hashable:
+    """
+    Hashable key of a filter / payload value. Keeps True apart from 1.
+    """
+    if isinstance(value, bool):
+        return ("bool", value)
+    if isinstance(value, (dict, list)):
+        return ("json", repr(value))
+    return value
+
+
+def _keys(value: Any) -> Iterable[Hashable]:
+    """
+    Keys of a payload attribute: a list matches if any of its items does.
+    """
+    if isinstance(value, list):
+        return {_key(item) for item in value}
+    return (_key(value),)
+
+
+def filters_match(filters: Mapping[str, Any], payload: Mapping[str, Any]) -> bool:
+    """
+    Reference semantics of Subscription.filters: every attribute must match,
+    a list of values means "any of". es: {"country": ["IT", "DE"]}. Filters
+    that are not an object match nothing.
+    """
+    if not isinstance(filters, Mapping):
+        return False
+    for attribute, accepted in filters.items():
+        if attribute not in payload:
+            return False
+        accepted_keys = {
+            _key(v) for v in (accepted if isinstance(accepted, list) else [accepted])
+        }
+        if accepted_keys.isdisjoint(_keys(payload[attribute])):
+            return False
+    return True
+
+
+class SubscriptionIndex:
+    """
+    Inverted index of the filters of the subscriptions to one event:
+    attribute -> value -> subscriptions, plus the unfiltered ones.
+
+    A payload only walks the postings of its own attribute values, so the
+    cost depends on the matching subscriptions, not on how many exist.
+    """
+
+    __slots__ = ("_postings", "_arity", "_filters", "_unfiltered")
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Dict[Hashable, Set[UUID]]] = {}
+        self._arity: Dict[UUID, int] = {}
+        self._filters: Dict[UUID, Mapping[str, Any]] = {}
+        self._unfiltered: Set[UUID] = set()
+
+    def __len__(self) -> int:
+        return len(self._filters)
+
+    def add(self, subscription_id: UUID, filters: Mapping[str, Any]) -> None:
+        """
+        Indexes the filters of the subscription, replacing its previous ones.
+        Raises ValueError, with the subscription left out, when they are not
+        an object.
+        """
+        self.remove(subscription_id)
+        if not isinstance(filters, Mapping):
+            raise ValueError(f"Filters of subscription {subscription_id} not an object")
+        self._filters[subscription_id] = filters
+        if not filters:
+            self._unfiltered.add(subscription_id)
+            return
+        self._arity[subscription_id] = len(filters)
+        for attribute, accepted in filters.items():
+            # an empty list accepts nothing: no posting, the arity never matches
+            for value in accepted if isinstance(accepted, list) else [accepted]:
+                values = self._postings.setdefault(attribute, {})
+                values.setdefault(_key(value), set()).add(subscription_id)
+
+    def remove(self, subscription_id: UUID) -> None:
+        filters = self._filters.pop(subscription_id, None)
+        if filters is None:
+            return
+        self._unfiltered.discard(subscription_id)
+        self._arity.pop(subscription_id, None)
+        for attribute, accepted in filters.items():
+            values = self._postings.get(attribute)
+            if values is None:
+                continue
+            for value in accepted if isinstance(accepted, list) else [accepted]:
+                subscribers = values.get(_key(value))
+                if subscribers is not None:
+                    subscribers.discard(subscription_id)
+                    if not subscribers:
+                        del values[_key(value)]
+            if not values:
+                del self._postings[attribute]
+
+    def match(self, payload: Mapping[str, Any]) -> Set[UUID]:
+        """
+        Returns the subscriptions whose filters accept the payload.
+        """
+        hits: Dict[UUID, int] = {}
+        for attribute, values in self._postings.items():
+            if attribute not in payload:
+                continue
+            # one hit per attribute, even if several list items match
+            matched: Set[UUID] = set()
+            for key in _keys(payload[attribute]):
+                subscribers = values.get(key)
+                if subscribers:
+                    matched |= subscribers
+            for subscription_id in matched:
+                hits[subscription_id] = hits.get(subscription_id, 0) + 1
+        matching = set(self._unfiltered)
+        matching.update(s for s, n in hits.items() if n == self._arity[s])
+        return matching
+
+
+class SubscriptionRouter:
+    """
+    The subscription indexes of this process, one per event definition,
+    built on first use and kept up to date from the registry change log
+    (checked at most every `max_age` seconds, by one thread at a time).
+
+    The database is only queried outside the lock: indexes are loaded and
+    change sets read first, then swapped in or applied under it.
+    """
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._lock = Lock()
+        self._syncing = Lock()
+        self._indexes: Dict[UUID, SubscriptionIndex] = {}
+        self._version: int | None = None
+        self._checked_at = float("-inf")
+
+    def match(self, event_id: UUID, payload: Mapping[str, Any]) -> Set[UUID]:
+        """
+        Returns the enabled subscriptions of the event matching the payload.
+        """
+        self._sync()
+        with self._lock:
+            index = self._indexes.get(event_id)
+            if index is not None:
+                return index.match(payload)
+            version = self._version
+        index = self._load(event_id)
+        with self._lock:
+            # changes applied meanwhile may be missing from it: use it once
+            if self._version == version:
+                index = self._indexes.setdefault(event_id, index)
+            return index.match(payload)
+
+    @staticmethod
+    def _load(event_id: UUID) -> SubscriptionIndex:
+        index = SubscriptionIndex()
+        subscriptions = Subscription.objects.filter(
+            event_id=event_id, enabled=True
+        ).values_list("id", "filters")
+        for subscription_id, filters in subscriptions:
+            SubscriptionRouter._add(index, subscription_id, filters)
+        return index
+
+    @staticmethod
+    def _add(index: SubscriptionIndex, subscription_id: UUID, filters: Any) -> None:
+        try:
+            index.add(subscription_id, filters or {})
+        except ValueError as exc:
+            c_error(f"Subscription not routed: {exc}")
+
+    def _sync(self) -> None:
+        if monotonic() - self._checked_at < self.max_age:
+            return
+        if not self._syncing.acquire(blocking=False):
+            return  # another thread is syncing: match with the indexes as they are
+        try:
+            self._checked_at = monotonic()
+            if self._version is None:
+                self._version = RegistryState.current()
+                return
+            while True:
+                change_set = RegistryService.changes_since(self._version, limit=10000)
+                with self._lock:
+                    if change_set.resync:
+                        self._indexes.clear()
+                    for change in change_set.changes:
+                        if change.kind == RegistryChange.Kind.SUBSCRIPTION:
+                            self._apply(change)
+                    self._version = change_set.registry_version
+                if not change_set.more:
+                    return
+        finally:
+            self._syncing.release()
+
+    def _apply(self, change: RegistryChange) -> None:
+        subscription_id = UUID(change.object_id)
+        for index in self._indexes.values():
+            index.remove(subscription_id)
+        data = change.data
+        if change.op == RegistryChange.Op.DELETE or not data.get("enabled"):
+            return
+        index = self._indexes.get(UUID(data["event_id"]))
+        if index is not None:
+            self._add(index, subscription_id, data.get("filters"))
+
+
+ROUTER = SubscriptionRouter(settings.FLUME_ROUTING_MAX_AGE_SEC)
+"""
+The subscription router of this worker process.
+"""
@@ -1,31 +1,220 @@
-from typing import Dict, Tuple
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from pathlib import Path
+from re import sub
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, Iterable, Tuple
+from app.common.default.utils import c_error, c_info
 from app.models.services import Service
-from django import settings
-from time import time
+from django.conf import settings
+from django.db import DatabaseError
+from time import perf_counter, time
 from boto3 import client
 from json import loads
-from app.common.default.security import _CACHES
-from base64 import b64decode
+
+_CLIENTS: Dict[str, Any] = {}
+_CLIENTS_LOCK = Lock()
+# background refresh-ahead fetches
+_REFRESHER = ThreadPoolExecutor(max_workers=4, thread_name_prefix="flume-secrets")
+# held forever once the prefetch started: it runs once per process
+_PREFETCH = Lock()
+
+
+def secretsmanager(region: str) -> Any:
+    """
+    Returns the secretsmanager client of the region, shared by the process
+    (boto3 clients are thread-safe, creating one is not cheap).
+    """
+    with _CLIENTS_LOCK:
+        sm = _CLIENTS.get(region)
+        if sm is None:
+            sm = _CLIENTS[region] = client("secretsmanager", region_name=region)
+        return sm
+
+
+class SecretsProvider(ABC):
+    """
+    Where service secrets ({"kid": ..., "token": ...}) are read from, by
+    Service.bootstrap_secret_ref. Selected by FLUME_SECRETS_PROVIDER.
+    """
+
+    @abstractmethod
+    def fetch(self, name: str) -> Dict:
+        """
+        Returns the secret named `name`, raising when it cannot be read.
+        """
+
+    def fetch_many(
+        self, names: Iterable[str], workers: int = 16
+    ) -> Dict[str, Dict | Exception]:
+        """
+        Fetches the secrets in parallel, returning the error of the failed ones.
+        """
+
+        def fetch(name: str) -> Tuple[str, Dict | Exception]:
+            try:
+                return name, self.fetch(name)
+            except Exception as exc:
+                return name, exc
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(pool.map(fetch, set(names)))
+
+
+class AwsSecretsProvider(SecretsProvider):
+    """
+    AWS Secrets Manager, fetch_many() in BatchGetSecretValue calls of 20.
+    """
+
+    def __init__(self, region: str):
+        self.region = region
+
+    @staticmethod
+    def _parse(resp: Dict) -> Dict:
+        raw = resp.get("SecretString") or resp["SecretBinary"].decode()
+        return loads(raw)  # es. {"kid":"v1","token":"base64..."}
+
+    def fetch(self, name: str) -> Dict:
+        return self._parse(secretsmanager(self.region).get_secret_value(SecretId=name))
+
+    def fetch_many(
+        self, names: Iterable[str], workers: int = 16
+    ) -> Dict[str, Dict | Exception]:
+        names = sorted(set(names))
+        chunks = [names[i : i + 20] for i in range(0, len(names), 20)]
+
+        def fetch(chunk: list) -> Dict[str, Dict | Exception]:
+            found: Dict[str, Dict | Exception] = {}
+            try:
+                resp = secretsmanager(self.region).batch_get_secret_value(
+                    SecretIdList=chunk
+                )
+            except Exception as exc:
+                return {name: exc for name in chunk}
+            for value in resp.get("SecretValues", []):
+                # answered by ARN and name, asked by either
+                for key in (value.get("Name"), value.get("ARN")):
+                    if key in chunk:
+                        found[key] = self._parse(value)
+            for error in resp.get("Errors", []):
+                message = error.get("Message") or error.get("ErrorCode", "error")
+                found.setdefault(error.get("SecretId"), LookupError(message))
+            for name in chunk:
+                found.setdefault(name, LookupError(f"Secret {name} not returned"))
+            return found
+
+        results: Dict[str, Dict | Exception] = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for found in pool.map(fetch, chunks):
+                results.update(found)
+        return results
+
+
+class FileSecretsProvider(SecretsProvider):
+    """
+    A local JSON file mapping secret refs to secrets, re-read when it changes:
+    {"orders": {"kid": "v1", "token": "base64:..."}, ...}
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self._lock = Lock()
+        self._mtime = -1.0
+        self._secrets: Dict[str, Dict] = {}
+
+    def _load(self) -> Dict[str, Dict]:
+        mtime = self.path.stat().st_mtime
+        with self._lock:
+            if mtime != self._mtime:
+                self._secrets = loads(self.path.read_text())
+                self._mtime = mtime
+            return self._secrets
+
+    def fetch(self, name: str) -> Dict:
+        secrets = self._load()
+        if name not in secrets:
+            raise LookupError(f"Secret {name} not in {self.path}")
+        return secrets[name]
+
+
+class EnvSecretsProvider(SecretsProvider):
+    """
+    Secrets as JSON in environment variables: the ref "flume/orders" is read
+    from FLUME_SECRET_FLUME_ORDERS (`prefix` + the ref upper-cased, with
+    every other character than letters and digits turned into "_").
+    """
+
+    def __init__(self, prefix: str = "FLUME_SECRET_"):
+        self.prefix = prefix
+
+    def variable(self, name: str) -> str:
+        return self.prefix + sub(r"[^A-Z0-9]", "_", name.upper())
+
+    def fetch(self, name: str) -> Dict:
+        raw = environ.get(self.variable(name))
+        if raw is None:
+            raise LookupError(f"Secret {name} not in ${self.variable(name)}")
+        return loads(raw)
+
+
+def secrets_provider() -> SecretsProvider:
+    if settings.FLUME_SECRETS_PROVIDER == "file":
+        return FileSecretsProvider(settings.FLUME_SECRETS_FILE)
+    if settings.FLUME_SECRETS_PROVIDER == "env":
+        return EnvSecretsProvider()
+    if settings.FLUME_SECRETS_PROVIDER != "aws":
+        raise ValueError(
+            f"Unknown FLUME_SECRETS_PROVIDER '{settings.FLUME_SECRETS_PROVIDER}'"
+        )
+    return AwsSecretsProvider(settings.AWS_REGION)
+
+
+PROVIDER = secrets_provider()
+"""
+The secrets provider of this process.
+"""
 
 
 class SecretsService:
+    """
+    Cached secret of a service. Callers get the cached value until it
+    expires after `ttl_s`; from `refresh_ratio` of the TTL on, a hit also
+    refreshes it in the background, so a secret in use never expires.
+    Fetches are single-flight: on a miss one caller fetches and the others
+    wait for its result. A failed fetch serves the stale value, if any,
+    and is retried after `retry_s`.
+    """
+
     CACHES: Dict[str, "SecretsService"] = {}
+    _CACHES_LOCK = Lock()
 
     _val: Dict | None = None
     _exp = 0.0
 
     name: str
     ttl_s: int
-    region: str
 
-    def __init__(self, name: str, ttl_s: int = 300, region: str | None = None):
-        self.name, self.ttl_s, self.region = (
-            name,
-            ttl_s,
-            region or settings.AWS_REGION,
-        )
+    def __init__(
+        self,
+        name: str,
+        ttl_s: int | None = None,
+        fetch: Callable[[str], Dict] | None = None,
+        refresh_ratio: float = 0.8,
+        retry_s: float = 5.0,
+    ):
+        self.name, self.ttl_s = name, ttl_s or settings.FLUME_SECRETS_TTL_SEC
+        self.fetch = fetch or PROVIDER.fetch
+        self.refresh_ratio = refresh_ratio
+        self.retry_s = retry_s
         self._val: Dict | None = None
         self._exp = 0.0
+        self._refresh_at = 0.0
+        self._lock = Lock()  # one fetch at a time
+        self._refreshing = Lock()  # held while a refresh-ahead is queued
+        self.hits = self.misses = self.refreshes = self.errors = self.stale = 0
+        self.fetches = 0
+        self.fetch_seconds = self.max_fetch_seconds = 0.0
 
     @staticmethod
     def _get_cache_for_service(service: Service) -> "SecretsService":
@@ -33,23 +222,158 @@ class SecretsService:
         Returns a SecretsService instance for the given service.
         If the service is not in the cache, it creates a new instance and adds it to the cache.
         """
-        if service.bootstrap_secret_ref not in SecretsService.CACHES:
-            _CACHES[service.bootstrap_secret_ref] = SecretsService(
-                service.bootstrap_secret_ref,
-                ttl_s=service.ttl_s,
-                region=service.region,
-            )
-        return SecretsService.CACHES[service.bootstrap_secret_ref]
+        return SecretsService._get_cache(service.bootstrap_secret_ref)
+
+    @staticmethod
+    def _get_cache(ref: str) -> "SecretsService":
+        cache = SecretsService.CACHES.get(ref)
+        if cache is None:
+            with SecretsService._CACHES_LOCK:
+                cache = SecretsService.CACHES.setdefault(ref, SecretsService(ref))
+        return cache
+
+    @staticmethod
+    def prefetch(
+        refs: Iterable[str], provider: SecretsProvider | None = None
+    ) -> Tuple[int, Dict[str, Exception]]:
+        """
+        Loads the secrets not cached yet with one fetch_many() of `provider`
+        (PROVIDER by default).
+
+        Returns:
+            Tuple[int, Dict[str, Exception]]: The secrets loaded and the
+                error of every secret that failed.
+        """
+        missing = [r for r in set(refs) if SecretsService._get_cache(r)._val is None]
+        failed: Dict[str, Exception] = {}
+        loaded = 0
+        for ref, value in (provider or PROVIDER).fetch_many(missing).items():
+            if isinstance(value, Exception):
+                failed[ref] = value
+                continue
+            cache = SecretsService._get_cache(ref)
+            with cache._lock:
+                if cache._val is None:
+                    cache._set(value)
+                    loaded += 1
+        return loaded, failed
+
+    def _fetch(self) -> None:
+        """
+        Fetches the secret and restarts its TTL. Call it holding _lock.
+        """
+        start = perf_counter()
+        try:
+            value = self.fetch(self.name)
+        finally:
+            elapsed = perf_counter() - start
+            self.fetches += 1
+            self.fetch_seconds += elapsed
+            self.max_fetch_seconds = max(self.max_fetch_seconds, elapsed)
+        self._set(value)
+
+    def _set(self, value: Dict) -> None:
+        now = time()
+        self._val = value
+        self._exp = now + self.ttl_s
+        self._refresh_at = now + self.ttl_s * self.refresh_ratio
+
+    def _refresh(self) -> None:
+        try:
+            with self._lock:
+                self._fetch()
+                self.refreshes += 1
+        except Exception:
+            self.errors += 1  # the value stays until it expires
+            self._refresh_at = time() + self.retry_s
+        finally:
+            self._refreshing.release()
+
+    def _load(self) -> Dict:
+        with self._lock:
+            if self._val is not None and time() < self._exp:
+                self.hits += 1  # fetched by the caller we waited for
+                return self._val
+            self.misses += 1
+            try:
+                self._fetch()
+            except Exception:
+                self.errors += 1
+                if self._val is None:
+                    raise
+                self.stale += 1
+                self._exp = time() + self.retry_s
+            return self._val
+
+    def cached(self) -> bool:
+        """
+        Whether get() returns without fetching.
+        """
+        return self._val is not None and time() < self._exp
 
     def get(self) -> Dict:
         """
         Returns the secrets for the given service.
         """
-        now = time.time()
-        if self._val is None or now >= self._exp:
-            sm = client("secretsmanager", region_name=self.region)
-            resp = sm.get_secret_value(SecretId=self.name)
-            raw = resp.get("SecretString") or resp["SecretBinary"].decode()
-            self._val = loads(raw)  # es. {"kid":"v1","token":"base64..."}
-            self._exp = now + self.ttl_s
-        return self._val
+        val, now = self._val, time()
+        if val is None or now >= self._exp:
+            return self._load()
+        self.hits += 1
+        if now >= self._refresh_at and self._refreshing.acquire(blocking=False):
+            _REFRESHER.submit(self._refresh)
+        return val
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "stale": self.stale,
+            "fetches": self.fetches,
+            "avg_fetch_ms": self.fetch_seconds / self.fetches * 1e3
+            if self.fetches
+            else 0.0,
+            "max_fetch_ms": self.max_fetch_seconds * 1e3,
+        }
+
+
+def prefetch_service_secrets() -> None:
+    """
+    Warms the secret of every service, so the first push to each one does
+    not wait for a cold fetch. Skipped while the services table cannot be
+    read, e.g. before the first migrate.
+    """
+    start = perf_counter()
+    try:
+        refs = list(
+            Service.objects.values_list("bootstrap_secret_ref", flat=True).distinct()
+        )
+    except DatabaseError as error:
+        c_info(f"Secrets prefetch skipped, services not readable: {error}")
+        return
+    loaded, failed = SecretsService.prefetch(refs)
+    for ref, exc in failed.items():
+        c_error(f"Secret {ref} not prefetched: {exc}")
+    c_info(
+        f"{loaded} service secrets prefetched in "
+        f"{(perf_counter() - start) * 1e3:.0f} ms"
+    )
+
+
+def start_secrets_prefetch() -> None:
+    """
+    Runs prefetch_service_secrets() in a daemon thread when
+    FLUME_SECRETS_PREFETCH is set, without holding up the request that
+    triggers it, once per process.
+    """
+    if not settings.FLUME_SECRETS_PREFETCH or not _PREFETCH.acquire(blocking=False):
+        return
+
+    def prefetch() -> None:
+        try:
+            prefetch_service_secrets()
+        except Exception as exc:
+            c_error(f"Secrets prefetch failed: {exc}")
+
+    Thread(target=prefetch, name="flume-secrets-prefetch", daemon=True).start()
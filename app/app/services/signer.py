@@ -1,13 +1,98 @@
-from typing import Mapping, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, Mapping, Set, Tuple
+from django.conf import settings
+from app.models.events import Subscription
 from app.models.services import Service, ServiceInstance
-from app.services.secrets import SecretsService, get_active_kid_and_token
+from app.services.secrets import SecretsService
 from time import time
 from os import urandom
-from hmac import new
-from hashlib import sha256
+from hmac import HMAC, new
+from hashlib import blake2b, sha256
 from base64 import b64decode
 
 
+@lru_cache(maxsize=1024)
+def _decode_token(token: str) -> bytes:
+    if token.startswith("base64:"):
+        return b64decode(token.split(":", 1)[1])
+    return token.encode()
+
+
+@lru_cache(maxsize=1024)
+def _fingerprint(token: bytes) -> bytes:
+    return blake2b(token, digest_size=16).digest()
+
+
+class KeyCache:
+    """
+    Process-wide LRU of pre-keyed HMAC-SHA256 objects per (secret ref, kid,
+    token digest, scope): a signature copies one instead of deriving the key
+    (an HMAC of its own) and keying a new HMAC. A token rotated under the
+    same kid gets new entries, the old ones age out; the keys of every
+    secret ref are indexed, so invalidate() only visits its own.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = Lock()
+        self._macs: "OrderedDict[Tuple[str, str, bytes, str], HMAC]" = OrderedDict()
+        self._refs: Dict[str, Set[Tuple[str, str, bytes, str]]] = {}
+        self.hits = self.misses = self.evictions = 0
+
+    def _forget(self, key: Tuple[str, str, bytes, str]) -> None:
+        keys = self._refs[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._refs[key[0]]
+
+    def invalidate(self, ref: str) -> None:
+        """
+        Drops the keys derived from the secret `ref`.
+        """
+        with self._lock:
+            for key in self._refs.pop(ref, ()):
+                del self._macs[key]
+
+    def get(self, ref: str, kid: str, token: bytes, scope: str) -> HMAC:
+        """
+        Returns a fresh HMAC keyed with the key of `scope`, ready for update().
+        """
+        key = (ref, kid, _fingerprint(token), scope)
+        with self._lock:
+            mac = self._macs.get(key)
+            if mac is not None:
+                self._macs.move_to_end(key)
+                self.hits += 1
+                return mac.copy()
+            self.misses += 1
+
+        mac = new(new(token, scope.encode(), sha256).digest(), digestmod=sha256)
+        with self._lock:
+            if key not in self._macs:
+                self._macs[key] = mac
+                self._refs.setdefault(ref, set()).add(key)
+                while len(self._macs) > self.size:
+                    self._forget(self._macs.popitem(last=False)[0])
+                    self.evictions += 1
+        return mac.copy()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._macs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+KEYS = KeyCache(settings.FLUME_SIGNER_KEY_CACHE_SIZE)
+"""
+The derived key cache of this worker process.
+"""
+
+
 class Signer:
     def signed_headers_for(
         self,
@@ -19,16 +104,50 @@ class Signer:
         """
         Returns the signed headers for the given instance and body.
         """
-        service = instance.service
-        kid, token_bytes = get_active_kid_and_token(service)
+        return self._signed_headers(
+            instance.service,
+            "push:" + str(instance.instance_id),
+            method,
+            path_with_query,
+            body,
+        )
 
-        ts = int(time.time())
-        nonce = urandom(16).hex()
-        key = self.derive_instance_key(token_bytes, str(instance.instance_id))
-        msg = (f"{method.upper()}\n{path_with_query}\n{ts}\n{nonce}\n").encode() + (
-            body or b""
+    def signed_headers_for_subscription(
+        self,
+        subscription: Subscription,
+        method: str,
+        path_with_query: str,
+        body: bytes = b"",
+    ) -> Mapping[str, str]:
+        """
+        Returns the signed headers of a webhook delivery: the key is derived
+        from the subscriber token and the subscription id.
+        """
+        return self._signed_headers(
+            subscription.subscriber,
+            "sub:" + str(subscription.id),
+            method,
+            path_with_query,
+            body,
         )
-        sig = new(key, msg, sha256).hexdigest()
+
+    def _signed_headers(
+        self,
+        service: Service,
+        scope: str,
+        method: str,
+        path_with_query: str,
+        body: bytes,
+    ) -> Mapping[str, str]:
+        kid, token_bytes = self.get_active_kid_and_token(service)
+
+        ts = int(time())
+        nonce = urandom(16).hex()
+        mac = KEYS.get(service.bootstrap_secret_ref, kid, token_bytes, scope)
+        mac.update(f"{method.upper()}\n{path_with_query}\n{ts}\n{nonce}\n".encode())
+        if body:
+            mac.update(body)
+        sig = mac.hexdigest()
 
         return {
             "X-Timestamp": str(ts),
@@ -40,23 +159,41 @@ class Signer:
             "Content-Type": "application/json",
         }
 
+    def has_token(self, service: Service) -> bool:
+        """
+        Whether get_active_kid_and_token returns without fetching the secret.
+        """
+        return SecretsService._get_cache_for_service(service).cached()
+
     def get_active_kid_and_token(self, service: Service) -> Tuple[str, bytes]:
         """
         Returns the active kid and token for the given service.
         """
         data = SecretsService._get_cache_for_service(service).get()
-        kid = data["kid"]
-        token = data["token"]
-        token_bytes: bytes = b""
-        if token.startswith("base64:"):
-            token_bytes = b64decode(token.split(":", 1)[1])
-        else:
-            token_bytes = token.encode()
-        return kid, token_bytes
+        return data["kid"], _decode_token(data["token"])
+
+    def get_tokens(self, service: Service) -> Dict[str, bytes]:
+        """
+        Returns the tokens accepted from the given service by kid: the
+        active one and, while a rotation is in progress, the previous one
+        ("previous": {"kid": ..., "token": ...} in the secret).
+        """
+        data = SecretsService._get_cache_for_service(service).get()
+        tokens = {data["kid"]: _decode_token(data["token"])}
+        previous = data.get("previous")
+        if previous:
+            tokens.setdefault(previous["kid"], _decode_token(previous["token"]))
+        return tokens
 
     def derive_instance_key(self, token_bytes: bytes, instance_id: str) -> bytes:
         """
         Returns the instance key for the given token and instance id.
         """
         # chiave per-istanza: HMAC(token, "push:"+instance_id)
-        return new(token_bytes, ("push:" + instance_id).encode(), sha256).digest()
+        return self.derive_key(token_bytes, "push:" + instance_id)
+
+    def derive_key(self, token_bytes: bytes, scope: str) -> bytes:
+        """
+        Returns the key derived from the token for the given scope.
+        """
+        return new(token_bytes, scope.encode(), sha256).digest()
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Mapping
+
+from django.conf import settings
+from jsonschema import Validator
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+
+class ValidatorCache:
+    """
+    Process-wide LRU of prepared JSON Schema validators keyed by
+    EventDefinition.version_hash: the schema is checked and its validator
+    class resolved once per version per worker, instead of on every call
+    as jsonschema.validate() does.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = Lock()
+        self._validators: "OrderedDict[str, Validator]" = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, version_hash: str, schema: Mapping[str, Any]) -> Validator:
+        with self._lock:
+            validator = self._validators.get(version_hash)
+            if validator is not None:
+                self._validators.move_to_end(version_hash)
+                self.hits += 1
+                return validator
+            self.misses += 1
+
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        validator = cls(schema)
+        with self._lock:
+            self._validators[version_hash] = validator
+            while len(self._validators) > self.size:
+                self._validators.popitem(last=False)
+                self.evictions += 1
+        return validator
+
+    def validate(
+        self, version_hash: str, schema: Mapping[str, Any], payload: Any
+    ) -> str | None:
+        """
+        Returns why the payload does not match the schema, if it does not.
+        """
+        validator = self.get(version_hash, schema)
+        if validator.is_valid(payload):
+            return None
+        error = best_match(validator.iter_errors(payload))
+        return error.message if error is not None else "Invalid payload"
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._validators),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+VALIDATORS = ValidatorCache(settings.FLUME_VALIDATOR_CACHE_SIZE)
+"""
+The validator cache of this worker process.
+"""
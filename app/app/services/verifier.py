@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from hmac import compare_digest
+from re import compile
+from threading import Lock
+from time import monotonic, time
+from typing import Dict, Iterable, Mapping, Tuple
+from uuid import UUID
+
+from django.conf import settings
+from ninja.errors import HttpError
+
+from app.models.services import ServiceInstance
+from app.services.nonces import NONCES
+from app.services.signer import KEYS, Signer
+
+_NONCE = compile(r"[0-9A-Za-z_-]{16,64}")
+_SIGNATURE = compile(r"sha256=[0-9a-f]{64}")
+
+
+class SignatureVerifier:
+    """
+    Verifies requests signed by an instance the way Signer signs pushes to
+    it: HMAC-SHA256 with the key derived from its service token and
+    "push:<instance id>", over "METHOD\\nPATH?QUERY\\nTS\\nNONCE\\n" + body.
+
+    Checks run cheapest first, so a malformed or stale request is turned
+    down before any lookup: headers, timestamp window, the instance (cached
+    for `ttl` seconds), the signature with the cached derived key of the
+    active or the previous kid, and last the nonce, so forged requests
+    cannot burn nonces.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.signer = Signer()
+        self._lock = Lock()
+        self._instances: "OrderedDict[str, Tuple[ServiceInstance, float]]" = (
+            OrderedDict()
+        )
+        self.verified = self.rejected = 0
+
+    def instances(self, instance_ids: Iterable[str]) -> Dict[str, ServiceInstance]:
+        """
+        Returns the registered instances among `instance_ids`, with their
+        service, loading the ones not cached with one query.
+        """
+        found: Dict[str, ServiceInstance] = {}
+        missing = []
+        now = monotonic()
+        with self._lock:
+            for instance_id in instance_ids:
+                cached = self._instances.get(instance_id)
+                if cached is not None and now < cached[1]:
+                    self._instances.move_to_end(instance_id)
+                    found[instance_id] = cached[0]
+                else:
+                    missing.append(instance_id)
+        if not missing:
+            return found
+        loaded = ServiceInstance.objects.select_related("service").filter(
+            instance_id__in=missing
+        )
+        with self._lock:
+            for instance in loaded:
+                instance_id = str(instance.instance_id)
+                found[instance_id] = instance
+                self._instances[instance_id] = (instance, now + self.ttl)
+                self._instances.move_to_end(instance_id)
+            while len(self._instances) > self.size:
+                self._instances.popitem(last=False)
+        return found
+
+    def _check(
+        self, headers: Mapping[str, str], method: str, path_with_query: str, body: bytes
+    ) -> ServiceInstance:
+        instance_id = headers.get("X-Instance-Id", "")
+        kid = headers.get("X-Key-Id", "")
+        nonce = headers.get("X-Nonce", "")
+        signature = headers.get("X-Signature", "")
+        try:
+            instance_id = str(UUID(instance_id))
+            ts = int(headers.get("X-Timestamp", ""))
+        except ValueError:
+            raise HttpError(401, "Missing or malformed signature headers") from None
+        if (
+            not kid
+            or not _NONCE.fullmatch(nonce)
+            or not _SIGNATURE.fullmatch(signature)
+        ):
+            raise HttpError(401, "Missing or malformed signature headers")
+        if abs(time() - ts) > NONCES.window:
+            raise HttpError(401, "Request timestamp outside the window")
+
+        instance = self.instances([instance_id]).get(instance_id)
+        if instance is None:
+            raise HttpError(401, "Unknown instance")
+        service = instance.service
+        try:
+            tokens = self.signer.get_tokens(service)
+        except Exception:
+            raise HttpError(503, "Secret store unavailable") from None
+        token = tokens.get(kid)
+        if token is None:
+            raise HttpError(401, "Unknown key id")
+        mac = KEYS.get(service.bootstrap_secret_ref, kid, token, "push:" + instance_id)
+        mac.update(f"{method.upper()}\n{path_with_query}\n{ts}\n{nonce}\n".encode())
+        if body:
+            mac.update(body)
+        if not compare_digest(mac.hexdigest(), signature[7:]):
+            raise HttpError(401, "Invalid signature")
+        if not NONCES.claim(instance_id, nonce, ts):
+            raise HttpError(401, "Nonce already used")
+        return instance
+
+    def verify(
+        self, headers: Mapping[str, str], method: str, path_with_query: str, body: bytes
+    ) -> ServiceInstance:
+        """
+        Raises HttpError(401) unless the request is signed by the instance
+        named in X-Instance-Id, HttpError(503) when its secret cannot be
+        fetched.
+
+        Returns:
+            ServiceInstance: The signing instance, with its service.
+        """
+        try:
+            instance = self._check(headers, method, path_with_query, body)
+        except HttpError:
+            self.rejected += 1
+            raise
+        self.verified += 1
+        return instance
+
+    def check_heartbeats(
+        self,
+        signer: ServiceInstance,
+        instance_ids: Iterable[str],
+        node_id: str | None,
+    ) -> None:
+        """
+        Raises HttpError(403) unless the signing instance may beat for
+        them: instances of its own service (a sidecar beats for its
+        replicas), and its own node only. A node beat without instance ids
+        must be scoped to the service of the signer by the caller.
+        """
+        if node_id is not None and node_id != signer.node_id:
+            raise HttpError(403, "node_id is not the node of the signing instance")
+        for instance in self.instances(instance_ids).values():
+            if instance.service_id != signer.service_id:
+                raise HttpError(
+                    403, "Instances of other services cannot beat for each other"
+                )
+
+
+VERIFIER = SignatureVerifier(
+    size=settings.FLUME_SIGNER_KEY_CACHE_SIZE,
+    ttl=settings.FLUME_VERIFY_INSTANCE_TTL_SEC,
+)
+"""
+The request signature verifier of this process.
+"""
@@ -17,8 +17,55 @@ env = Env(
     JWT_ALGORITHM=(str, "HS256"),
     JWT_EXPIRATION_TIME=(int, 3600),
     JWT_REFRESH_EXPIRATION_TIME=(int, 86400),
+    # AWS
+    AWS_REGION=(str, "eu-west-1"),
     # FLUME
     FLUME_SEED=(str, ""),
+    FLUME_LEASE_FLUSH_INTERVAL_SEC=(float, 2.0),
+    FLUME_LEASE_MISSES=(int, 3),
+    FLUME_REAPER_IN_PROCESS=(bool, False),
+    FLUME_REAPER_EVERY_SEC=(float, 5.0),
+    FLUME_WATCH_POLL_SEC=(float, 0.5),
+    FLUME_WATCH_MAX_TIMEOUT_SEC=(float, 60.0),
+    FLUME_SSE_KEEPALIVE_SEC=(float, 15.0),
+    FLUME_SSE_MAX_STREAM_SEC=(float, 300.0),
+    FLUME_SNAPSHOT_MAX_AGE_SEC=(float, 1.0),
+    FLUME_REGISTRY_SEQUENCE=(bool, False),
+    FLUME_ROUTING_MAX_AGE_SEC=(float, 1.0),
+    FLUME_VALIDATOR_CACHE_SIZE=(int, 1024),
+    FLUME_SECRETS_TTL_SEC=(int, 300),
+    FLUME_SECRETS_PROVIDER=(str, "aws"),
+    FLUME_SECRETS_FILE=(str, "envs/secrets.json"),
+    FLUME_SECRETS_PREFETCH=(bool, True),
+    FLUME_SIGNER_KEY_CACHE_SIZE=(int, 10000),
+    FLUME_VERIFY_SIGNATURES=(bool, False),
+    FLUME_VERIFY_INSTANCE_TTL_SEC=(float, 5.0),
+    FLUME_NONCE_STORE=(str, "memory"),
+    FLUME_NONCE_WINDOW_SEC=(float, 300.0),
+    FLUME_NONCE_BUCKET_SEC=(float, 30.0),
+    FLUME_NONCE_BLOOM_BITS=(int, 0),
+    FLUME_DELIVERY_MAX_IN_FLIGHT=(int, 256),
+    FLUME_DELIVERY_MAX_PER_HOST=(int, 8),
+    FLUME_DELIVERY_TIMEOUT_SEC=(float, 10.0),
+    FLUME_DELIVERY_LANES=(int, 16),
+    FLUME_DELIVERY_BATCH=(int, 500),
+    FLUME_DELIVERY_POLL_SEC=(float, 0.5),
+    FLUME_RETRY_BASE_SEC=(float, 1.0),
+    FLUME_RETRY_MAX_DELAY_SEC=(float, 3600.0),
+    FLUME_RETRY_MAX_ATTEMPTS=(int, 12),
+    FLUME_RETRY_HORIZON_SEC=(float, 60.0),
+    FLUME_RETRY_MAX_IN_FLIGHT=(int, 64),
+    FLUME_RETRY_EVERY_SEC=(float, 1.0),
+    FLUME_EVENT_STORE=(str, "db"),
+    FLUME_EVENT_LOG_DIR=(str, "var/eventlog"),
+    FLUME_EVENT_LOG_SEGMENT_BYTES=(int, 64 * 1024 * 1024),
+    FLUME_EVENT_LOG_INDEX_BYTES=(int, 4096),
+    FLUME_EVENT_LOG_FSYNC=(bool, False),
+    FLUME_COMPACT_BATCH=(int, 1000),
+    FLUME_COMPACT_PAUSE_SEC=(float, 0.05),
+    FLUME_COMPACT_EVERY_SEC=(float, 60.0),
+    FLUME_REPLAY_PAGE=(int, 1000),
+    FLUME_REPLAY_PER_MINUTE=(int, 6),
 )
 
 # Carica .env (puoi cambiare percorso con ENV_PATH)
@@ -108,6 +155,101 @@ JWT_ALGORITHM = env("JWT_ALGORITHM")
 JWT_EXPIRATION_TIME = env.int("JWT_EXPIRATION_TIME")
 JWT_REFRESH_EXPIRATION_TIME = env.int("JWT_REFRESH_EXPIRATION_TIME")
 
+# ── AWS ───────────────────────────────────────────────────────────────────────
+AWS_REGION = env("AWS_REGION")
+
+# ── Flume ─────────────────────────────────────────────────────────────────────
+# Heartbeats are absorbed in memory and written behind every N seconds
+# (0 = write-through). Keep it well below the shortest heartbeat interval.
+FLUME_LEASE_FLUSH_INTERVAL_SEC = env.float("FLUME_LEASE_FLUSH_INTERVAL_SEC")
+# An instance is DOWN after this many missed heartbeat intervals.
+FLUME_LEASE_MISSES = env.int("FLUME_LEASE_MISSES")
+# Run the lease reaper inside the web process (one replica only), otherwise
+# use `manage.py reap_leases --loop`.
+FLUME_REAPER_IN_PROCESS = env.bool("FLUME_REAPER_IN_PROCESS")
+FLUME_REAPER_EVERY_SEC = env.float("FLUME_REAPER_EVERY_SEC")
+# Long-poll watchers: one registry poll per worker every N seconds.
+FLUME_WATCH_POLL_SEC = env.float("FLUME_WATCH_POLL_SEC")
+FLUME_WATCH_MAX_TIMEOUT_SEC = env.float("FLUME_WATCH_MAX_TIMEOUT_SEC")
+FLUME_SSE_KEEPALIVE_SEC = env.float("FLUME_SSE_KEEPALIVE_SEC")
+# Event streams are closed after N seconds (the clients resume with
+# Last-Event-ID): a disconnected client is not noticed while streaming.
+FLUME_SSE_MAX_STREAM_SEC = env.float("FLUME_SSE_MAX_STREAM_SEC")
+# The registry snapshot may lag the registry version by up to N seconds.
+FLUME_SNAPSHOT_MAX_AGE_SEC = env.float("FLUME_SNAPSHOT_MAX_AGE_SEC")
+# PostgreSQL only: allocate registry versions from a sequence instead of
+# locking the RegistryState row; the sequence is created by `migrate`
+# (see RegistryState._allocate_from_sequence).
+FLUME_REGISTRY_SEQUENCE = env.bool("FLUME_REGISTRY_SEQUENCE")
+# Subscription indexes follow the change log with up to N seconds of delay.
+FLUME_ROUTING_MAX_AGE_SEC = env.float("FLUME_ROUTING_MAX_AGE_SEC")
+# Compiled payload validators kept per worker (one per schema version).
+FLUME_VALIDATOR_CACHE_SIZE = env.int("FLUME_VALIDATOR_CACHE_SIZE")
+# Service bootstrap secrets are read again after N seconds.
+FLUME_SECRETS_TTL_SEC = env.int("FLUME_SECRETS_TTL_SEC")
+# Where service secrets come from: "aws" (Secrets Manager), "file" (a JSON
+# object of secrets by ref, relative to BASE_DIR) or "env" (JSON in
+# FLUME_SECRET_<REF>). With PREFETCH, all of them are loaded on the first
+# request of a worker.
+FLUME_SECRETS_PROVIDER = env("FLUME_SECRETS_PROVIDER")
+FLUME_SECRETS_FILE = BASE_DIR / env("FLUME_SECRETS_FILE")
+FLUME_SECRETS_PREFETCH = env.bool("FLUME_SECRETS_PREFETCH")
+# Derived signing keys kept per worker (one per instance / subscription).
+FLUME_SIGNER_KEY_CACHE_SIZE = env.int("FLUME_SIGNER_KEY_CACHE_SIZE")
+# Heartbeats must be signed by the beating instance (X-Instance-Id plus the
+# Signer headers, with its push key).
+FLUME_VERIFY_SIGNATURES = env.bool("FLUME_VERIFY_SIGNATURES")
+# Signing instances are looked up again after N seconds: a deregistered
+# instance can sign that long.
+FLUME_VERIFY_INSTANCE_TTL_SEC = env.float("FLUME_VERIFY_INSTANCE_TTL_SEC")
+# Signed requests are accepted WINDOW seconds either side of their
+# X-Timestamp; their nonces are remembered that long, per BUCKET seconds,
+# in this worker ("memory") or in NonceSeen rows shared by all ("db").
+# BLOOM_BITS > 0 keeps a Bloom filter of that size per bucket instead of
+# the nonces (bounded memory, rare false replays).
+FLUME_NONCE_STORE = env("FLUME_NONCE_STORE")
+FLUME_NONCE_WINDOW_SEC = env.float("FLUME_NONCE_WINDOW_SEC")
+FLUME_NONCE_BUCKET_SEC = env.float("FLUME_NONCE_BUCKET_SEC")
+FLUME_NONCE_BLOOM_BITS = env.int("FLUME_NONCE_BLOOM_BITS")
+# Webhook deliveries in flight per worker, overall and per subscriber origin.
+FLUME_DELIVERY_MAX_IN_FLIGHT = env.int("FLUME_DELIVERY_MAX_IN_FLIGHT")
+FLUME_DELIVERY_MAX_PER_HOST = env.int("FLUME_DELIVERY_MAX_PER_HOST")
+FLUME_DELIVERY_TIMEOUT_SEC = env.float("FLUME_DELIVERY_TIMEOUT_SEC")
+# Serial delivery lanes per worker: one ordering key always uses one lane.
+FLUME_DELIVERY_LANES = env.int("FLUME_DELIVERY_LANES")
+# The deliver_events engine reads up to BATCH new events per definition,
+# polling the event store every POLL seconds while idle.
+FLUME_DELIVERY_BATCH = env.int("FLUME_DELIVERY_BATCH")
+FLUME_DELIVERY_POLL_SEC = env.float("FLUME_DELIVERY_POLL_SEC")
+# Failed deliveries are retried after ~BASE * 2^(attempt - 1) seconds (with
+# jitter, at most MAX_DELAY), then sent to the subscription dead letter.
+# MAX_ATTEMPTS applies when the dead letter does not set max_attempts.
+FLUME_RETRY_BASE_SEC = env.float("FLUME_RETRY_BASE_SEC")
+FLUME_RETRY_MAX_DELAY_SEC = env.float("FLUME_RETRY_MAX_DELAY_SEC")
+FLUME_RETRY_MAX_ATTEMPTS = env.int("FLUME_RETRY_MAX_ATTEMPTS")
+# Retries due within N seconds are kept in memory by the scheduler.
+FLUME_RETRY_HORIZON_SEC = env.float("FLUME_RETRY_HORIZON_SEC")
+FLUME_RETRY_MAX_IN_FLIGHT = env.int("FLUME_RETRY_MAX_IN_FLIGHT")
+FLUME_RETRY_EVERY_SEC = env.float("FLUME_RETRY_EVERY_SEC")
+# Published events are EventRecord rows ("db") or appended to segment files
+# per event definition under FLUME_EVENT_LOG_DIR ("log", relative to
+# BASE_DIR), indexed every INDEX_BYTES and rolled every SEGMENT_BYTES.
+# Without FSYNC, appends survive a process crash but not a host crash.
+FLUME_EVENT_STORE = env("FLUME_EVENT_STORE")
+FLUME_EVENT_LOG_DIR = BASE_DIR / env("FLUME_EVENT_LOG_DIR")
+FLUME_EVENT_LOG_SEGMENT_BYTES = env.int("FLUME_EVENT_LOG_SEGMENT_BYTES")
+FLUME_EVENT_LOG_INDEX_BYTES = env.int("FLUME_EVENT_LOG_INDEX_BYTES")
+FLUME_EVENT_LOG_FSYNC = env.bool("FLUME_EVENT_LOG_FSYNC")
+# Retention compaction (`manage.py compact_events --loop`) deletes BATCH rows
+# per statement and sleeps PAUSE seconds between two statements.
+FLUME_COMPACT_BATCH = env.int("FLUME_COMPACT_BATCH")
+FLUME_COMPACT_PAUSE_SEC = env.float("FLUME_COMPACT_PAUSE_SEC")
+FLUME_COMPACT_EVERY_SEC = env.float("FLUME_COMPACT_EVERY_SEC")
+# Subscription replays read and stream N stored events at a time.
+FLUME_REPLAY_PAGE = env.int("FLUME_REPLAY_PAGE")
+# Replays a subscription may start per minute and worker, then 429.
+FLUME_REPLAY_PER_MINUTE = env.int("FLUME_REPLAY_PER_MINUTE")
+
 # ── Security flags ─────────────────────────────────────────────────────────────
 if not DEBUG:
     SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
 
 application = get_wsgi_application()
+
+from app.services.reaper import start_in_process_reaper  # noqa: E402
+
+start_in_process_reaper()
@@ -0,0 +1,150 @@
+from asyncio import run, sleep
+from random import Random
+from typing import Dict, List, Tuple
+from uuid import uuid4
+
+from app.models.events import Subscription
+from app.services.delivery import Delivery, DeliveryResult
+from app.services.lanes import DeliveryLanes
+from app.services.retries import RetryScheduler
+
+KEYS = 20
+
+
+class FakeDispatcher:
+    """
+    Answers after a random delay, raising for the offsets in `raise_at`,
+    and records the deliveries in the order they completed.
+    """
+
+    def __init__(self, raise_at: frozenset = frozenset()):
+        self.raise_at = raise_at
+        self.rng = Random(1)
+        self.received: List[Delivery] = []
+        self.in_flight = self.max_in_flight = 0
+
+    async def deliver(self, delivery: Delivery, url=None) -> DeliveryResult:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await sleep(self.rng.random() / 500)
+        finally:
+            self.in_flight -= 1
+        if delivery.offset in self.raise_at:
+            raise RuntimeError("boom")
+        self.received.append(delivery)
+        return DeliveryResult(delivery, 204, None, 0.0)
+
+
+class FakeRetries:
+    def __init__(self):
+        self.failed_offsets: List[int] = []
+
+    async def load(self) -> None:
+        pass
+
+    def is_blocked(self, delivery: Delivery) -> bool:
+        return False
+
+    def failed(self, result: DeliveryResult) -> None:
+        if not result.ok:
+            self.failed_offsets.append(result.delivery.offset)
+
+
+def _deliveries(size: int) -> List[Delivery]:
+    subscriptions = [Subscription(id=uuid4()) for _ in range(3)]
+    rng = Random(7)
+    return [
+        Delivery(
+            subscriptions[rng.randrange(len(subscriptions))],
+            offset,
+            f"k{rng.randrange(KEYS)}",
+            b"{}",
+        )
+        for offset in range(size)
+    ]
+
+
+def _by_key(deliveries: List[Delivery]) -> Dict[Tuple, List[int]]:
+    keys: Dict[Tuple, List[int]] = {}
+    for d in deliveries:
+        keys.setdefault((d.subscription.id, d.ordering_key), []).append(d.offset)
+    return keys
+
+
+async def _deliver(dispatcher, deliveries: List[Delivery], retries=None) -> None:
+    async with DeliveryLanes(dispatcher, retries, lanes=8) as lanes:
+        for delivery in deliveries:
+            await lanes.put(delivery)
+        await lanes.join()
+
+
+def test_keys_delivered_in_order_under_concurrency():
+    deliveries = _deliveries(1000)
+    dispatcher = FakeDispatcher()
+    run(_deliver(dispatcher, deliveries))
+
+    assert dispatcher.max_in_flight > 1
+    assert _by_key(dispatcher.received) == _by_key(deliveries)
+
+
+def test_lane_survives_raising_delivery():
+    deliveries = _deliveries(500)
+    raise_at = frozenset(range(0, 500, 37))
+    dispatcher = FakeDispatcher(raise_at)
+    retries = FakeRetries()
+    run(_deliver(dispatcher, deliveries, retries))
+
+    assert sorted(retries.failed_offsets) == sorted(raise_at)
+    delivered = [d for d in deliveries if d.offset not in raise_at]
+    assert _by_key(dispatcher.received) == _by_key(delivered)
+
+
+def _scheduler(dispatcher) -> RetryScheduler:
+    """
+    A real RetryScheduler: blocks the keys of failed deliveries and parks
+    the later ones in memory, nothing is stored before its tick.
+    """
+    retries = RetryScheduler(dispatcher, seed=1)
+    retries._blocked_loaded = True
+    return retries
+
+
+def test_failed_key_waits_for_its_retry():
+    deliveries = _deliveries(500)
+    raise_at = frozenset(range(5, 500, 41))
+    dispatcher = FakeDispatcher(raise_at)
+    retries = _scheduler(dispatcher)
+    run(_deliver(dispatcher, deliveries, retries))
+
+    held = _by_key([delivery for delivery, _ in retries._failed])
+    failed = {delivery.offset for delivery, error in retries._failed if error}
+    # a failure behind an earlier one of its key is parked, never attempted
+    assert failed <= raise_at
+    received = _by_key(dispatcher.received)
+    for key, offsets in _by_key(deliveries).items():
+        blocked_at = next((o for o in offsets if o in raise_at), None)
+        if blocked_at is None:
+            assert received[key] == offsets
+            continue
+        # nothing overtook the failure: the rest of the key is held, in order
+        i = offsets.index(blocked_at)
+        assert received.get(key, []) == offsets[:i]
+        assert held[key] == offsets[i:]
+        assert retries.is_blocked(deliveries[blocked_at])
+
+    # the key stays blocked for new deliveries until its retries resolve
+    late = [d._replace(offset=d.offset + 1000) for d in deliveries[:50]]
+    dispatcher.raise_at = frozenset()
+    before = len(dispatcher.received)
+    run(_deliver(dispatcher, late, retries))
+    for delivery in dispatcher.received[before:]:
+        assert not retries.is_blocked(delivery)
+
+    # resolving every held delivery, oldest first, unblocks the keys
+    for delivery, _ in list(retries._failed):
+        retries._resolved([(delivery.subscription.id, delivery.ordering_key)])
+    assert not retries._blocked
+    dispatcher.received.clear()
+    run(_deliver(dispatcher, late, retries))
+    assert _by_key(dispatcher.received) == _by_key(late)
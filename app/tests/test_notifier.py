@@ -0,0 +1,43 @@
+from asyncio import gather, run, sleep
+
+from app.models.register import RegistryState
+from app.services.notifier import RegistryNotifier
+
+
+def test_concurrent_polls_share_one_read(monkeypatch):
+    reads = []
+
+    def current() -> int:
+        reads.append(1)
+        return 42
+
+    monkeypatch.setattr(RegistryState, "current", staticmethod(current))
+    notifier = RegistryNotifier(poll_interval=60.0)
+
+    async def watchers():
+        first = await gather(*(notifier.current() for _ in range(50)))
+        await sleep(0)
+        return first + [await notifier.current()]
+
+    assert run(watchers()) == [42] * 51
+    assert len(reads) == 1
+
+
+def test_failed_poll_raises_to_every_caller(monkeypatch):
+    reads = []
+
+    def current() -> int:
+        reads.append(1)
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(RegistryState, "current", staticmethod(current))
+    notifier = RegistryNotifier(poll_interval=60.0)
+
+    async def watchers():
+        return await gather(
+            *(notifier.current() for _ in range(10)), return_exceptions=True
+        )
+
+    results = run(watchers())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(reads) == 1
@@ -0,0 +1,49 @@
+from django.test import RequestFactory
+
+from app.middlewares.default.pipeline import compile_pipeline, pipeline
+
+
+def _tagging(tag: str):
+    def pipe(request, data, next):
+        data["seen"].append(tag)
+        return next()
+
+    return pipe
+
+
+def _stop(request, data, next):
+    return "stopped"
+
+
+def _endpoint(request, data):
+    return data
+
+
+def _without_data(request):
+    return request.method
+
+
+def test_pipes_run_in_order_then_the_endpoint():
+    first, second = _tagging("first"), _tagging("second")
+    data = {"seen": []}
+    compiled = compile_pipeline(first, second, endpoint=_endpoint)
+
+    assert compiled(RequestFactory().get("/"), data) is data
+    assert data["seen"] == ["first", "second"]
+
+
+def test_pipe_can_answer_without_calling_next():
+    data = {"seen": []}
+    compiled = compile_pipeline(_stop, _tagging("after"), endpoint=_endpoint)
+
+    assert compiled(RequestFactory().get("/"), data) == "stopped"
+    assert data["seen"] == []
+
+
+def test_endpoint_without_data_and_cached_compilation():
+    request = RequestFactory().post("/")
+    compiled = compile_pipeline(endpoint=_without_data)
+
+    assert compiled(request, {"ignored": True}) == "POST"
+    assert compile_pipeline(endpoint=_without_data) is compiled
+    assert pipeline(request, endpoint=_without_data) == "POST"
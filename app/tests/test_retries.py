@@ -0,0 +1,89 @@
+from asyncio import run
+from types import SimpleNamespace
+
+import pytest
+from django.utils import timezone
+
+from app.services.retries import RetryScheduler
+
+
+class RaisingDispatcher:
+    def __init__(self):
+        self.errors = 0
+
+    async def deliver(self, delivery, url=None):
+        raise AssertionError("not attempted in these tests")
+
+
+def _scheduler(monkeypatch, loaded, attempt=None, settle=None):
+    scheduler = RetryScheduler(RaisingDispatcher(), base=30.0, seed=1)
+    scheduler._blocked_loaded = True
+    monkeypatch.setattr(scheduler, "_refill", lambda now: None)
+    monkeypatch.setattr(
+        scheduler, "_load", lambda ids: [(r, None) for r in loaded if r.id in ids]
+    )
+    monkeypatch.setattr(scheduler, "_settle", settle or (lambda outcomes, now: []))
+    if attempt is not None:
+        monkeypatch.setattr(scheduler, "_attempt", attempt)
+    return scheduler
+
+
+def test_retries_gone_from_the_store_are_dropped(monkeypatch):
+    # 1 and 2 were deleted (or are no longer pending): _load skips them
+    scheduler = _scheduler(monkeypatch, [SimpleNamespace(id=3)])
+
+    async def attempt(retry, event):
+        return retry, None, False
+
+    monkeypatch.setattr(scheduler, "_attempt", attempt)
+    now = timezone.now().timestamp()
+    for retry_id in (1, 2, 3):
+        scheduler._heap.push(now - 1, retry_id)
+
+    assert run(scheduler.tick()) == 1
+    assert len(scheduler._heap) == 0
+
+
+def test_raising_attempts_are_retried_later(monkeypatch):
+    loaded = [SimpleNamespace(id=1), SimpleNamespace(id=2)]
+
+    async def attempt(retry, event):
+        if retry.id == 2:
+            raise RuntimeError("boom")
+        return retry, None, False
+
+    settled = []
+    scheduler = _scheduler(
+        monkeypatch,
+        loaded,
+        attempt,
+        lambda outcomes, now: settled.extend(r.id for r, _, _ in outcomes) or [],
+    )
+    now = timezone.now().timestamp()
+    scheduler._heap.push(now - 1, 1)
+    scheduler._heap.push(now - 1, 2)
+
+    run(scheduler.tick())
+    assert settled == [1]
+    assert 2 in scheduler._heap and 1 not in scheduler._heap
+    # not due again before `base` seconds: run_forever does not spin
+    assert scheduler._heap.next_due() >= now + 29
+
+
+def test_failed_settle_puts_every_retry_back(monkeypatch):
+    def settle(outcomes, now):
+        raise RuntimeError("db down")
+
+    loaded = [SimpleNamespace(id=1)]
+
+    async def attempt(retry, event):
+        return retry, None, False
+
+    scheduler = _scheduler(monkeypatch, loaded, attempt, settle)
+    now = timezone.now().timestamp()
+    scheduler._heap.push(now - 1, 1)
+    scheduler._heap.push(now - 1, 7)  # not loaded, but the tick failed
+
+    with pytest.raises(RuntimeError):
+        run(scheduler.tick())
+    assert 1 in scheduler._heap and 7 in scheduler._heap
@@ -0,0 +1,68 @@
+from random import Random
+from uuid import uuid4
+
+import pytest
+
+from app.services.routing import SubscriptionIndex, filters_match
+
+COUNTRIES = ["IT", "DE", "FR", "ES"]
+
+
+def _filters(rng: Random) -> dict:
+    filters: dict = {}
+    if rng.random() < 0.8:
+        filters["c"] = rng.sample(COUNTRIES, rng.randint(0, 2))
+    if rng.random() < 0.5:
+        filters["tier"] = rng.choice(["free", "pro", True, 1])
+    if rng.random() < 0.2:
+        filters["tags"] = rng.choice(["a", ["a", "b"]])
+    return filters
+
+
+def test_index_matches_like_the_filters():
+    rng = Random(3)
+    subscriptions = {uuid4(): _filters(rng) for _ in range(300)}
+    index = SubscriptionIndex()
+    for subscription_id, filters in subscriptions.items():
+        index.add(subscription_id, filters)
+    # updates and removals keep the index in step
+    for subscription_id in rng.sample(sorted(subscriptions), 100):
+        if rng.random() < 0.5:
+            index.remove(subscription_id)
+            del subscriptions[subscription_id]
+        else:
+            subscriptions[subscription_id] = _filters(rng)
+            index.add(subscription_id, subscriptions[subscription_id])
+
+    for _ in range(200):
+        payload = {
+            "c": rng.choice(COUNTRIES),
+            "tier": rng.choice(["free", "pro", True, 1]),
+            "tags": rng.choice([["a"], ["b", "c"], "a"]),
+        }
+        expected = {s for s, f in subscriptions.items() if filters_match(f, payload)}
+        assert index.match(payload) == expected
+
+
+def test_empty_accepted_list_is_removable():
+    index = SubscriptionIndex()
+    nothing, italy = uuid4(), uuid4()
+    index.add(nothing, {"c": []})
+    index.add(italy, {"c": ["IT"]})
+    assert index.match({"c": "IT"}) == {italy}
+
+    index.remove(italy)
+    index.remove(nothing)
+    assert len(index) == 0
+    assert index.match({"c": "IT"}) == set()
+
+
+def test_filters_not_an_object_are_rejected():
+    index = SubscriptionIndex()
+    subscription_id = uuid4()
+    index.add(subscription_id, {"c": ["IT"]})
+    with pytest.raises(ValueError):
+        index.add(subscription_id, ["IT"])  # type: ignore[arg-type]
+
+    assert len(index) == 0
+    assert not filters_match(["IT"], {"c": "IT"})  # type: ignore[arg-type]
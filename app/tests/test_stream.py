@@ -0,0 +1,23 @@
+from asyncio import run, sleep, wait_for
+
+from app.endpoints.v1 import flume
+from app.services.notifier import NOTIFIER
+
+
+def test_registry_events_end_after_their_lifetime(monkeypatch):
+    timeouts = []
+
+    async def wait_past(version: int, timeout: float) -> int:
+        timeouts.append(timeout)
+        await sleep(timeout)
+        return version
+
+    monkeypatch.setattr(NOTIFIER, "wait_past", wait_past)
+
+    async def drain():
+        return [event async for event in flume.registry_events(7, 100, 0.2)]
+
+    events = run(wait_for(drain(), 5))
+
+    assert events and set(events) == {": keep-alive\n\n"}
+    assert max(timeouts) <= 0.2
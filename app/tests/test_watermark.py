@@ -0,0 +1,48 @@
+from app.models.register import _KEYS, committed_through
+
+ALLOCATING, ALLOCATED = 10, 11
+
+
+class FakeCursor:
+    """
+    Answers the pg_locks query with the given (classid, objid) rows, one
+    list per call.
+    """
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+
+    def execute(self, sql, params):
+        self.held = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+
+    def fetchall(self):
+        return self.held
+
+
+def test_watermark_is_below_the_lowest_value_in_flight():
+    held = [(ALLOCATED, 95), (ALLOCATED, 98)]
+    assert committed_through(FakeCursor(held), 100, ALLOCATING, ALLOCATED) == 94
+
+
+def test_values_above_the_allocated_ones_do_not_hold_it_back():
+    # locked before taking its values, which will be above 100
+    held = [(ALLOCATED, 101)]
+    assert committed_through(FakeCursor(held), 100, ALLOCATING, ALLOCATED) == 100
+    assert committed_through(FakeCursor([]), 100, ALLOCATING, ALLOCATED) == 100
+
+
+def test_lock_keys_wrap_around():
+    allocated_to = _KEYS + 5  # its lock key is 5
+    held = [(ALLOCATED, _KEYS - 2)]
+    assert (
+        committed_through(FakeCursor(held), allocated_to, ALLOCATING, ALLOCATED)
+        == _KEYS - 3
+    )
+
+
+def test_none_while_values_are_being_taken():
+    taking = [(ALLOCATING, 0), (ALLOCATED, 99)]
+    assert committed_through(FakeCursor(taking), 100, ALLOCATING, ALLOCATED) is None
+    # retried: taken meanwhile
+    cursor = FakeCursor(taking, [(ALLOCATED, 99)])
+    assert committed_through(cursor, 100, ALLOCATING, ALLOCATED) == 98